@@ -2,8 +2,11 @@ import asyncio
 from fastapi import FastAPI
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
-from db import Base, engine
+from db import engine
+from migrations import run_migrations
 from infra import RateLimitMiddleware, purge_old_uploads_db
+from services.s3_uploader import S3_UPLOAD_SWEEP_SECONDS, uploader
+from services.storage import S3_ENABLED
 
 
 from controllers import (
@@ -11,10 +14,13 @@ from controllers import (
     prediction_uid_controller,
     label_controller,
     score_controller,
+    search_controller,
+    export_controller,
     image_controller,
     count_controller,
     delete_controller,
     stats_controller,
+    metrics_controller,
 )
 
 load_dotenv()
@@ -22,24 +28,39 @@ load_dotenv()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # create tables once at startup
-    from models import PredictionSession, DetectionObject, User  # noqa: F401
+    # create tables (and any indexes added since) once at startup
+    run_migrations(engine)
 
-    Base.metadata.create_all(bind=engine)
-
-    # kick off daily cleanup loop
+    # kick off daily cleanup loop (the purge itself runs on a worker thread)
     async def _cleanup_loop():
         while True:
             try:
-                purge_old_uploads_db(upload_root="uploads", max_age_days=90)
+                await asyncio.to_thread(
+                    purge_old_uploads_db, upload_root="uploads", max_age_days=90
+                )
             finally:
                 await asyncio.sleep(24 * 3600)
 
-    cleanup_task = asyncio.create_task(_cleanup_loop())
+    tasks = [asyncio.create_task(_cleanup_loop())]
+
+    # S3 mode: resume write-behind uploads left by a previous run, then keep
+    # retrying failed ones
+    if S3_ENABLED:
+
+        async def _upload_sweep_loop():
+            while True:
+                try:
+                    await asyncio.to_thread(uploader.sweep)
+                except Exception as e:
+                    print(f"Warning: S3 upload sweep failed — {e}")
+                await asyncio.sleep(S3_UPLOAD_SWEEP_SECONDS)
+
+        tasks.append(asyncio.create_task(_upload_sweep_loop()))
     try:
         yield
     finally:
-        cleanup_task.cancel()
+        for task in tasks:
+            task.cancel()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -58,10 +79,13 @@ app.include_router(predict_controller.router)
 app.include_router(prediction_uid_controller.router)
 app.include_router(label_controller.router)
 app.include_router(score_controller.router)
+app.include_router(search_controller.router)
+app.include_router(export_controller.router)
 app.include_router(image_controller.router)
 app.include_router(count_controller.router)
 app.include_router(delete_controller.router)
 app.include_router(stats_controller.router)
+app.include_router(metrics_controller.router)
 
 if __name__ == "__main__":  # pragma: no cover
     import uvicorn
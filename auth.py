@@ -3,6 +3,7 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from sqlalchemy.orm import Session
 from db import get_db
+from infra import credential_cache
 from models import User
 import secrets
 
@@ -12,6 +13,10 @@ security = HTTPBasic()
 def get_current_username(
     credentials: HTTPBasicCredentials = Depends(security), db: Session = Depends(get_db)
 ):
+    # fast path: this exact username/password pair was verified recently
+    if credential_cache.check(credentials.username, credentials.password):
+        return credentials.username
+
     user = db.query(User).filter_by(username=credentials.username).first()
     if user is None or not secrets.compare_digest(user.password, credentials.password):
         raise HTTPException(
@@ -19,4 +24,5 @@ def get_current_username(
             detail="Invalid credentials",
             headers={"WWW-Authenticate": "Basic"},
         )
+    credential_cache.add(user.username, credentials.password)
     return user.username
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from db import get_db
+from db import get_read_db
 from services.count_service import get_prediction_count_service
 from auth import get_current_username
 
@@ -10,6 +10,6 @@ router = APIRouter()
 
 @router.get("/predictions/count")
 def get_prediction_count(
-    username: str = Depends(get_current_username), db: Session = Depends(get_db)
+    username: str = Depends(get_current_username), db: Session = Depends(get_read_db)
 ):
     return get_prediction_count_service(username, db)
@@ -1,12 +1,23 @@
+from datetime import datetime
 from fastapi import APIRouter, Depends
+from pydantic import BaseModel
 from db import get_db
 from sqlalchemy.orm import Session
-from services.delete_service import delete_prediction_service
+from services.delete_service import (
+    bulk_delete_predictions_service,
+    delete_prediction_service,
+)
 from auth import get_current_username
 
 router = APIRouter()
 
 
+class BulkDeleteRequest(BaseModel):
+    uids: list[str] = []
+    older_than: datetime | None = None
+    label: str | None = None
+
+
 @router.delete("/prediction/{uid}")
 def delete_prediction(
     uid: str,
@@ -14,3 +25,14 @@ def delete_prediction(
     db: Session = Depends(get_db),
 ):
     return delete_prediction_service(uid, username, db)
+
+
+@router.post("/predictions/bulk-delete")
+def bulk_delete_predictions(
+    body: BulkDeleteRequest,
+    username: str = Depends(get_current_username),
+    db: Session = Depends(get_db),
+):
+    return bulk_delete_predictions_service(
+        username, db, uids=body.uids, older_than=body.older_than, label=body.label
+    )
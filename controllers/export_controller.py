@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from db import get_read_db
+from auth import get_current_username
+from services.export_service import export_predictions_service
+
+router = APIRouter()
+
+
+@router.get("/predictions/export")
+def export_predictions_route(
+    format: str | None = Query(
+        None, description="parquet (default), arrow or csv; csv without pyarrow"
+    ),
+    since: datetime | None = Query(None, description="Sessions at or after"),
+    until: datetime | None = Query(None, description="Sessions before"),
+    label: str | None = Query(None, description="Only detections of this label"),
+    username: str = Depends(get_current_username),
+    db: Session = Depends(get_read_db),
+):
+    return export_predictions_service(
+        username, format, since=since, until=until, label=label, bind=db.get_bind()
+    )
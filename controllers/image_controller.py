@@ -1,32 +1,44 @@
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.orm import Session
-from fastapi.responses import FileResponse
-from db import get_db
+from db import get_read_db
 from services.image_service import (
-    get_image_path_and_validate,
+    get_image_service,
     get_prediction_image_service,
 )
+from services.thumbnails import FORMAT_PATTERN, MAX_DIMENSION
 from auth import get_current_username
 
 router = APIRouter()
 
 
-@router.get("/image/{image_type}/{filename}")
+@router.api_route("/image/{image_type}/{filename}", methods=["GET", "HEAD"])
 def get_image_route(
     image_type: str,
     filename: str,
+    request: Request,
+    w: int | None = Query(None, ge=1, le=MAX_DIMENSION, description="Max width"),
+    h: int | None = Query(None, ge=1, le=MAX_DIMENSION, description="Max height"),
+    format: str | None = Query(None, pattern=FORMAT_PATTERN),
+    quality: int | None = Query(None, ge=1, le=100, description="JPEG/WebP"),
     username: str = Depends(get_current_username),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    path = get_image_path_and_validate(image_type, filename, username, db)
-    return FileResponse(path)
+    return get_image_service(
+        image_type, filename, username, request, db, w, h, format, quality
+    )
 
 
-@router.get("/prediction/{uid}/image")
+@router.api_route("/prediction/{uid}/image", methods=["GET", "HEAD"])
 def get_prediction_image(
     uid: str,
     request: Request,
+    w: int | None = Query(None, ge=1, le=MAX_DIMENSION, description="Max width"),
+    h: int | None = Query(None, ge=1, le=MAX_DIMENSION, description="Max height"),
+    format: str | None = Query(None, pattern=FORMAT_PATTERN),
+    quality: int | None = Query(None, ge=1, le=100, description="JPEG/WebP"),
     username: str = Depends(get_current_username),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    return get_prediction_image_service(uid, username, request, db)
+    return get_prediction_image_service(
+        uid, username, request, db, w, h, format, quality
+    )
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request, Response
 from sqlalchemy.orm import Session
-from db import get_db
+from db import get_read_db
 from services.label_service import (
     get_predictions_by_label_service,
+    stream_predictions_by_label_service,
     get_recent_labels_service,
 )
+from services.pagination import DEFAULT_PAGE_SIZE
+from services.streaming import wants_ndjson
 from auth import get_current_username
 
 router = APIRouter()
@@ -13,14 +16,25 @@ router = APIRouter()
 @router.get("/predictions/label/{label}")
 def get_predictions_by_label_route(
     label: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, description="Page size (capped)"),
+    cursor: str | None = Query(None, description="X-Next-Cursor of previous page"),
     username: str = Depends(get_current_username),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    return get_predictions_by_label_service(label, username, db)
+    if wants_ndjson(request):
+        # opt-in export mode: every match, streamed, no paging
+        return stream_predictions_by_label_service(label, username, bind=db.get_bind())
+
+    page = get_predictions_by_label_service(label, username, db, limit, cursor)
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return page["items"]
 
 
 @router.get("/labels")
 def get_labels(
-    username: str = Depends(get_current_username), db: Session = Depends(get_db)
+    username: str = Depends(get_current_username), db: Session = Depends(get_read_db)
 ):
     return get_recent_labels_service(username, db)
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends
+from auth import get_current_username
+from infra import metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+def get_metrics(username: str = Depends(get_current_username)):
+    snapshot = metrics.snapshot()
+    lookups = snapshot.get("s3.cache.hits", 0) + snapshot.get("s3.cache.misses", 0)
+    if lookups:
+        snapshot["s3.cache.hit_ratio"] = round(
+            snapshot.get("s3.cache.hits", 0) / lookups, 4
+        )
+    return snapshot
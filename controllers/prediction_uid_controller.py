@@ -1,7 +1,13 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from sqlalchemy.orm import Session
-from db import get_db
-from services.prediction_uid_service import get_prediction_by_uid_service
+from db import get_read_db
+from services.http_cache import cache_headers, etag_matches, not_modified
+from services.prediction_uid_service import (
+    get_prediction_by_uid_service,
+    prediction_etag,
+    prediction_refs,
+    refs_final,
+)
 from auth import get_current_username
 
 router = APIRouter()
@@ -10,7 +16,20 @@ router = APIRouter()
 @router.get("/prediction/{uid}")
 def get_prediction(
     uid: str,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
     username: str = Depends(get_current_username),
 ):
-    return get_prediction_by_uid_service(uid, username, db)
+    if request.headers.get("if-none-match"):
+        refs = prediction_refs(uid, username, db)
+        etag = prediction_etag(uid, *refs)
+        if etag_matches(request, etag):
+            return not_modified(etag, immutable=refs_final(db, *refs))
+
+    payload = get_prediction_by_uid_service(uid, username, db)
+    refs = payload["original_image"], payload["predicted_image"]
+    response.headers.update(
+        cache_headers(prediction_etag(uid, *refs), immutable=refs_final(db, *refs))
+    )
+    return payload
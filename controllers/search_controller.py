@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlalchemy.orm import Session
+from db import get_read_db
+from auth import get_current_username
+from services.pagination import DEFAULT_PAGE_SIZE
+from services.streaming import wants_ndjson
+from services.search_service import (
+    search_predictions_service,
+    stream_search_predictions_service,
+)
+
+router = APIRouter()
+
+
+@router.get("/predictions/search")
+def search_predictions_route(
+    request: Request,
+    response: Response,
+    q: str = Query(..., description='Label expression, e.g. "person AND NOT car"'),
+    min_score: list[str] | None = Query(
+        None, description="label:score (repeatable); a bare score applies to all"
+    ),
+    min_count: list[str] | None = Query(
+        None, description="label:count (repeatable); a bare count applies to all"
+    ),
+    since: datetime | None = Query(None, description="Sessions at or after"),
+    until: datetime | None = Query(None, description="Sessions before"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, description="Page size (capped)"),
+    cursor: str | None = Query(None, description="X-Next-Cursor of previous page"),
+    username: str = Depends(get_current_username),
+    db: Session = Depends(get_read_db),
+):
+    filters = dict(min_score=min_score, min_count=min_count, since=since, until=until)
+    if wants_ndjson(request):
+        # opt-in export mode: every match, streamed, no paging
+        return stream_search_predictions_service(
+            username, q, bind=db.get_bind(), **filters
+        )
+
+    page = search_predictions_service(
+        username, db, q, limit=limit, cursor=cursor, **filters
+    )
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return page["items"]
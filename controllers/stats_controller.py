@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from db import get_db
+from db import get_read_db
 from auth import get_current_username
 from services.stats_service import get_stats_service
 
@@ -9,6 +9,6 @@ router = APIRouter()
 
 @router.get("/stats")
 def get_stats(
-    username: str = Depends(get_current_username), db: Session = Depends(get_db)
+    username: str = Depends(get_current_username), db: Session = Depends(get_read_db)
 ):
     return get_stats_service(username, db)
@@ -1,7 +1,12 @@
 # db.py
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from fastapi import Depends
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from infra import metrics
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
@@ -9,20 +14,187 @@ if not DATABASE_URL:
     # default to a local SQLite file if nothing provided
     DATABASE_URL = "sqlite:///./predictions.db"
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False}
-    if DATABASE_URL.startswith("sqlite")
-    else {},
+# optional read replica for read-only endpoints (see get_read_db)
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL") or None
+# after a user writes, their reads stay on the primary this long (replica lag)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+
+def _is_sqlite_in_memory(url: str) -> bool:
+    return url.startswith("sqlite") and (
+        url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+    )
+
+
+# ---------- Pool sizing (QueuePool for Postgres and file-backed SQLite) ----------
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# ---------- SQLite profile: WAL + pragmas applied on every new connection ----------
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    # NORMAL is durable in WAL mode except for the last txn on power loss
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+    # negative cache_size is in KiB -> 64 MB page cache per connection
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+
+def _engine_kwargs(url: str = DATABASE_URL) -> dict:
+    if not url.startswith("sqlite"):
+        return {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_pre_ping": True,
+        }
+    kwargs = {
+        "connect_args": {
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        }
+    }
+    if not _is_sqlite_in_memory(url):
+        kwargs.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    return kwargs
+
+
+engine = create_engine(DATABASE_URL, **_engine_kwargs())
+read_engine = (
+    create_engine(READ_DATABASE_URL, **_engine_kwargs(READ_DATABASE_URL))
+    if READ_DATABASE_URL
+    else engine
 )
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+ReadSessionLocal = sessionmaker(bind=read_engine, autoflush=False, autocommit=False)
 Base = declarative_base()
 
 
+if IS_SQLITE:
+
+    @event.listens_for(engine, "connect")
+    def _apply_sqlite_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        try:
+            for name, value in SQLITE_PRAGMAS.items():
+                cur.execute(f"PRAGMA {name}={value}")
+        finally:
+            cur.close()
+
+    # ---------- single-writer gate ----------
+    # SQLite allows one writer at a time. Instead of letting concurrent request
+    # threads race for the file lock (and fail with "database is locked" once the
+    # busy timeout runs out), sessions queue on this lock as soon as they are
+    # about to write and hold it until their transaction ends. If the gate can't
+    # be taken within the busy timeout we fall through to SQLite's own locking,
+    # so a stuck session can never deadlock the process.
+    _sqlite_writer = threading.Lock()
+
+    def _acquire_writer(session):
+        if session.info.get("_sqlite_writer"):
+            return
+        if _sqlite_writer.acquire(timeout=SQLITE_BUSY_TIMEOUT_MS / 1000):
+            session.info["_sqlite_writer"] = True
+
+    @event.listens_for(SessionLocal, "before_flush")
+    def _writer_before_flush(session, _flush_context, _instances):
+        _acquire_writer(session)
+
+    @event.listens_for(SessionLocal, "do_orm_execute")
+    def _writer_before_bulk_dml(orm_execute_state):
+        if not orm_execute_state.is_select:
+            _acquire_writer(orm_execute_state.session)
+
+    @event.listens_for(SessionLocal, "after_transaction_end")
+    def _release_writer(session, transaction):
+        if transaction.parent is None and session.info.pop("_sqlite_writer", False):
+            _sqlite_writer.release()
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+# ---------- read routing ----------
+# Process-local: the app runs as a single process (python app.py). With several
+# workers a read may land on a worker that didn't see the write and go to the
+# replica; the window then only covers same-worker reads.
+_last_write: dict[str, float] = {}
+_last_write_lock = threading.Lock()
+
+
+def mark_write(username: str | None):
+    """Record that `username` just committed a write (call after commit)."""
+    if not username:
+        return
+    now = time.monotonic()
+    with _last_write_lock:
+        _last_write[username] = now
+        if len(_last_write) > 10_000:
+            # drop entries whose window has passed
+            cutoff = now - READ_YOUR_WRITES_SECONDS
+            for name in [n for n, t in _last_write.items() if t < cutoff]:
+                del _last_write[name]
+
+
+def wrote_recently(username: str | None) -> bool:
+    if not username:
+        return False
+    with _last_write_lock:
+        last = _last_write.get(username)
+    return last is not None and time.monotonic() - last < READ_YOUR_WRITES_SECONDS
+
+
+def read_session_factory(username: str | None):
+    """Session factory for a read-only request: replica unless the user just wrote."""
+    if read_engine is engine:
+        metrics.incr("db.route.primary")
+        return SessionLocal
+    if wrote_recently(username):
+        metrics.incr("db.route.primary")
+        metrics.incr("db.route.read_your_writes")
+        return SessionLocal
+    metrics.incr("db.route.replica")
+    return ReadSessionLocal
+
+
+def is_primary(session) -> bool:
+    """
+    True if `session` reads the primary. Replica reads may lag (a deleted or
+    not yet updated row), so they must not fill long-lived caches.
+    """
+    return session.get_bind() is engine
+
+
+_optional_basic = HTTPBasic(auto_error=False)
+
+
+def get_read_db(
+    credentials: HTTPBasicCredentials | None = Depends(_optional_basic),
+):
+    """
+    get_db for read-only endpoints. The username only picks the route (the
+    endpoint still authenticates through auth.get_current_username).
+    """
+    username = credentials.username if credentials else None
+    db = read_session_factory(username)()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -1,14 +1,41 @@
 # infra.py
 import os
+import hmac
 import time
+import bisect
 import asyncio
-from collections import defaultdict, deque
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict, defaultdict, deque
 from datetime import datetime, timedelta
 from fastapi import Request, HTTPException
 from fastapi.responses import Response
 from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
 
 
+# ---------- Process-local metrics (exposed on GET /metrics) ----------
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+
+    def incr(self, name: str, value: int | float = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+metrics = Metrics()
+
+
 # ---------- Rate limiting middleware (burst: 30 rps; uploads: 10/min) ----------
 class RateLimitMiddleware(BaseHTTPMiddleware):
     def __init__(self, app, rps_limit=None, uploads_per_min=None):
@@ -76,24 +103,134 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         return resp
 
 
-# ---------- 24h cache helper  ----------
+# ---------- prediction metadata cache (GET /prediction/{uid}) ----------
 class PredictionCache:
-    def __init__(self, ttl=24 * 3600):
+    """
+    Bounded LRU+TTL cache of per-prediction payloads. Each entry remembers its
+    owner so callers can answer 403 for someone else's uid without the DB.
+
+    Readers that fill the cache after a DB read pass the token() they took
+    before the read; fill() drops the entry if anything was invalidated in
+    between, so a concurrent delete can't be undone by a stale refill.
+    """
+
+    def __init__(self, ttl=24 * 3600, max_entries=None):
         self.ttl = ttl
-        self._data = {}
+        self.max_entries = int(
+            os.getenv("PREDICTION_CACHE_MAX_ENTRIES", str(max_entries or 10_000))
+        )
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # uid -> (owner, payload, stored_at)
+        self._invalidations = 0
+
+    def get_entry(self, uid: str):
+        """(owner, payload) for a live entry, else None."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(uid)
+            if entry is not None and now - entry[2] <= self.ttl:
+                self._data.move_to_end(uid)
+                metrics.incr("prediction_cache.hits")
+                return entry[0], entry[1]
+            if entry is not None:
+                del self._data[uid]
+        metrics.incr("prediction_cache.misses")
+        return None
 
     def get(self, uid: str):
+        entry = self.get_entry(uid)
+        return entry[1] if entry else None
+
+    def set(self, uid: str, payload: dict, owner: str | None = None):
+        with self._lock:
+            self._store(uid, owner, payload)
+
+    def token(self) -> int:
+        with self._lock:
+            return self._invalidations
+
+    def fill(self, uid: str, payload: dict, owner: str | None, token: int):
+        with self._lock:
+            if token == self._invalidations:
+                self._store(uid, owner, payload)
+
+    def _store(self, uid, owner, payload):
+        self._data[uid] = (owner, payload, time.time())
+        self._data.move_to_end(uid)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            metrics.incr("prediction_cache.evictions")
+
+    def invalidate(self, *uids: str):
+        with self._lock:
+            self._invalidations += 1
+            for uid in uids:
+                self._data.pop(uid, None)
+
+    def clear(self):
+        with self._lock:
+            self._invalidations += 1
+            self._data.clear()
+
+
+prediction_cache = PredictionCache()
+
+
+# ---------- verified-credential cache (auth fast path) ----------
+class CredentialCache:
+    """
+    Bounded LRU+TTL set of username/password pairs that already passed a DB
+    check. Entries are keyed by an HMAC of the pair under a random per-process
+    key, so neither plaintext nor a reusable hash of the password is kept.
+    """
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = float(os.getenv("AUTH_CACHE_TTL", str(ttl or 60)))
+        self.max_entries = int(
+            os.getenv("AUTH_CACHE_MAX_ENTRIES", str(max_entries or 10_000))
+        )
+        self._secret = secrets.token_bytes(32)
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # digest -> (username, verified_at)
+
+    def _digest(self, username: str, password: str) -> bytes:
+        msg = username.encode() + b"\0" + password.encode()
+        return hmac.new(self._secret, msg, hashlib.sha256).digest()
+
+    def check(self, username: str, password: str) -> bool:
+        key = self._digest(username, password)
         now = time.time()
-        entry = self._data.get(uid)
-        if not entry:
-            return None
-        if now - entry["t"] > self.ttl:
-            self._data.pop(uid, None)
-            return None
-        return entry["payload"]
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and now - entry[1] <= self.ttl:
+                self._data.move_to_end(key)
+                metrics.incr("auth_cache.hits")
+                return True
+            if entry is not None:
+                del self._data[key]
+        metrics.incr("auth_cache.misses")
+        return False
+
+    def add(self, username: str, password: str):
+        key = self._digest(username, password)
+        with self._lock:
+            self._data[key] = (username, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
 
-    def set(self, uid: str, payload: dict):
-        self._data[uid] = {"t": time.time(), "payload": payload}
+    def invalidate(self, username: str):
+        with self._lock:
+            for key in [k for k, (u, _) in self._data.items() if u == username]:
+                del self._data[key]
+        metrics.incr("auth_cache.invalidations")
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+credential_cache = CredentialCache()
 
 
 # ---------- helper: coerce mock counts to int ----------
@@ -104,6 +241,155 @@ def _as_int(x) -> int:
         return 0
 
 
+# ---------- In-memory quota counters (monthly / sliding 24h) ----------
+def _month_start(now: datetime) -> datetime:
+    return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+class QuotaCounters:
+    """
+    Per-user prediction counts for the current month and the last 24h, kept in
+    memory so /predict doesn't run COUNT(*) over prediction_sessions each time.
+
+    A user's entry holds the sorted (timestamp, uid) pairs of the rows it
+    counts (this month and the last 24h). It is seeded from the DB on first
+    touch, kept current by record()/forget() on every prediction and delete,
+    and re-seeded once it is older than QUOTA_RESYNC_SECONDS (picks up rows
+    written by other worker processes or by anything that bypassed this
+    process).
+
+    Seeding runs outside the shared lock, one seed per user at a time. While
+    it runs, record()/forget() are journaled and replayed on the seeded
+    snapshot. Both are idempotent per uid, so a session the seed query
+    already saw (committed before record() ran) is never counted twice.
+    """
+
+    def __init__(self, resync_every: float | None = None):
+        default = 300 if resync_every is None else resync_every
+        self.resync_every = float(os.getenv("QUOTA_RESYNC_SECONDS", str(default)))
+        self._lock = threading.Lock()
+        self._users = {}
+        self._seeding = {}  # username -> {"lock", "waiters", "journal"}
+
+    @staticmethod
+    def _floor(now: datetime) -> datetime:
+        """Oldest timestamp either window can still count."""
+        return min(_month_start(now), now - timedelta(hours=24))
+
+    def _seed(self, db, username: str, now: datetime) -> dict:
+        from models import PredictionSession  # local import to avoid cycles
+
+        # one statement: both windows come from the same snapshot
+        rows = (
+            db.query(PredictionSession.timestamp, PredictionSession.uid)
+            .filter(
+                PredictionSession.username == username,
+                PredictionSession.timestamp >= self._floor(now),
+            )
+            .all()
+        )
+        return {
+            "month": _month_start(now),
+            "stamps": sorted((ts, uid) for ts, uid in rows if ts is not None),
+            "synced": time.time(),
+        }
+
+    def _fresh(self, username: str, now: datetime):
+        """The user's entry if it can answer for `now`; call under self._lock."""
+        entry = self._users.get(username)
+        if (
+            entry is None
+            or entry["month"] != _month_start(now)
+            or time.time() - entry["synced"] > self.resync_every
+        ):
+            return None
+        return entry
+
+    def _reseed(self, db, username: str, now: datetime) -> dict:
+        with self._lock:
+            slot = self._seeding.setdefault(
+                username, {"lock": threading.Lock(), "waiters": 0, "journal": None}
+            )
+            slot["waiters"] += 1
+        slot["lock"].acquire()
+        try:
+            with self._lock:
+                entry = self._fresh(username, now)
+                if entry is not None:
+                    return entry  # seeded by the thread we waited for
+                slot["journal"] = []
+            try:
+                entry = self._seed(db, username, now)
+            except BaseException:
+                with self._lock:
+                    slot["journal"] = None
+                raise
+            with self._lock:
+                for op, key in slot["journal"]:
+                    self._change(entry["stamps"], op, key)
+                slot["journal"] = None
+                self._users[username] = entry
+                return entry
+        finally:
+            slot["lock"].release()
+            with self._lock:
+                slot["waiters"] -= 1
+                if slot["waiters"] == 0:
+                    self._seeding.pop(username, None)
+
+    @staticmethod
+    def _change(stamps: list, op: str, key: tuple):
+        """Add (record) or drop (forget) one (timestamp, uid); idempotent."""
+        i = bisect.bisect_left(stamps, key)
+        present = i < len(stamps) and stamps[i] == key
+        if op == "record" and not present:
+            stamps.insert(i, key)
+        elif op == "forget" and present:
+            del stamps[i]
+
+    def counts(self, db, username: str, now: datetime | None = None):
+        """(this month, last 24h) prediction counts for `username`."""
+        now = now or datetime.utcnow()
+        with self._lock:
+            entry = self._fresh(username, now)
+        if entry is None:
+            entry = self._reseed(db, username, now)
+        with self._lock:
+            stamps = entry["stamps"]
+            # (t,) sorts before every (t, uid): the first pair at or after t
+            del stamps[: bisect.bisect_left(stamps, (self._floor(now),))]
+            monthly = len(stamps) - bisect.bisect_left(stamps, (_month_start(now),))
+            daily = len(stamps) - bisect.bisect_left(
+                stamps, (now - timedelta(hours=24),)
+            )
+            return monthly, daily
+
+    def _apply(self, op: str, username: str, timestamp: datetime, uid: str):
+        if timestamp is None:
+            return
+        with self._lock:
+            slot = self._seeding.get(username)
+            if slot is not None and slot["journal"] is not None:
+                slot["journal"].append((op, (timestamp, uid)))
+            entry = self._users.get(username)
+            if entry is None:
+                return  # not seeded yet: the first counts() reads it from the DB
+            self._change(entry["stamps"], op, (timestamp, uid))
+
+    def record(self, username: str, timestamp: datetime, uid: str):
+        self._apply("record", username, timestamp, uid)
+
+    def forget(self, username: str, timestamp: datetime, uid: str):
+        self._apply("forget", username, timestamp, uid)
+
+    def reset(self):
+        with self._lock:
+            self._users.clear()
+
+
+quota_counters = QuotaCounters()
+
+
 # ---------- DB-driven quotas (monthly / 24h) ----------
 def enforce_db_quota(
     db,
@@ -115,80 +401,218 @@ def enforce_db_quota(
     """
     Raise 429 if user exceeded quotas, based on PredictionSession.timestamp.
     Call this inside your /predict service ONLY for authenticated users.
+    Counts come from quota_counters (seeded from the DB, then kept in memory).
     """
-    from models import PredictionSession  # local import to avoid cycles
+    if monthly_limit is None and last_24h_limit is None:
+        return
 
     # NOTE: your model uses naive UTC datetimes (default=datetime.utcnow)
-    now = datetime.utcnow()
+    count_m, count_d = quota_counters.counts(db, username, datetime.utcnow())
 
     if monthly_limit is not None:
-        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        count_m = (
-            db.query(PredictionSession)
-            .filter(
-                PredictionSession.username == username,
-                PredictionSession.timestamp >= month_start,
-            )
-            .count()
-        )
         if _as_int(count_m) >= int(monthly_limit):
             raise HTTPException(
                 status_code=429, detail="Monthly prediction quota exceeded"
             )
 
     if last_24h_limit is not None:
-        day_start = now - timedelta(hours=24)
-        count_d = (
-            db.query(PredictionSession)
-            .filter(
-                PredictionSession.username == username,
-                PredictionSession.timestamp >= day_start,
-            )
-            .count()
-        )
         if _as_int(count_d) >= int(last_24h_limit):
             raise HTTPException(status_code=429, detail="24h prediction quota exceeded")
 
 
-# ---------- 90-day uploads cleanup (DB-driven; uses PredictionSession.timestamp) ----------
-def purge_old_uploads_db(upload_root: str = "uploads", max_age_days: int = 90) -> int:
+# ---------- 90-day retention (DB-driven; uses PredictionSession.timestamp) ----------
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "500"))
+RETENTION_TIME_BUDGET_S = float(os.getenv("RETENTION_TIME_BUDGET_S", "300"))
+RETENTION_FILE_WORKERS = int(os.getenv("RETENTION_FILE_WORKERS", "8"))
+# when set, expired rows are exported here (<dir>/YYYY-MM/...) before deletion
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "")
+
+
+def _remove_file(path: str) -> int | None:
+    """Remove one file; return bytes reclaimed or None if nothing was removed."""
+    try:
+        size = os.stat(path).st_size
+        os.remove(path)
+        return size
+    except OSError:
+        return None
+
+
+def _archive_batch(db, uids: list[str], archive_dir: str) -> list[str]:
+    """
+    Export a batch of sessions and their detections to
+    <archive_dir>/<YYYY-MM>/<table>-<first uid>.<ext>, one file per table and
+    month, before they are deleted. Returns the written paths.
+    """
+    from models import DetectionObject, PredictionSession
+    from services.columnar import write_rows
+
+    session_cols = [c.name for c in PredictionSession.__table__.columns]
+    detection_cols = [c.name for c in DetectionObject.__table__.columns]
+    sessions = (
+        db.query(*PredictionSession.__table__.columns)
+        .filter(PredictionSession.uid.in_(uids))
+        .order_by(PredictionSession.timestamp, PredictionSession.uid)
+        .all()
+    )
+    month_of = {r.uid: r.timestamp.strftime("%Y-%m") for r in sessions}
+    by_month = defaultdict(lambda: ([], []))
+    for r in sessions:
+        by_month[month_of[r.uid]][0].append(tuple(r))
+    for r in (
+        db.query(*DetectionObject.__table__.columns)
+        .filter(DetectionObject.prediction_uid.in_(uids))
+        .order_by(DetectionObject.id)
+    ):
+        by_month[month_of[r.prediction_uid]][1].append(tuple(r))
+
+    paths = []
+    for month, (session_rows, detection_rows) in by_month.items():
+        stem = session_rows[0][session_cols.index("uid")]
+        base = os.path.join(archive_dir, month)
+        paths.append(
+            write_rows(
+                os.path.join(base, f"prediction_sessions-{stem}"),
+                session_cols,
+                session_rows,
+            )
+        )
+        if detection_rows:
+            paths.append(
+                write_rows(
+                    os.path.join(base, f"detection_objects-{stem}"),
+                    detection_cols,
+                    detection_rows,
+                )
+            )
+    return paths
+
+
+def purge_old_uploads_db(
+    upload_root: str = "uploads",
+    max_age_days: int = 90,
+    *,
+    batch_size: int | None = None,
+    time_budget_s: float | None = None,
+    archive_dir: str | None = None,
+) -> int:
     """
-    Delete original/predicted image files for sessions older than max_age_days.
-    Uses DB timestamp as the source of truth.
+    Retention pass for sessions older than max_age_days (DB timestamp is the
+    source of truth). Expired sessions are walked in (timestamp, uid) keyset
+    order; each batch's rows (sessions, detections, rollups) are deleted in one
+    transaction and its image files under upload_root are removed on a thread
+    pool; images stored in S3 are deleted with batched DeleteObjects after the
+    commit. Stops after time_budget_s; the next pass picks up where this left
+    off.
+
+    With archive_dir (default RETENTION_ARCHIVE_DIR) each batch is first
+    exported to compressed columnar files (services.columnar); if the export
+    fails the batch is not deleted and the pass stops.
+
+    Blocking: run it off the event loop (asyncio.to_thread). Returns the number
+    of files removed.
     """
+    from concurrent.futures import ThreadPoolExecutor
+    from sqlalchemy import tuple_
     from db import SessionLocal
-    from models import (
-        PredictionSession,
-    )  # uid, timestamp, original_image, predicted_image
+    from models import PredictionSession
+    from queries import delete_sessions, release_blobs
+    from services.blob_store import still_freed
+    from services.storage import is_s3_ref, owned_refs, remove_refs
 
+    batch_size = batch_size or RETENTION_BATCH
+    budget = RETENTION_TIME_BUDGET_S if time_budget_s is None else time_budget_s
+    deadline = time.monotonic() + budget
+    archive_dir = RETENTION_ARCHIVE_DIR if archive_dir is None else archive_dir
     cutoff = datetime.utcnow() - timedelta(days=max_age_days)
-    removed = 0
+    root_abs = os.path.realpath(upload_root)
 
-    def _is_under(root: str, path: str) -> bool:
-        root_abs = os.path.realpath(root)
-        path_abs = os.path.realpath(path or "")
-        return path_abs.startswith(root_abs + os.sep)
-
-    with SessionLocal() as db:
-        BATCH = 500
-        q = db.query(
-            PredictionSession.original_image, PredictionSession.predicted_image
-        ).filter(PredictionSession.timestamp < cutoff)
-        offset = 0
-        while True:
-            rows = q.limit(BATCH).offset(offset).all()
+    def _is_under(path: str) -> bool:
+        return os.path.realpath(path or "").startswith(root_abs + os.sep)
+
+    def _remove_s3(keys: list[str]) -> int:
+        """Batched DeleteObjects after commit; returns objects removed."""
+        if not keys:
+            return 0
+        errors = remove_refs(keys)
+        if errors:
+            print(f"Warning: retention could not delete {len(errors)} S3 object(s)")
+            metrics.incr("retention.storage_errors", len(errors))
+        return len(set(keys)) - len(errors)
+
+    keyset = (PredictionSession.timestamp, PredictionSession.uid)
+    rows_deleted = rows_archived = objects_removed = 0
+    futures = []
+    reclaimed = []
+    with (
+        SessionLocal() as db,
+        ThreadPoolExecutor(max_workers=RETENTION_FILE_WORKERS) as pool,
+    ):
+        last = None
+        while time.monotonic() < deadline:
+            q = db.query(
+                PredictionSession.uid,
+                PredictionSession.timestamp,
+                PredictionSession.original_image,
+                PredictionSession.predicted_image,
+                PredictionSession.owns_original,
+            ).filter(PredictionSession.timestamp < cutoff)
+            if last is not None:
+                q = q.filter(tuple_(*keyset) > tuple_(*last))
+            rows = q.order_by(*keyset).limit(batch_size).all()
             if not rows:
                 break
-            for orig, pred in rows:
-                for p in (orig, pred):
-                    try:
-                        if p and _is_under(upload_root, p) and os.path.exists(p):
-                            os.remove(p)
-                            removed += 1
-                    except OSError:
-                        pass
-            offset += BATCH
+            last = (rows[-1].timestamp, rows[-1].uid)
+
+            if archive_dir:
+                try:
+                    paths = _archive_batch(db, [r.uid for r in rows], archive_dir)
+                except Exception as e:
+                    print(f"Warning: retention archive failed, batch kept — {e}")
+                    metrics.incr("retention.archive_errors")
+                    break
+                rows_archived += len(rows)
+                metrics.incr("retention.archive_files", len(paths))
+
+            # rows first: a crash between the two steps leaves orphan files
+            # (swept by purge_old_uploads) rather than sessions without images
+            delete_sessions(db, [r.uid for r in rows])
+            # shared originals: only blobs whose last session expired are
+            # removed; local files before commit, S3 objects after it (see
+            # services.blob_store)
+            refs = [owned_refs(r) for r in rows]
+            freed, blobs = release_blobs(db, [original for original, _ in refs])
+            reclaimed.extend(
+                pool.map(
+                    _remove_file,
+                    [p for p in freed if not is_s3_ref(p) and _is_under(p)],
+                )
+            )
+            db.commit()
+            objects_removed += _remove_s3(
+                still_freed(db, [p for p in freed if is_s3_ref(p)])
+            )
+            prediction_cache.invalidate(*(r.uid for r in rows))
+            rows_deleted += len(rows)
+
+            s3_keys = []
+            for pair in refs:
+                for p in pair:
+                    if not p or p in blobs:
+                        continue
+                    if is_s3_ref(p):
+                        s3_keys.append(p)
+                    elif _is_under(p):
+                        futures.append(pool.submit(_remove_file, p))
+            objects_removed += _remove_s3(s3_keys)
 
+    reclaimed.extend(f.result() for f in futures)
+    removed = sum(1 for size in reclaimed if size is not None) + objects_removed
+    metrics.incr("retention.passes")
+    metrics.incr("retention.rows_deleted", rows_deleted)
+    metrics.incr("retention.rows_archived", rows_archived)
+    metrics.incr("retention.files_removed", removed)
+    metrics.incr("retention.bytes_reclaimed", sum(size or 0 for size in reclaimed))
     return removed
 
 
@@ -198,8 +622,10 @@ def schedule_daily_cleanup(app, base_dir="uploads", max_age_days=90):
         async def _loop():
             while True:
                 try:
-                    purge_old_uploads_db(
-                        upload_root=base_dir, max_age_days=max_age_days
+                    await asyncio.to_thread(
+                        purge_old_uploads_db,
+                        upload_root=base_dir,
+                        max_age_days=max_age_days,
                     )
                 finally:
                     await asyncio.sleep(24 * 3600)
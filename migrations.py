@@ -0,0 +1,238 @@
+# migrations.py
+"""
+Idempotent schema upkeep for databases created before a model change.
+
+Base.metadata.create_all only creates missing tables; it never adds columns
+or indexes to tables that already exist, and new derived data starts out
+empty. This runs at startup (see app.lifespan) and can be run by hand:
+
+    python migrations.py                      # bring schema up to date
+    python migrations.py rebuild-rollups      # recompute daily rollups
+    python migrations.py rebuild-rollups --user alice
+    python migrations.py backfill-summaries   # recompute per-session summaries
+    python migrations.py rebuild-labels       # rebuild the session label index
+    python migrations.py shard-uploads        # move flat uploads/ to ab/cd/ dirs
+"""
+
+import argparse
+import os
+import shutil
+
+from sqlalchemy import inspect, text, update
+from sqlalchemy.schema import CreateColumn
+
+from db import Base, SessionLocal, engine
+
+ROLLUP_TABLES = ("label_daily_rollups", "prediction_daily_rollups")
+SUMMARY_COLUMNS = {"detection_count", "max_score", "labels"}
+# indexes an earlier model declared and a wider one now covers; left in place
+# they would still be maintained on every insert
+SUPERSEDED_INDEXES = ("ix_detection_objects_prediction_uid",)
+
+
+def ensure_columns(bind=engine) -> dict:
+    """ALTER TABLE ... ADD COLUMN for model columns missing in existing tables."""
+    import models  # noqa: F401
+
+    inspector = inspect(bind)
+    added = {}
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            present = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                added.setdefault(table.name, set()).add(column.name)
+    return added
+
+
+def ensure_indexes(bind=engine):
+    import models  # noqa: F401  (register tables on Base.metadata)
+
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+    with bind.begin() as conn:
+        for name in SUPERSEDED_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def run_migrations(bind=engine):
+    import models  # noqa: F401
+    from queries import (
+        backfill_session_summaries,
+        rebuild_rollups,
+        rebuild_session_labels,
+    )
+
+    existing = set(inspect(bind).get_table_names())
+    Base.metadata.create_all(bind=bind)
+    added = ensure_columns(bind)
+    ensure_indexes(bind)
+
+    # derived data added to a database that already has history: backfill once
+    if "prediction_sessions" in existing and not existing.issuperset(ROLLUP_TABLES):
+        with SessionLocal(bind=bind) as db:
+            rebuild_rollups(db)
+    if added.get("prediction_sessions", set()) & SUMMARY_COLUMNS:
+        with SessionLocal(bind=bind) as db:
+            backfill_session_summaries(db)
+    if "prediction_sessions" in existing and "session_labels" not in existing:
+        with SessionLocal(bind=bind) as db:
+            rebuild_session_labels(db)
+
+
+def _link(old: str, new: str) -> bool:
+    """Make `new` another name for `old` (copy if links aren't supported)."""
+    if os.path.exists(new):
+        return True
+    os.makedirs(os.path.dirname(new), exist_ok=True)
+    try:
+        os.link(old, new)
+    except FileNotFoundError:
+        return False
+    except OSError:
+        shutil.copy2(old, new)
+    return True
+
+
+def _unlink_all(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def shard_uploads(bind=engine, batch_size: int = 1000) -> dict:
+    """
+    Move local images with flat refs (uploads/<type>/<name>) to the sharded
+    layout (services.storage.shard_path) and rewrite the refs. Each file is
+    linked under its new name, the rows are committed, and only then is the
+    old name removed, so the file is always reachable under the ref a reader
+    holds (the image endpoints also try both spellings). Idempotent.
+    """
+    from models import ImageBlob, PredictionSession
+    from services.storage import is_s3_ref, layouts
+
+    def _target(ref):
+        if not ref or is_s3_ref(ref):
+            return None
+        sharded, _flat = layouts(ref)
+        return sharded if sharded != ref else None
+
+    counts = {"moved": 0, "missing": 0}
+
+    def _move(old, new, moved_now) -> bool:
+        if _link(old, new):
+            moved_now.append(old)
+            counts["moved"] += 1
+            return True
+        counts["missing"] += 1
+        return False
+
+    # shared originals first: one blob row plus every session pointing at it
+    with SessionLocal(bind=bind) as db:
+        last = ""
+        while True:
+            blobs = (
+                db.query(ImageBlob.sha256, ImageBlob.ref)
+                .filter(ImageBlob.sha256 > last)
+                .order_by(ImageBlob.sha256)
+                .limit(batch_size)
+                .all()
+            )
+            if not blobs:
+                break
+            last = blobs[-1].sha256
+            moved_now = []
+            for sha, ref in blobs:
+                new = _target(ref)
+                if new is None or not _move(ref, new, moved_now):
+                    continue
+                # blob row first: it serialises with concurrent acquire_blob
+                db.query(ImageBlob).filter_by(sha256=sha).update({"ref": new})
+                db.query(PredictionSession).filter_by(original_image=ref).update(
+                    {"original_image": new}, synchronize_session=False
+                )
+            db.commit()
+            _unlink_all(moved_now)
+
+    # per-session files: predicted images and pre-dedup originals
+    with SessionLocal(bind=bind) as db:
+        last = ""
+        while True:
+            rows = (
+                db.query(
+                    PredictionSession.uid,
+                    PredictionSession.original_image,
+                    PredictionSession.predicted_image,
+                )
+                .filter(PredictionSession.uid > last)
+                .order_by(PredictionSession.uid)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            last = rows[-1].uid
+            moved_now, updates = [], []
+            for uid, original, predicted in rows:
+                refs = {"original_image": original, "predicted_image": predicted}
+                changed = False
+                for column, ref in refs.items():
+                    new = _target(ref)
+                    if new is not None and _move(ref, new, moved_now):
+                        refs[column] = new
+                        changed = True
+                if changed:
+                    updates.append({"uid": uid, **refs})
+            if updates:
+                db.execute(update(PredictionSession), updates)
+            db.commit()
+            _unlink_all(moved_now)
+    return counts
+
+
+def main(argv=None):  # pragma: no cover
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    sub = parser.add_subparsers(dest="command")
+    rebuild = sub.add_parser("rebuild-rollups", help="recompute daily rollups")
+    rebuild.add_argument("--user", help="only rebuild this user's rollups")
+    sub.add_parser("backfill-summaries", help="recompute per-session summaries")
+    sub.add_parser("rebuild-labels", help="rebuild the session label index")
+    sub.add_parser("shard-uploads", help="move flat upload files to ab/cd/ dirs")
+    args = parser.parse_args(argv)
+
+    run_migrations()
+    if args.command == "rebuild-rollups":
+        from queries import rebuild_rollups
+
+        with SessionLocal() as db:
+            days = rebuild_rollups(db, username=args.user)
+        print(f"rebuilt rollups for {days} user-day(s)")
+    elif args.command == "backfill-summaries":
+        from queries import backfill_session_summaries
+
+        with SessionLocal() as db:
+            sessions = backfill_session_summaries(db)
+        print(f"backfilled {sessions} session(s)")
+    elif args.command == "rebuild-labels":
+        from queries import rebuild_session_labels
+
+        with SessionLocal() as db:
+            sessions = rebuild_session_labels(db)
+        print(f"indexed labels for {sessions} session(s)")
+    elif args.command == "shard-uploads":
+        counts = shard_uploads()
+        print(f"moved {counts['moved']} file(s), {counts['missing']} missing")
+    else:
+        print("schema up to date")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -1,6 +1,17 @@
 # models.py
 
-from sqlalchemy import Column, String, DateTime, Integer, Float, ForeignKey
+from sqlalchemy import (
+    Column,
+    String,
+    Date,
+    DateTime,
+    Integer,
+    Float,
+    ForeignKey,
+    Index,
+    Boolean,
+    true,
+)
 from datetime import datetime
 from db import Base
 # All models inherit from this base class
@@ -20,6 +31,21 @@ class PredictionSession(Base):
     original_image = Column(String)
     predicted_image = Column(String)
     username = Column(String, ForeignKey("users.username"))
+    # denormalized summary of the session's detections, written at insert time
+    # so the score/label list endpoints read one table (see queries.save_prediction)
+    detection_count = Column(Integer, nullable=False, default=0, server_default="0")
+    max_score = Column(Float)
+    labels = Column(String, nullable=False, default="", server_default="")
+    # False for ?img= sessions whose original is the caller's own S3 object
+    # (not a blob): it was never written here, so deletes leave it alone
+    owns_original = Column(Boolean, nullable=False, default=True, server_default=true())
+
+    __table_args__ = (
+        # keyset pagination: WHERE username = ? ORDER BY timestamp, uid
+        Index("ix_prediction_sessions_user_ts_uid", "username", "timestamp", "uid"),
+        # sessions sharing a content-addressed original (image_blobs.ref)
+        Index("ix_prediction_sessions_original_image", "original_image"),
+    )
 
 
 class DetectionObject(Base):
@@ -37,6 +63,40 @@ class DetectionObject(Base):
     score = Column(Float)
     box = Column(String)
 
+    __table_args__ = (
+        # per-session lookups, plus "n detections of label >= score" counts
+        # answered from the index alone (see queries.search_predictions)
+        Index(
+            "ix_detection_objects_uid_label_score", "prediction_uid", "label", "score"
+        ),
+    )
+
+
+class SessionLabel(Base):
+    """
+    Inverted label index: one row per (session, label) the session detected.
+
+    Written with the session (queries.save_prediction) and removed with its
+    detections. Carries the owner and timestamp so a label's sessions for one
+    user are a single range of ix_session_labels_user_label_ts, in the same
+    (timestamp, uid) order as the list endpoints.
+    """
+
+    __tablename__ = "session_labels"
+
+    uid = Column(String, ForeignKey("prediction_sessions.uid"), primary_key=True)
+    label = Column(String, primary_key=True)
+    username = Column(String)
+    timestamp = Column(DateTime)
+    detection_count = Column(Integer, nullable=False, default=0)
+    max_score = Column(Float)
+
+    __table_args__ = (
+        Index(
+            "ix_session_labels_user_label_ts", "username", "label", "timestamp", "uid"
+        ),
+    )
+
 
 class User(Base):
     """
@@ -49,3 +109,73 @@ class User(Base):
 
     username = Column(String, primary_key=True)
     password = Column(String, nullable=False)
+
+
+class LabelDailyRollup(Base):
+    """
+    Per-user, per-day detection count and score sum for one label.
+
+    Maintained in the same transaction as every prediction insert/delete
+    (see queries.save_prediction / remove_prediction_rollups) so /stats and
+    /labels read a handful of rows instead of scanning detections.
+    """
+
+    __tablename__ = "label_daily_rollups"
+
+    username = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    label = Column(String, primary_key=True)
+    detection_count = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Float, nullable=False, default=0.0)
+
+
+class PredictionDailyRollup(Base):
+    """
+    Per-user, per-day number of prediction sessions (for /predictions/count
+    and /stats totals, which count sessions rather than detections).
+    """
+
+    __tablename__ = "prediction_daily_rollups"
+
+    username = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    prediction_count = Column(Integer, nullable=False, default=0)
+
+
+class ImageBlob(Base):
+    """
+    Content-addressed original image: one stored file/object per distinct
+    upload (keyed by SHA-256), shared by every session that uploaded the same
+    bytes. refcount is the number of sessions whose original_image is `ref`;
+    the blob and its storage go when it drops to zero (queries.release_blobs).
+    """
+
+    __tablename__ = "image_blobs"
+
+    sha256 = Column(String, primary_key=True)
+    ref = Column(String, nullable=False, unique=True)
+    size = Column(Integer, nullable=False)
+    refcount = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class PendingUpload(Base):
+    """
+    Write-behind queue for S3 mode: a file staged on local disk that still
+    has to be uploaded to `key`. Committed with the session that references
+    the local path; once the upload is confirmed the refs are switched to
+    the key and the row is deleted (services.s3_uploader). Rows left behind
+    by a crash are picked up again at startup.
+    """
+
+    __tablename__ = "pending_uploads"
+
+    id = Column(Integer, primary_key=True)
+    local_path = Column(String, nullable=False, unique=True)
+    key = Column(String, nullable=False)
+    # set for per-session files (predicted images); None for shared blobs
+    uid = Column(String)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, index=True)
+    last_error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
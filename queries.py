@@ -1,6 +1,20 @@
 import datetime
-from sqlalchemy.orm import Session
-from models import PredictionSession, User, DetectionObject
+import os
+from collections import defaultdict, namedtuple
+from sqlalchemy import String, and_, exists, func, not_, or_, select, tuple_
+from sqlalchemy import type_coerce
+from sqlalchemy.orm import Session, aliased
+from infra import credential_cache
+from models import (
+    PredictionSession,
+    User,
+    DetectionObject,
+    ImageBlob,
+    LabelDailyRollup,
+    PendingUpload,
+    PredictionDailyRollup,
+    SessionLabel,
+)
 
 
 def query_prediction_by_uid(db: Session, uid: str):
@@ -8,6 +22,15 @@ def query_prediction_by_uid(db: Session, uid: str):
     return result
 
 
+def get_detection_objects(db: Session, uid: str):
+    return (
+        db.query(DetectionObject.label, DetectionObject.score, DetectionObject.box)
+        .filter(DetectionObject.prediction_uid == uid)
+        .order_by(DetectionObject.id)
+        .all()
+    )
+
+
 def get_user(db: Session, username: str):
     return db.query(User).filter_by(username=username).first()
 
@@ -16,88 +39,654 @@ def create_user(db: Session, username: str, password: str):
     user = User(username=username, password=password)
     db.add(user)
     db.commit()
+    # drop any cached verification for this username (e.g. re-created user)
+    credential_cache.invalidate(username)
 
 
-def save_prediction_session(
-    db: Session, uid: str, original_path: str, predicted_path: str, username: str
+def save_prediction(
+    db: Session,
+    uid: str,
+    original_path: str,
+    predicted_path: str,
+    username: str | None,
+    detections: list[tuple[str, float, str]],
+    owns_original: bool = True,
 ):
-    session = PredictionSession(
-        uid=uid,
-        original_image=original_path,
-        predicted_image=predicted_path,
-        username=username,
+    """
+    Persist a session, its (label, score, box) detections and the matching
+    rollup increments in a single transaction.
+    """
+    timestamp = datetime.datetime.utcnow()
+    db.add(
+        PredictionSession(
+            uid=uid,
+            timestamp=timestamp,
+            original_image=original_path,
+            predicted_image=predicted_path,
+            username=username,
+            owns_original=owns_original,
+            **session_summary(detections),
+        )
     )
-    db.add(session)
+    # flush the session first so detections never reference a missing parent
+    db.flush()
+    db.add_all(
+        DetectionObject(prediction_uid=uid, label=label, score=score, box=box)
+        for label, score, box in detections
+    )
+    db.add_all(session_label_rows(uid, username, timestamp, detections))
+    _apply_rollups(db, username, timestamp, detections, sign=1)
     db.commit()
+    return timestamp
 
 
-def save_detection_object(
-    db: Session, prediction_uid: str, label: str, score: float, box: str
-):
-    obj = DetectionObject(
-        prediction_uid=prediction_uid, label=label, score=score, box=box
+def encode_label_set(labels) -> str:
+    """Compact label set: ",dog,person," (sorted, unique, comma-delimited)."""
+    unique = sorted(set(labels))
+    return f",{','.join(unique)}," if unique else ""
+
+
+def decode_label_set(labels: str | None) -> list[str]:
+    return [label for label in (labels or "").split(",") if label]
+
+
+def session_summary(detections) -> dict:
+    """detection_count / max_score / labels columns for (label, score, ...) rows."""
+    return {
+        "detection_count": len(detections),
+        "max_score": max((float(d[1]) for d in detections), default=None),
+        "labels": encode_label_set(d[0] for d in detections),
+    }
+
+
+def session_label_rows(uid: str, username, timestamp, detections):
+    """SessionLabel postings for one session's (label, score, ...) detections."""
+    per_label = defaultdict(list)
+    for d in detections:
+        per_label[d[0]].append(float(d[1]) if d[1] is not None else None)
+    return [
+        SessionLabel(
+            uid=uid,
+            label=label,
+            username=username,
+            timestamp=timestamp,
+            detection_count=len(scores),
+            max_score=max((s for s in scores if s is not None), default=None),
+        )
+        for label, scores in per_label.items()
+    ]
+
+
+# ---------- daily rollups ----------
+
+
+def _upsert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def _apply_rollups(db: Session, username: str | None, timestamp, detections, sign: int):
+    """Add (sign=1) or subtract (sign=-1) one session and its detections."""
+    if not username:
+        return  # anonymous predictions never show up in per-user stats
+    day = timestamp.date()
+    per_label = defaultdict(lambda: [0, 0.0])
+    for label, score, *_ in detections:
+        per_label[(username, day, label)][0] += sign
+        per_label[(username, day, label)][1] += sign * float(score or 0.0)
+    _apply_rollup_deltas(db, {(username, day): sign}, per_label)
+
+
+def _apply_rollup_deltas(db: Session, per_day: dict, per_label: dict):
+    """
+    per_day:   {(username, day): session delta}
+    per_label: {(username, day, label): [detection delta, score_sum delta]}
+    """
+    insert = _upsert(db)
+    if per_day:
+        stmt = insert(PredictionDailyRollup).values(
+            [
+                dict(username=username, day=day, prediction_count=n)
+                for (username, day), n in per_day.items()
+            ]
+        )
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["username", "day"],
+                set_={
+                    "prediction_count": PredictionDailyRollup.prediction_count
+                    + stmt.excluded.prediction_count
+                },
+            )
+        )
+    if per_label:
+        stmt = insert(LabelDailyRollup).values(
+            [
+                dict(
+                    username=username,
+                    day=day,
+                    label=label,
+                    detection_count=n,
+                    score_sum=score_sum,
+                )
+                for (username, day, label), (n, score_sum) in per_label.items()
+            ]
+        )
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["username", "day", "label"],
+                set_={
+                    "detection_count": LabelDailyRollup.detection_count
+                    + stmt.excluded.detection_count,
+                    "score_sum": LabelDailyRollup.score_sum + stmt.excluded.score_sum,
+                },
+            )
+        )
+
+
+def remove_rollups_for_sessions(db: Session, uids: list[str]):
+    """Subtract many sessions from the rollups; call before deleting their rows."""
+    if not uids:
+        return
+    sessions = {
+        uid: (username, timestamp.date())
+        for uid, username, timestamp in db.query(
+            PredictionSession.uid,
+            PredictionSession.username,
+            PredictionSession.timestamp,
+        ).filter(
+            PredictionSession.uid.in_(uids),
+            PredictionSession.username.isnot(None),
+            PredictionSession.timestamp.isnot(None),
+        )
+    }
+    if not sessions:
+        return
+    per_day = defaultdict(int)
+    for key in sessions.values():
+        per_day[key] -= 1
+    per_label = defaultdict(lambda: [0, 0.0])
+    for uid, label, score in db.query(
+        DetectionObject.prediction_uid, DetectionObject.label, DetectionObject.score
+    ).filter(DetectionObject.prediction_uid.in_(list(sessions))):
+        delta = per_label[(*sessions[uid], label)]
+        delta[0] -= 1
+        delta[1] -= float(score or 0.0)
+    _apply_rollup_deltas(db, per_day, per_label)
+
+
+def remove_prediction_rollups(db: Session, uid: str):
+    """Subtract a session from the rollups; call before deleting its rows."""
+    remove_rollups_for_sessions(db, [uid])
+
+
+def delete_sessions(db: Session, uids: list[str]):
+    """
+    Delete sessions, their detections and their rollup contribution.
+    Caller owns the transaction (commit once per batch).
+    """
+    if not uids:
+        return
+    remove_rollups_for_sessions(db, uids)
+    db.query(SessionLabel).filter(SessionLabel.uid.in_(uids)).delete(
+        synchronize_session=False
     )
-    db.add(obj)
-    db.commit()
+    db.query(DetectionObject).filter(DetectionObject.prediction_uid.in_(uids)).delete(
+        synchronize_session=False
+    )
+    db.query(PredictionSession).filter(PredictionSession.uid.in_(uids)).delete(
+        synchronize_session=False
+    )
+
+
+def acquire_blob(db: Session, sha256: str, ref: str, size: int) -> str:
+    """
+    Take one reference on the blob for `sha256`, creating it at `ref` if it
+    is new. Returns the blob's ref (an existing blob keeps the ref it was
+    first stored under). The row stays locked until the caller commits.
+    """
+    insert = _upsert(db)
+    stmt = insert(ImageBlob).values(
+        sha256=sha256,
+        ref=ref,
+        size=size,
+        refcount=1,
+        created_at=datetime.datetime.utcnow(),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["sha256"], set_={"refcount": ImageBlob.refcount + 1}
+    ).returning(ImageBlob.ref)
+    return db.execute(stmt).scalar_one()
+
+
+def reference_blob(db: Session, ref: str) -> bool:
+    """
+    Take one more reference on the blob stored at `ref`, if there is one
+    (e.g. ?img= naming an originals/ key). Returns whether `ref` is a blob;
+    the row stays locked until the caller commits.
+    """
+    updated = (
+        db.query(ImageBlob)
+        .filter(ImageBlob.ref == ref)
+        .update({ImageBlob.refcount: ImageBlob.refcount + 1}, synchronize_session=False)
+    )
+    return updated > 0
 
 
-def get_predictions_by_label(db: Session, label: str, username: str):
+def release_blobs(db: Session, refs) -> tuple[list[str], set[str]]:
+    """
+    Drop one reference per occurrence of a blob ref in `refs` (refs that are
+    not blobs, e.g. pre-dedup originals, are ignored). Blobs that reach zero
+    are deleted. Returns (freed refs, all blob refs seen); caller commits.
+    """
+    per_ref = defaultdict(int)
+    for ref in refs:
+        if ref:
+            per_ref[ref] += 1
+    if not per_ref:
+        return [], set()
+    # decrement first so the rows are locked before we read the new counts
+    by_count = defaultdict(list)
+    for ref, n in per_ref.items():
+        by_count[n].append(ref)
+    for n, group in by_count.items():
+        db.query(ImageBlob).filter(ImageBlob.ref.in_(group)).update(
+            {ImageBlob.refcount: ImageBlob.refcount - n}, synchronize_session=False
+        )
     rows = (
-        db.query(PredictionSession.uid, PredictionSession.timestamp)
-        .join(DetectionObject, PredictionSession.uid == DetectionObject.prediction_uid)
-        .filter(DetectionObject.label == label, PredictionSession.username == username)
-        .distinct()
+        db.query(ImageBlob.ref, ImageBlob.refcount)
+        .filter(ImageBlob.ref.in_(list(per_ref)))
         .all()
     )
-    return rows
+    freed = [ref for ref, refcount in rows if refcount <= 0]
+    if freed:
+        db.query(ImageBlob).filter(ImageBlob.ref.in_(freed)).delete(
+            synchronize_session=False
+        )
+    return freed, {ref for ref, _ in rows}
 
 
-def get_predictions_by_score(db: Session, min_score: float, username: str):
-    rows = (
-        db.query(
-            PredictionSession.uid, PredictionSession.timestamp, DetectionObject.score
+def add_pending_upload(
+    db: Session, local_path: str, key: str, uid: str | None = None
+) -> int | None:
+    """
+    Queue `local_path` for upload to `key` (caller commits). Returns the new
+    row id, or None if that file is already queued.
+    """
+    now = datetime.datetime.utcnow()
+    stmt = (
+        _upsert(db)(PendingUpload)
+        .values(
+            local_path=local_path,
+            key=key,
+            uid=uid,
+            attempts=0,
+            next_attempt_at=now,
+            created_at=now,
         )
-        .join(DetectionObject, PredictionSession.uid == DetectionObject.prediction_uid)
-        .filter(
-            DetectionObject.score >= min_score, PredictionSession.username == username
+        .on_conflict_do_nothing(index_elements=["local_path"])
+        .returning(PendingUpload.id)
+    )
+    return db.execute(stmt).scalar_one_or_none()
+
+
+def due_pending_uploads(db: Session, now: datetime.datetime, limit: int) -> list[int]:
+    return [
+        upload_id
+        for (upload_id,) in db.query(PendingUpload.id)
+        .filter(PendingUpload.next_attempt_at <= now)
+        .order_by(PendingUpload.next_attempt_at, PendingUpload.id)
+        .limit(limit)
+    ]
+
+
+def claim_pending_upload(
+    db: Session, upload_id: int, now: datetime.datetime, lease_seconds: float
+) -> PendingUpload | None:
+    """
+    Take a due queue row for one upload attempt (caller commits). Its
+    next_attempt_at moves `lease_seconds` ahead, so no other worker or
+    process picks it up meanwhile, and it comes due again if this one dies.
+    Returns None if the row is gone or another worker holds it.
+    """
+    claimed = (
+        db.query(PendingUpload)
+        .filter(PendingUpload.id == upload_id, PendingUpload.next_attempt_at <= now)
+        .update(
+            {"next_attempt_at": now + datetime.timedelta(seconds=lease_seconds)},
+            synchronize_session=False,
+        )
+    )
+    return db.get(PendingUpload, upload_id) if claimed else None
+
+
+def queued_upload_keys(db: Session, keys) -> set[str]:
+    """The S3 keys among `keys` that a queued upload will write."""
+    keys = list(keys)
+    if not keys:
+        return set()
+    rows = db.query(PendingUpload.key).filter(PendingUpload.key.in_(keys))
+    return {key for (key,) in rows}
+
+
+def has_pending_uploads(db: Session, *local_paths: str) -> bool:
+    """True while any of these staged files still waits for its S3 upload."""
+    paths = [p for p in local_paths if p]
+    if not paths:
+        return False
+    return db.query(exists().where(PendingUpload.local_path.in_(paths))).scalar()
+
+
+def confirm_upload(db: Session, upload: PendingUpload) -> tuple[list[str], bool] | None:
+    """
+    Switch every ref to `upload.local_path` over to `upload.key` and drop the
+    queue row (caller commits). Returns (uids of the sessions switched,
+    whether anything still references the file; False if it was deleted
+    meanwhile), or None if the queue row is already gone: another worker
+    confirmed or dropped it, and the caller must roll back.
+    """
+    local, key = upload.local_path, upload.key
+    blobs = 0
+    if upload.uid:
+        column = PredictionSession.predicted_image
+        sessions = db.query(PredictionSession).filter(
+            PredictionSession.uid == upload.uid, column == local
+        )
+    else:
+        # blob row first: it serialises with acquire_blob / release_blobs
+        blobs = (
+            db.query(ImageBlob)
+            .filter(ImageBlob.ref == local)
+            .update({"ref": key}, synchronize_session=False)
         )
+        column = PredictionSession.original_image
+        sessions = db.query(PredictionSession).filter(column == local)
+    uids = [uid for (uid,) in sessions.with_entities(PredictionSession.uid)]
+    if uids:
+        sessions.update({column: key}, synchronize_session=False)
+    owned = (
+        db.query(PendingUpload)
+        .filter(PendingUpload.id == upload.id)
+        .delete(synchronize_session=False)
+    )
+    if not owned:
+        return None
+    return uids, bool(uids or blobs)
+
+
+def rebuild_rollups(db: Session, username: str | None = None):
+    """Recompute rollups from the raw tables (backfill / repair)."""
+    day = func.date(PredictionSession.timestamp)
+    sessions = db.query(PredictionSession).filter(
+        PredictionSession.username.isnot(None)
+    )
+    label_rollups = db.query(LabelDailyRollup)
+    prediction_rollups = db.query(PredictionDailyRollup)
+    if username:
+        sessions = sessions.filter(PredictionSession.username == username)
+        label_rollups = label_rollups.filter_by(username=username)
+        prediction_rollups = prediction_rollups.filter_by(username=username)
+    label_rollups.delete(synchronize_session=False)
+    prediction_rollups.delete(synchronize_session=False)
+
+    per_day = (
+        sessions.with_entities(PredictionSession.username, day, func.count())
+        .group_by(PredictionSession.username, day)
+        .all()
+    )
+    per_label = (
+        sessions.join(
+            DetectionObject, DetectionObject.prediction_uid == PredictionSession.uid
+        )
+        .with_entities(
+            PredictionSession.username,
+            day,
+            DetectionObject.label,
+            func.count(),
+            func.coalesce(func.sum(DetectionObject.score), 0.0),
+        )
+        .group_by(PredictionSession.username, day, DetectionObject.label)
         .all()
     )
-    return rows
+    db.add_all(
+        PredictionDailyRollup(username=u, day=_as_date(d), prediction_count=n)
+        for u, d, n in per_day
+    )
+    db.add_all(
+        LabelDailyRollup(
+            username=u,
+            day=_as_date(d),
+            label=label,
+            detection_count=n,
+            score_sum=score_sum,
+        )
+        for u, d, label, n, score_sum in per_label
+    )
+    db.commit()
+    return len(per_day)
 
 
-def user_owns_image(db: Session, image_path: str, column: str, username: str):
-    filter_kwargs = {column: image_path, "username": username}
-    return db.query(PredictionSession).filter_by(**filter_kwargs).first()
+def backfill_session_summaries(db: Session, batch_size: int = 1000) -> int:
+    """Recompute detection_count / max_score / labels for every session."""
+    done, last_uid = 0, ""
+    while True:
+        uids = [
+            uid
+            for (uid,) in db.query(PredictionSession.uid)
+            .filter(PredictionSession.uid > last_uid)
+            .order_by(PredictionSession.uid)
+            .limit(batch_size)
+        ]
+        if not uids:
+            return done
+        detections = defaultdict(list)
+        for uid, label, score in db.query(
+            DetectionObject.prediction_uid, DetectionObject.label, DetectionObject.score
+        ).filter(DetectionObject.prediction_uid.in_(uids)):
+            detections[uid].append((label, score))
+        db.bulk_update_mappings(
+            PredictionSession,
+            [dict(uid=uid, **session_summary(detections[uid])) for uid in uids],
+        )
+        db.commit()
+        done += len(uids)
+        last_uid = uids[-1]
 
 
-def count_predictions_in_last_week(db: Session, username: str, since: datetime):
-    return (
-        db.query(PredictionSession)
-        .filter(
-            PredictionSession.timestamp >= since, PredictionSession.username == username
+def rebuild_session_labels(db: Session, batch_size: int = 1000) -> int:
+    """Rebuild the SessionLabel postings from detections (backfill / repair)."""
+    db.query(SessionLabel).delete(synchronize_session=False)
+    done, last_uid = 0, ""
+    while True:
+        sessions = (
+            db.query(
+                PredictionSession.uid,
+                PredictionSession.username,
+                PredictionSession.timestamp,
+            )
+            .filter(PredictionSession.uid > last_uid)
+            .order_by(PredictionSession.uid)
+            .limit(batch_size)
+            .all()
         )
-        .count()
+        if not sessions:
+            db.commit()
+            return done
+        detections = defaultdict(list)
+        for uid, label, score in db.query(
+            DetectionObject.prediction_uid, DetectionObject.label, DetectionObject.score
+        ).filter(DetectionObject.prediction_uid.in_([s.uid for s in sessions])):
+            detections[uid].append((label, score))
+        for uid, username, timestamp in sessions:
+            db.add_all(session_label_rows(uid, username, timestamp, detections[uid]))
+        db.commit()
+        done += len(sessions)
+        last_uid = sessions[-1].uid
+
+
+def _as_date(value) -> datetime.date:
+    # func.date() comes back as 'YYYY-MM-DD' text on SQLite, as a date on Postgres
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value)
+    return value
+
+
+LabelRollup = namedtuple("LabelRollup", "label detection_count score_sum")
+
+
+def _next_midnight(since: datetime.datetime) -> datetime.datetime:
+    """
+    Rollup days are UTC dates, so a rolling window starting at `since` is
+    the whole days after since.date() plus [since, _next_midnight(since)),
+    which is read from the raw rows of that one day.
+    """
+    return datetime.datetime.combine(
+        since.date() + datetime.timedelta(days=1), datetime.time()
     )
 
 
-def get_recent_labels(db: Session, username: str, since: datetime):
-    subquery = (
-        db.query(PredictionSession.uid)
+def get_label_rollups(db: Session, username: str, since: datetime.datetime):
+    """(label, detection_count, score_sum) per label with timestamp >= `since`."""
+    midnight = _next_midnight(since)
+    days = (
+        db.query(
+            LabelDailyRollup.label,
+            func.sum(LabelDailyRollup.detection_count),
+            func.sum(LabelDailyRollup.score_sum),
+        )
         .filter(
-            PredictionSession.timestamp >= since, PredictionSession.username == username
+            LabelDailyRollup.username == username,
+            LabelDailyRollup.day > since.date(),
         )
-        .subquery()
+        .group_by(LabelDailyRollup.label)
     )
+    head = (
+        db.query(
+            DetectionObject.label,
+            func.count(DetectionObject.id),
+            func.sum(DetectionObject.score),
+        )
+        .join(
+            PredictionSession, DetectionObject.prediction_uid == PredictionSession.uid
+        )
+        .filter(
+            PredictionSession.username == username,
+            PredictionSession.timestamp >= since,
+            PredictionSession.timestamp < midnight,
+        )
+        .group_by(DetectionObject.label)
+    )
+    totals = defaultdict(lambda: [0, 0.0])
+    for label, count, score_sum in [*days, *head]:
+        totals[label][0] += int(count or 0)
+        totals[label][1] += float(score_sum or 0.0)
+    return [
+        LabelRollup(label, count, score_sum)
+        for label, (count, score_sum) in totals.items()
+        if count > 0
+    ]
 
-    rows = (
-        db.query(DetectionObject.label)
-        .filter(DetectionObject.prediction_uid.in_(subquery))
-        .distinct()
-        .all()
+
+def _after_keyset(query, columns, after):
+    """Keyset filter: rows strictly after `after` in (columns...) order."""
+    if after is None:
+        return query
+    return query.filter(tuple_(*columns) > tuple_(*after))
+
+
+def _predictions_by_label_query(db: Session, label: str, username: str):
+    return db.query(PredictionSession.uid, PredictionSession.timestamp).filter(
+        PredictionSession.username == username,
+        PredictionSession.labels.contains(f",{label},", autoescape=True),
     )
 
-    return [label for (label,) in rows]
+
+def get_predictions_by_label(
+    db: Session, label: str, username: str, limit: int | None = None, after=None
+):
+    keyset = (PredictionSession.timestamp, PredictionSession.uid)
+    query = _predictions_by_label_query(db, label, username)
+    query = _after_keyset(query, keyset, after).order_by(*keyset)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def iter_predictions_by_label(
+    db: Session, label: str, username: str, batch_size: int = 500
+):
+    """Server-side cursor over every match, `batch_size` rows fetched at a time."""
+    keyset = (PredictionSession.timestamp, PredictionSession.uid)
+    query = _predictions_by_label_query(db, label, username).order_by(*keyset)
+    return query.yield_per(batch_size)
+
+
+def _predictions_by_score_query(db: Session, min_score: float, username: str):
+    # one row per session, scored by its best detection
+    return db.query(
+        PredictionSession.uid, PredictionSession.timestamp, PredictionSession.max_score
+    ).filter(
+        PredictionSession.username == username,
+        PredictionSession.max_score >= min_score,
+    )
+
+
+def get_predictions_by_score(
+    db: Session,
+    min_score: float,
+    username: str,
+    limit: int | None = None,
+    after=None,
+):
+    keyset = (PredictionSession.timestamp, PredictionSession.uid)
+    query = _predictions_by_score_query(db, min_score, username)
+    query = _after_keyset(query, keyset, after).order_by(*keyset)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def iter_predictions_by_score(
+    db: Session, min_score: float, username: str, batch_size: int = 500
+):
+    keyset = (PredictionSession.timestamp, PredictionSession.uid)
+    query = _predictions_by_score_query(db, min_score, username).order_by(*keyset)
+    return query.yield_per(batch_size)
+
+
+def user_owns_image(db: Session, image_path, column: str, username: str):
+    """
+    image_path: one ref or several spellings of it (see storage.layouts).
+    Returns (uid, ref) of the user's matching session, or None.
+
+    Both lookups are indexed: predicted images are named <uid>.png (locally
+    and as <chat_id>/predicted/<uid>.png in S3), so the primary key finds the
+    session; originals go through ix_prediction_sessions_original_image
+    (shared blobs have many sessions).
+    """
+    paths = [image_path] if isinstance(image_path, str) else list(image_path)
+    ref = getattr(PredictionSession, column)
+    q = db.query(PredictionSession.uid, ref).filter(
+        PredictionSession.username == username
+    )
+    if column == "predicted_image":
+        name = os.path.basename(paths[0])
+        row = q.filter(PredictionSession.uid == os.path.splitext(name)[0]).first()
+        return row if row and os.path.basename(row[1] or "") == name else None
+    return q.filter(ref.in_(paths)).first()
+
+
+def count_predictions_in_last_week(db: Session, username: str, since: datetime):
+    return count_recent_predictions(db, username, since)
+
+
+def get_recent_labels(db: Session, username: str, since: datetime):
+    return [
+        label for label, _count, _score_sum in get_label_rollups(db, username, since)
+    ]
 
 
 def get_prediction_image_path(db: Session, uid: str, username: str) -> str | None:
@@ -113,7 +702,38 @@ def get_prediction_by_uid_and_user(db: Session, uid: str, username: str):
     return db.query(PredictionSession).filter_by(uid=uid, username=username).first()
 
 
+def find_sessions_to_delete(
+    db: Session,
+    username: str,
+    uids: list[str] | None = None,
+    older_than: datetime.datetime | None = None,
+    label: str | None = None,
+    limit: int | None = None,
+):
+    """The user's sessions matching every given filter, oldest first."""
+    query = db.query(
+        PredictionSession.uid,
+        PredictionSession.timestamp,
+        PredictionSession.original_image,
+        PredictionSession.predicted_image,
+        PredictionSession.owns_original,
+    ).filter(PredictionSession.username == username)
+    if uids:
+        query = query.filter(PredictionSession.uid.in_(uids))
+    if older_than is not None:
+        query = query.filter(PredictionSession.timestamp < older_than)
+    if label:
+        query = query.filter(
+            PredictionSession.labels.contains(f",{label},", autoescape=True)
+        )
+    query = query.order_by(PredictionSession.timestamp, PredictionSession.uid)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
 def delete_detection_objects_by_uid(db: Session, uid: str):
+    db.query(SessionLabel).filter_by(uid=uid).delete()
     db.query(DetectionObject).filter_by(prediction_uid=uid).delete()
 
 
@@ -121,29 +741,285 @@ def delete_prediction_session(db: Session, uid: str, username: str):
     db.query(PredictionSession).filter_by(uid=uid, username=username).delete()
 
 
-def count_recent_predictions(db: Session, username: str, since: datetime) -> int:
-    return (
-        db.query(PredictionSession)
+def count_recent_predictions(
+    db: Session, username: str, since: datetime.datetime
+) -> int:
+    """Sessions with timestamp >= `since`: daily rollups plus the first day."""
+    midnight = _next_midnight(since)
+    total = (
+        db.query(func.sum(PredictionDailyRollup.prediction_count))
+        .filter(
+            PredictionDailyRollup.username == username,
+            PredictionDailyRollup.day > since.date(),
+        )
+        .scalar()
+    )
+    head = (
+        db.query(func.count(PredictionSession.uid))
         .filter(
-            PredictionSession.timestamp >= since, PredictionSession.username == username
+            PredictionSession.username == username,
+            PredictionSession.timestamp >= since,
+            PredictionSession.timestamp < midnight,
+        )
+        .scalar()
+    )
+    return int(total or 0) + int(head or 0)
+
+
+# ---------- boolean label search ----------
+
+
+# use a union of postings as the candidate set only when it is at most
+# 1/CANDIDATE_SET_RATIO of the user's sessions
+CANDIDATE_SET_RATIO = 10
+
+
+def _label_threshold(label: str, thresholds: dict):
+    return thresholds.get(label, thresholds.get("*"))
+
+
+def _label_term(node_label: str, min_scores: dict, min_counts: dict):
+    """Correlated predicate: the outer session has `label` (above thresholds)."""
+    min_score = _label_threshold(node_label, min_scores)
+    min_count = _label_threshold(node_label, min_counts)
+    if min_score is not None and min_count is not None and min_count > 1:
+        # "n detections scoring >= s" isn't in the postings; count them from
+        # ix_detection_objects_uid_label_score without touching the table
+        counted = (
+            select(func.count())
+            .where(
+                DetectionObject.prediction_uid == PredictionSession.uid,
+                DetectionObject.label == node_label,
+                DetectionObject.score >= min_score,
+            )
+            .scalar_subquery()
         )
-        .count()
+        return counted >= min_count
+    conditions = [
+        SessionLabel.uid == PredictionSession.uid,
+        SessionLabel.label == node_label,
+    ]
+    if min_score is not None:
+        conditions.append(SessionLabel.max_score >= min_score)
+    if min_count is not None:
+        conditions.append(SessionLabel.detection_count >= min_count)
+    return exists().where(*conditions)
+
+
+def _search_clause(tree, min_scores: dict, min_counts: dict):
+    kind, value = tree
+    if kind == "label":
+        return _label_term(value, min_scores, min_counts)
+    if kind == "not":
+        return not_(_search_clause(value, min_scores, min_counts))
+    clauses = [_search_clause(node, min_scores, min_counts) for node in value]
+    return and_(*clauses) if kind == "and" else or_(*clauses)
+
+
+def tree_labels(tree) -> set[str]:
+    """Every label named in a parsed search expression."""
+    kind, value = tree
+    if kind == "label":
+        return {value}
+    if kind == "not":
+        return tree_labels(value)
+    return set().union(*(tree_labels(node) for node in value))
+
+
+def _driver_labels(tree, counts: dict):
+    """
+    Cheapest set of labels every match carries at least one of, with its
+    estimated detection count, or None when no such set exists (pure NOT).
+    """
+    kind, value = tree
+    if kind == "label":
+        return {value}, counts.get(value) or 0
+    if kind == "not":
+        return None
+    options = [_driver_labels(node, counts) for node in value]
+    if kind == "and":
+        options = [o for o in options if o is not None]
+        return min(options, key=lambda o: o[1]) if options else None
+    if any(o is None for o in options):
+        return None
+    return set().union(*(o[0] for o in options)), sum(o[1] for o in options)
+
+
+def _label_counts(db: Session, username: str, labels, since=None) -> dict:
+    """Detections per label for the user, from the rollups (a selectivity hint)."""
+    query = db.query(
+        LabelDailyRollup.label, func.sum(LabelDailyRollup.detection_count)
+    ).filter(
+        LabelDailyRollup.username == username,
+        LabelDailyRollup.label.in_(list(labels)),
     )
+    if since is not None:
+        query = query.filter(LabelDailyRollup.day >= since.date())
+    return dict(query.group_by(LabelDailyRollup.label).all())
 
 
-def get_detection_objects_for_recent_predictions(
-    db: Session, username: str, since: datetime
+def _search_query(
+    db: Session,
+    username: str,
+    tree,
+    min_scores: dict,
+    min_counts: dict,
+    since: datetime.datetime | None = None,
+    until: datetime.datetime | None = None,
 ):
-    subquery = (
-        db.query(PredictionSession.uid)
-        .filter(
-            PredictionSession.timestamp >= since, PredictionSession.username == username
+    """
+    (query, keyset columns) for a label expression.
+
+    When every match must carry some label, the scan is driven by the rarest
+    such label's postings (ix_session_labels_user_label_ts, already in
+    (timestamp, uid) order) and the rest of the expression is checked with
+    per-session index probes; otherwise it walks the user's sessions.
+    """
+    columns = (
+        PredictionSession.uid,
+        PredictionSession.timestamp,
+        PredictionSession.labels,
+    )
+    clause = _search_clause(tree, min_scores, min_counts)
+    labels = tree_labels(tree)
+    drivers = _driver_labels(tree, {})
+    if drivers is not None and len(labels) > 1:
+        drivers = _driver_labels(tree, _label_counts(db, username, labels, since))
+    postings = aliased(SessionLabel)
+    if drivers is not None and len(drivers[0]) == 1:
+        query = (
+            db.query(*columns)
+            .select_from(postings)
+            .join(PredictionSession, PredictionSession.uid == postings.uid)
+            .filter(
+                postings.username == username,
+                postings.label == next(iter(drivers[0])),
+                clause,
+            )
+        )
+        timestamp, keyset = postings.timestamp, (postings.timestamp, postings.uid)
+    else:
+        query = db.query(*columns).filter(
+            PredictionSession.username == username, clause
         )
-        .subquery()
+        if drivers is not None and drivers[1] * CANDIDATE_SET_RATIO < (
+            count_recent_predictions(db, username, since or datetime.datetime.min)
+        ):
+            # selective OR of several drivers: candidates are the union of their
+            # postings. Common labels are cheaper to find by walking sessions,
+            # which stops as soon as a page is full.
+            candidates = select(postings.uid).where(
+                postings.username == username, postings.label.in_(drivers[0])
+            )
+            if since is not None:
+                candidates = candidates.where(postings.timestamp >= since)
+            if until is not None:
+                candidates = candidates.where(postings.timestamp < until)
+            query = query.filter(PredictionSession.uid.in_(candidates))
+        timestamp = PredictionSession.timestamp
+        keyset = (PredictionSession.timestamp, PredictionSession.uid)
+    if since is not None:
+        query = query.filter(timestamp >= since)
+    if until is not None:
+        query = query.filter(timestamp < until)
+    return query, keyset
+
+
+def search_predictions(
+    db: Session,
+    username: str,
+    tree,
+    min_scores: dict | None = None,
+    min_counts: dict | None = None,
+    since: datetime.datetime | None = None,
+    until: datetime.datetime | None = None,
+    limit: int | None = None,
+    after=None,
+):
+    """
+    The user's sessions matching a parsed label expression (see
+    services.search_service.parse_query), as (uid, timestamp, labels) rows.
+    """
+    query, keyset = _search_query(
+        db, username, tree, min_scores or {}, min_counts or {}, since, until
     )
+    query = _after_keyset(query, keyset, after).order_by(*keyset)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
 
-    return (
-        db.query(DetectionObject.label, DetectionObject.score)
-        .filter(DetectionObject.prediction_uid.in_(subquery))
-        .all()
+
+def iter_search_predictions(
+    db: Session,
+    username: str,
+    tree,
+    min_scores: dict | None = None,
+    min_counts: dict | None = None,
+    since: datetime.datetime | None = None,
+    until: datetime.datetime | None = None,
+    batch_size: int = 500,
+):
+    query, keyset = _search_query(
+        db, username, tree, min_scores or {}, min_counts or {}, since, until
+    )
+    return query.order_by(*keyset).yield_per(batch_size)
+
+
+# ---------- export ----------
+
+
+def iter_export_rows(
+    db: Session,
+    username: str,
+    since: datetime.datetime | None = None,
+    until: datetime.datetime | None = None,
+    label: str | None = None,
+    batch_size: int = 10_000,
+):
+    """
+    One row per detection (sessions without detections get one row of NULLs)
+    as lists of `batch_size` tuples, read through a server-side cursor:
+    (uid, timestamp, original_image, predicted_image, label, score, box).
+
+    On SQLite the timestamp comes back as its stored ISO text: parsing a
+    million of them into datetimes costs more than the rest of the export.
+    """
+    timestamp = PredictionSession.timestamp
+    if db.get_bind().dialect.name == "sqlite":
+        timestamp = type_coerce(timestamp, String)
+    query = (
+        select(
+            PredictionSession.uid,
+            timestamp,
+            PredictionSession.original_image,
+            PredictionSession.predicted_image,
+            DetectionObject.label,
+            DetectionObject.score,
+            DetectionObject.box,
+        )
+        .select_from(PredictionSession)
+        .outerjoin(
+            DetectionObject, DetectionObject.prediction_uid == PredictionSession.uid
+        )
+        .where(PredictionSession.username == username)
+        # detections stay grouped under their session; their order within it
+        # follows the index, which avoids a sort over the whole export
+        .order_by(PredictionSession.timestamp, PredictionSession.uid)
+    )
+    if since is not None:
+        query = query.where(PredictionSession.timestamp >= since)
+    if until is not None:
+        query = query.where(PredictionSession.timestamp < until)
+    if label is not None:
+        query = query.where(
+            PredictionSession.labels.contains(f",{label},", autoescape=True),
+            DetectionObject.label == label,
+        )
+    # Core, not ORM: plain rows skip the ORM loading layer (~2x faster here)
+    result = (
+        db.connection()
+        .execution_options(stream_results=True, max_row_buffer=batch_size)
+        .execute(query)
     )
+    while rows := result.fetchmany(batch_size):
+        yield rows
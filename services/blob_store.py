@@ -0,0 +1,95 @@
+# services/blob_store.py
+"""
+Content-addressed originals (models.ImageBlob). Each distinct upload is
+stored once, named by its SHA-256: <UPLOAD_DIR>/ab/cd/<sha256><ext> on local
+disk. In S3 mode that file is staged and uploaded write-behind to
+originals/<sha256><ext> (services.s3_uploader), after which the blob's ref is
+the key. Every session that uploaded the same bytes points at that one ref;
+the blob's refcount tracks them.
+
+Storage and rows stay consistent because both directions touch local
+storage while the blob row is locked (row lock on Postgres, the writer gate
+on SQLite):
+- store_original takes the reference first, then makes sure the bytes exist;
+- release_originals drops references and removes zero-count local files
+  before the caller commits.
+So a re-upload of the same bytes waits for a concurrent release to finish
+and then writes the file again, instead of pointing at a file being removed.
+
+Freed S3 objects are removed after commit instead, so no network round trip
+runs while the lock is held. A re-upload in between stages a new local file
+and queues it for the same key; still_freed() leaves such keys alone (the
+upload writes the same bytes there).
+"""
+
+import hashlib
+import os
+import threading
+
+from infra import metrics
+from queries import acquire_blob, queued_upload_keys, release_blobs
+from services.storage import is_s3_ref, remove_refs, shard_path
+
+S3_PREFIX = "originals"
+
+
+def content_hash(data: bytes | memoryview) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def blob_key(local_ref: str) -> str:
+    """S3 key a staged blob file is uploaded to."""
+    return f"{S3_PREFIX}/{os.path.basename(local_ref)}"
+
+
+def _write_local(path: str, data: bytes | memoryview) -> bool:
+    """Write `path` atomically unless it exists. Returns True if written."""
+    if os.path.exists(path):
+        # keep the mtime sweep (infra.purge_old_uploads) off shared blobs
+        os.utime(path)
+        return False
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as out:
+        out.write(data)
+    os.replace(tmp, path)
+    return True
+
+
+def store_original(db, data: bytes | memoryview, ext: str, upload_dir: str) -> str:
+    """
+    Reference (and store, if new) the blob for `data`; returns its ref.
+    Runs inside the caller's transaction: commit with the session row.
+    """
+    digest = content_hash(data)
+    ref = acquire_blob(db, digest, shard_path(upload_dir, digest + ext), len(data))
+    # an S3 ref means the upload was confirmed: nothing to write
+    written = not is_s3_ref(ref) and _write_local(ref, data)
+    if written:
+        metrics.incr("blobs.stored")
+        metrics.incr("blobs.bytes_stored", len(data))
+    else:
+        metrics.incr("blobs.deduplicated")
+        metrics.incr("blobs.bytes_deduplicated", len(data))
+    return ref
+
+
+def release_originals(db, refs) -> tuple[dict, set[str], list[str]]:
+    """
+    Release the blobs behind deleted sessions' original refs and remove the
+    local files of those that reached zero. Call before commit. Returns
+    ({ref: error} for freed files that could not be removed, blob refs,
+    freed S3 keys). After commit the caller removes the S3 keys that are
+    still_freed(), and everything not in the blob set, as before.
+    """
+    freed, blobs = release_blobs(db, refs)
+    local = [ref for ref in freed if not is_s3_ref(ref)]
+    errors = remove_refs(local) if local else {}
+    metrics.incr("blobs.freed", len(freed))
+    return errors, blobs, [ref for ref in freed if is_s3_ref(ref)]
+
+
+def still_freed(db, keys) -> list[str]:
+    """Freed S3 blob keys that no re-upload has queued since the release."""
+    queued = queued_upload_keys(db, keys)
+    return [key for key in keys if key not in queued]
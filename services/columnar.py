@@ -0,0 +1,189 @@
+# services/columnar.py
+"""
+Column-oriented encodings of prediction rows, used in two places:
+
+- write_rows: whole files for the retention archive (infra.purge_old_uploads_db
+  writes each expiring batch before deleting it). Parquet (zstd) when pyarrow
+  is installed, gzip'd CSV otherwise; files appear atomically.
+- iter_encoded: GET /predictions/export (services.export_service) streams
+  Parquet, an Arrow IPC stream or CSV one record batch at a time.
+
+pyarrow is an optional dependency and is only imported when a Parquet or
+Arrow encoding is actually produced.
+"""
+
+import csv
+import gzip
+import io
+import os
+from datetime import date, datetime
+
+PARQUET = "parquet"
+ARROW = "arrow"
+CSV = "csv"
+# archive files (write_rows)
+EXTENSIONS = {PARQUET: ".parquet", CSV: ".csv.gz"}
+# streamed exports (iter_encoded)
+MEDIA_TYPES = {
+    PARQUET: "application/vnd.apache.parquet",
+    ARROW: "application/vnd.apache.arrow.stream",
+    CSV: "text/csv; charset=utf-8",
+}
+STREAM_EXTENSIONS = {PARQUET: ".parquet", ARROW: ".arrows", CSV: ".csv"}
+
+
+def have_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def default_format() -> str:
+    return PARQUET if have_pyarrow() else CSV
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _write_parquet(path: str, columns: list[str], rows: list[tuple]):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.table({name: [row[i] for row in rows] for i, name in enumerate(columns)})
+    pq.write_table(table, path, compression="zstd")
+
+
+def _write_csv_gz(path: str, columns: list[str], rows: list[tuple]):
+    with gzip.open(path, "wt", newline="", encoding="utf-8") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(columns)
+        writer.writerows([_csv_value(v) for v in row] for row in rows)
+
+
+def write_rows(
+    path_stem: str, columns: list[str], rows: list[tuple], fmt: str | None = None
+) -> str:
+    """
+    Write `rows` to `path_stem` + the format's extension and return the path.
+    The file appears atomically (temp file + os.replace), so a crash never
+    leaves a truncated archive behind.
+    """
+    fmt = fmt or default_format()
+    path = path_stem + EXTENSIONS[fmt]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    try:
+        (_write_parquet if fmt == PARQUET else _write_csv_gz)(tmp, columns, rows)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+# ---------- streaming encoders (record batch at a time) ----------
+
+
+class _Drain:
+    """Write-only file object that hands its bytes back between batches."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks = []
+        return out
+
+
+def _arrow_schema(schema: list[tuple[str, str]]):
+    import pyarrow as pa
+
+    types = {
+        "string": pa.string(),
+        "float": pa.float64(),
+        "int": pa.int64(),
+        "timestamp": pa.timestamp("us"),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in schema])
+
+
+def _arrow_column(pa, values, arrow_type):
+    if pa.types.is_timestamp(arrow_type) and any(isinstance(v, str) for v in values):
+        # ISO text (SQLite): let Arrow parse it, much faster than per-row Python
+        return pa.array(values, type=pa.string()).cast(arrow_type)
+    return pa.array(values, type=arrow_type)
+
+
+def iter_encoded(fmt: str, schema: list[tuple[str, str]], batches):
+    """
+    Encode an iterable of row batches (lists of tuples in `schema` order) into
+    `fmt`, yielding bytes after every batch so only one batch is in memory.
+    Parquet gets one row group per batch; Arrow is the IPC stream format.
+    """
+    if fmt == CSV:
+        yield from _iter_csv([name for name, _ in schema], batches)
+        return
+
+    import pyarrow as pa
+
+    arrow_schema = _arrow_schema(schema)
+    sink = _Drain()
+    if fmt == PARQUET:
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(sink, arrow_schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(sink, arrow_schema)
+    try:
+        for rows in batches:
+            columns = [
+                _arrow_column(pa, col, field.type)
+                for col, field in zip(zip(*rows), arrow_schema)
+            ]
+            writer.write_table(pa.Table.from_arrays(columns, schema=arrow_schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def _iter_csv(columns: list[str], batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for rows in batches:
+        # csv writes None as "" and datetimes as "YYYY-MM-DD HH:MM:SS[.ffffff]"
+        writer.writerows(rows)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
@@ -4,6 +4,6 @@ from queries import count_predictions_in_last_week
 
 
 def get_prediction_count_service(username: str, db: Session):
-    one_week_ago = datetime.now() - timedelta(days=7)
+    one_week_ago = datetime.utcnow() - timedelta(days=7)
     count = count_predictions_in_last_week(db, username, one_week_ago)
     return {"count": count}
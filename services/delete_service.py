@@ -1,11 +1,21 @@
-import os
+from datetime import datetime
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
+from db import mark_write
+from infra import prediction_cache, quota_counters
 from queries import (
     get_prediction_by_uid_and_user,
     delete_detection_objects_by_uid,
     delete_prediction_session,
+    delete_sessions,
+    find_sessions_to_delete,
+    remove_prediction_rollups,
 )
+from services.blob_store import release_originals, still_freed
+from services.storage import owned_refs, remove_refs
+from services.validators import as_naive_utc
+
+BULK_DELETE_MAX = 1000
 
 
 def delete_prediction_service(uid: str, username: str, db: Session):
@@ -13,20 +23,88 @@ def delete_prediction_service(uid: str, username: str, db: Session):
     if not prediction:
         raise HTTPException(status_code=404, detail="Prediction not found")
 
-    # Delete detection objects and session
+    # Delete detection objects and session (rollups updated in the same txn)
+    remove_prediction_rollups(db, uid)
     delete_detection_objects_by_uid(db, uid)
     delete_prediction_session(db, uid, username)
+    # a shared original only goes when its last session does (before commit)
+    refs = owned_refs(prediction)
+    _, blobs, freed = release_originals(db, [refs[0]])
 
     # Commit DB changes
     db.commit()
+    mark_write(username)
+    prediction_cache.invalidate(uid)
+    quota_counters.forget(username, prediction.timestamp, uid)
 
-    # Delete associated image files
-    for path_key in ["original_image", "predicted_image"]:
-        file_path = getattr(prediction, path_key)
-        if file_path and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except Exception as e:
-                print(f"Warning: Failed to delete {file_path} — {e}")
+    # Delete associated images (local files and/or S3 objects)
+    remove_refs([*still_freed(db, freed), *(ref for ref in refs if ref not in blobs)])
 
     return {"detail": f"Prediction {uid} deleted successfully."}
+
+
+def bulk_delete_predictions_service(
+    username: str,
+    db: Session,
+    uids: list[str] | None = None,
+    older_than: datetime | None = None,
+    label: str | None = None,
+):
+    if not (uids or older_than or label):
+        raise HTTPException(
+            status_code=400, detail="Provide uids and/or an older_than/label filter"
+        )
+    if uids and len(uids) > BULK_DELETE_MAX:
+        raise HTTPException(
+            status_code=400, detail=f"At most {BULK_DELETE_MAX} uids per request"
+        )
+
+    # one extra row tells us whether a filter matched more than we delete now
+    rows = find_sessions_to_delete(
+        db,
+        username,
+        uids=uids,
+        older_than=as_naive_utc(older_than),
+        label=label,
+        limit=BULK_DELETE_MAX + 1,
+    )
+    has_more = len(rows) > BULK_DELETE_MAX
+    rows = rows[:BULK_DELETE_MAX]
+
+    delete_sessions(db, [r.uid for r in rows])
+    refs = {r.uid: owned_refs(r) for r in rows}
+    storage_errors, blobs, freed = release_originals(
+        db, [original for original, _ in refs.values()]
+    )
+    db.commit()
+    mark_write(username)
+    prediction_cache.invalidate(*(r.uid for r in rows))
+    for r in rows:
+        quota_counters.forget(username, r.timestamp, r.uid)
+
+    storage_errors.update(
+        remove_refs(
+            [
+                *still_freed(db, freed),
+                *(ref for pair in refs.values() for ref in pair if ref not in blobs),
+            ]
+        )
+    )
+
+    results = []
+    for r in rows:
+        errors = {
+            ref: storage_errors[ref] for ref in refs[r.uid] if ref in storage_errors
+        }
+        item = {"uid": r.uid, "status": "deleted"}
+        if errors:
+            item["storage_errors"] = errors
+        results.append(item)
+    found = {r.uid for r in rows}
+    results.extend(
+        {"uid": uid, "status": "not_found"}
+        for uid in dict.fromkeys(uids or [])
+        if uid not in found
+    )
+
+    return {"deleted": len(rows), "has_more": has_more, "results": results}
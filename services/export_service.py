@@ -0,0 +1,93 @@
+# services/export_service.py
+import os
+import re
+from datetime import datetime
+from urllib.parse import quote
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from infra import metrics
+from queries import iter_export_rows
+from services import columnar
+from services.label_service import model
+from services.validators import as_naive_utc
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "10000"))
+EXPORT_SCHEMA = [
+    ("uid", "string"),
+    ("timestamp", "timestamp"),
+    ("original_image", "string"),
+    ("predicted_image", "string"),
+    ("label", "string"),
+    ("score", "float"),
+    ("box", "string"),
+]
+FORMATS = (columnar.PARQUET, columnar.ARROW, columnar.CSV)
+
+
+def _resolve_format(fmt: str | None) -> str:
+    if fmt is not None and fmt not in FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"format must be one of {', '.join(FORMATS)}"
+        )
+    if fmt == columnar.CSV or not columnar.have_pyarrow():
+        # Parquet / Arrow need pyarrow; without it every export is CSV
+        return columnar.CSV
+    return fmt or columnar.PARQUET
+
+
+def _content_disposition(filename: str) -> str:
+    """
+    Attachment header safe for any username: a quoted ASCII fallback with
+    everything outside [A-Za-z0-9._-] replaced, plus the exact name as an
+    RFC 5987 filename* for clients that understand it.
+    """
+    fallback = re.sub(r"[^A-Za-z0-9._-]", "_", filename)
+    encoded = quote(filename, safe="")
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{encoded}"
+
+
+def export_predictions_service(
+    username: str,
+    fmt: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    label: str | None = None,
+    bind=None,
+) -> StreamingResponse:
+    """
+    Stream the user's sessions and detections (one row per detection) in
+    EXPORT_BATCH_ROWS record batches pulled from a server-side cursor.
+    """
+    from db import SessionLocal
+
+    if label is not None and label not in model.names.values():
+        raise HTTPException(status_code=404, detail="Label not supported")
+    fmt = _resolve_format(fmt)
+    since, until = as_naive_utc(since), as_naive_utc(until)
+
+    def _counted(batches):
+        rows = 0
+        for batch in batches:
+            rows += len(batch)
+            yield batch
+        metrics.incr("export.rows", rows)
+
+    def _body():
+        with SessionLocal(**({"bind": bind} if bind is not None else {})) as db:
+            batches = iter_export_rows(
+                db, username, since, until, label, batch_size=EXPORT_BATCH_ROWS
+            )
+            yield from columnar.iter_encoded(fmt, EXPORT_SCHEMA, _counted(batches))
+
+    metrics.incr(f"export.{fmt}")
+    filename = f"predictions-{username}{columnar.STREAM_EXTENSIONS[fmt]}"
+    return StreamingResponse(
+        _body(),
+        media_type=columnar.MEDIA_TYPES[fmt],
+        headers={
+            "Content-Disposition": _content_disposition(filename),
+            "X-Export-Format": fmt,
+        },
+    )
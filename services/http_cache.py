@@ -0,0 +1,50 @@
+# services/http_cache.py
+"""
+Conditional GET helpers for immutable resources (predictions never change
+once written, and their image files are never rewritten under the same name).
+"""
+
+import hashlib
+
+from fastapi import Request, Response
+
+# private: responses are per-user (Basic auth); immutable: never revalidate
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# for representations that will still change once (refs of a session whose
+# S3 upload is pending): cacheable, but revalidated on every use
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def strong_etag(*parts: str) -> str:
+    """Strong validator derived from what identifies the representation."""
+    digest = hashlib.sha256("\0".join(parts).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def cache_headers(etag: str, vary: str | None = None, immutable: bool = True) -> dict:
+    headers = {
+        "ETag": etag,
+        "Cache-Control": (
+            IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+        ),
+    }
+    if vary:
+        headers["Vary"] = vary
+    return headers
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 prescribes for GET)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in header.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def not_modified(
+    etag: str, vary: str | None = None, immutable: bool = True
+) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, vary, immutable))
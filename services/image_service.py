@@ -1,47 +1,225 @@
 import os
+import stat
+import time
 from fastapi import HTTPException, Request
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, RedirectResponse
 from sqlalchemy.orm import Session
+from infra import prediction_cache
 from queries import get_prediction_image_path, user_owns_image
+from services.http_cache import cache_headers, etag_matches, not_modified, strong_etag
+from services.blob_store import S3_PREFIX
+from services.storage import is_s3_ref, layouts
+from services.thumbnails import (
+    derivative_cache,
+    media_type as derivative_media_type,
+    source_format,
+    wants_derivative,
+)
+
+
+def _spellings(path: str) -> tuple[str, ...]:
+    """The ref as given first, then its other layout (sharded / flat)."""
+    return tuple(dict.fromkeys((path, *layouts(path))))
+
+
+def _stat_first(paths) -> tuple[str, os.stat_result] | tuple[None, None]:
+    """First spelling that is a regular file, with its stat (one syscall each)."""
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if stat.S_ISREG(st.st_mode):
+            return path, st
+    return None, None
+
+
+def _image_paths(image_type: str, filename: str) -> tuple[str, ...]:
+    # new files are sharded; refs from before the layout change may be flat
+    return tuple(dict.fromkeys(layouts(os.path.join("uploads", image_type, filename))))
+
+
+def _owned_ref(db: Session, image_type: str, filename: str, username: str):
+    """The caller's stored ref behind /image/{type}/{filename}, or None."""
+    column = f"{image_type}_image"
+    # predicted images are named <uid><ext>: a hot cache entry answers
+    # without the DB (originals are named by content hash and fall through)
+    cached = prediction_cache.get_entry(os.path.splitext(filename)[0])
+    if cached is not None:
+        ref = cached[1].get(column)
+        if ref and os.path.basename(ref) == filename:
+            return ref if cached[0] == username else None
+    candidates = _image_paths(image_type, filename)
+    blob_key = f"{S3_PREFIX}/{filename}"
+    if image_type == "original" and is_s3_ref(blob_key):
+        candidates += (blob_key,)
+    row = user_owns_image(db, candidates, column, username)
+    if not row:
+        return None
+    return getattr(row, column, None) or candidates[0]
 
 
 def get_image_path_and_validate(
     image_type: str, filename: str, username: str, db: Session
-) -> str:
+) -> tuple[str, os.stat_result | None]:
+    """(local path, stat) or, for an image stored in S3, (key, None)."""
     if image_type not in ["original", "predicted"]:
         raise HTTPException(status_code=400, detail="Invalid image type")
 
-    path = os.path.join("uploads", image_type, filename)
+    # ownership first (indexed, see queries.user_owns_image): other users'
+    # files answer the same whether or not they exist, and cost no stat
+    ref = _owned_ref(db, image_type, filename, username)
+    if ref is None:
+        raise HTTPException(status_code=404, detail="Access denied")
+    if is_s3_ref(ref):
+        return ref, None
 
-    if not os.path.exists(path):
+    path, st = _stat_first(_image_paths(image_type, filename))
+    if path is None:
         raise HTTPException(status_code=404, detail="Image not found")
 
-    column = f"{image_type}_image"
-    record = user_owns_image(db, path, column, username)
+    return path, st
 
-    if not record:
-        raise HTTPException(status_code=404, detail="Access denied")
 
+def _redirect_to_s3(key: str, vary: str | None = None):
+    """
+    307 to a (cached) presigned GET URL: the bytes go straight from S3 to
+    the client. The redirect itself may be cached only while the URL it
+    points at still has S3_PRESIGN_MIN_REMAINING seconds to live.
+    """
+    from services.s3_utils import presigned_urls
+
+    url, expires_at = presigned_urls.get(key)
+    max_age = max(0, int(expires_at - time.time()) - presigned_urls.min_remaining)
+    headers = {"Cache-Control": f"private, max-age={max_age}"}
+    if vary:
+        headers["Vary"] = vary
+    return RedirectResponse(url, status_code=307, headers=headers)
+
+
+def _s3_source(key: str) -> str:
+    """Local copy of an S3 image to render a variant from (S3ObjectCache)."""
+    from services.s3_utils import object_cache
+
+    path = object_cache.path(key)
+    if path is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Resized variants are not available for this image",
+        )
     return path
 
 
+def _variant(w, h, fmt, quality) -> str:
+    """ETag component for the requested derivative ("" for the original)."""
+    if not wants_derivative(w, h, fmt, quality):
+        return ""
+    return f"w={w}&h={h}&format={fmt}&quality={quality}"
+
+
+def get_image_service(
+    image_type: str,
+    filename: str,
+    username: str,
+    request: Request,
+    db: Session,
+    w: int | None = None,
+    h: int | None = None,
+    fmt: str | None = None,
+    quality: int | None = None,
+):
+    variant = _variant(w, h, fmt, quality)
+    # keyed on the URL's path, so the tag survives a move to the sharded layout
+    etag = strong_etag("image", os.path.join("uploads", image_type, filename), variant)
+    if image_type in ["original", "predicted"] and etag_matches(request, etag):
+        # revalidation: ownership only, no stat / file read
+        if _owned_ref(db, image_type, filename, username) is None:
+            raise HTTPException(status_code=404, detail="Access denied")
+        return not_modified(etag)
+
+    path, st = get_image_path_and_validate(image_type, filename, username, db)
+    if st is None:
+        if not variant:
+            return _redirect_to_s3(path)
+        path = _s3_source(path)
+    headers = cache_headers(etag)
+    if not variant:
+        # stat_result: no second stat; Range / If-Range / HEAD are handled by
+        # FileResponse against our ETag
+        return FileResponse(path, headers=headers, stat_result=st)
+    fmt = fmt or source_format(path)
+    return FileResponse(
+        derivative_cache.get_or_create(path, w, h, fmt, quality),
+        media_type=derivative_media_type(fmt),
+        headers=headers,
+    )
+
+
+def _prediction_image_path(uid: str, username: str, db: Session) -> str | None:
+    cached = prediction_cache.get_entry(uid)
+    if cached is not None:
+        owner, payload = cached
+        return payload["predicted_image"] if owner == username else None
+    return get_prediction_image_path(db, uid, username)
+
+
 def get_prediction_image_service(
-    uid: str, username: str, request: Request, db: Session
+    uid: str,
+    username: str,
+    request: Request,
+    db: Session,
+    w: int | None = None,
+    h: int | None = None,
+    fmt: str | None = None,
+    quality: int | None = None,
 ):
     accept = request.headers.get("accept", "")
 
-    image_path = get_prediction_image_path(db, uid, username)
+    image_path = _prediction_image_path(uid, username, db)
     if not image_path:
         raise HTTPException(status_code=404, detail="Prediction not found")
 
-    if not os.path.exists(image_path):
-        raise HTTPException(status_code=404, detail="Predicted image file not found")
-
-    if "image/png" in accept:
-        return FileResponse(image_path, media_type="image/png")
+    if fmt:
+        # an explicit format wins over Accept negotiation
+        media_type = derivative_media_type(fmt)
+    elif "image/png" in accept:
+        media_type = "image/png"
     elif "image/jpeg" in accept or "image/jpg" in accept:
-        return FileResponse(image_path, media_type="image/jpeg")
+        media_type = "image/jpeg"
+    else:
+        media_type = None
+    variant = _variant(w, h, fmt, quality)
+
+    if media_type:
+        etag = strong_etag("prediction-image", image_path, media_type, variant)
+        if etag_matches(request, etag):
+            return not_modified(etag, vary="Accept")
+
+    if is_s3_ref(image_path):
+        st = None
     else:
+        # a cached/replica ref may still name the pre-migration flat path
+        image_path, st = _stat_first(_spellings(image_path))
+        if image_path is None:
+            raise HTTPException(
+                status_code=404, detail="Predicted image file not found"
+            )
+
+    if media_type is None:
         raise HTTPException(
             status_code=406, detail="Client does not accept an image format"
         )
+    if st is None:
+        if not variant:
+            return _redirect_to_s3(image_path, vary="Accept")
+        image_path = _s3_source(image_path)
+    headers = cache_headers(etag, vary="Accept")
+    if variant:
+        # resized output is encoded as the negotiated type, not just labelled
+        image_path = derivative_cache.get_or_create(
+            image_path, w, h, fmt or media_type.split("/")[1], quality
+        )
+        st = None
+    return FileResponse(
+        image_path, media_type=media_type, headers=headers, stat_result=st
+    )
@@ -1,21 +1,63 @@
 from datetime import datetime, timedelta
 from fastapi import HTTPException
-from queries import get_predictions_by_label, get_recent_labels
+from queries import (
+    get_predictions_by_label,
+    get_recent_labels,
+    iter_predictions_by_label,
+)
+from services.pagination import (
+    build_page,
+    clamp_page_size,
+    decode_cursor,
+    encode_cursor,
+)
+from services.streaming import ndjson_response
 from sqlalchemy.orm import Session
 from ultralytics import YOLO
 
 model = YOLO("yolov8n.pt")
 
 
-def get_predictions_by_label_service(label: str, username: str, db: Session):
+def _validate_label(label: str):
     if label not in model.names.values():
         raise HTTPException(status_code=404, detail="Label not supported")
 
-    rows = get_predictions_by_label(db, label, username)
-    return [{"uid": uid, "timestamp": timestamp} for uid, timestamp in rows]
+
+def _label_item(row) -> dict:
+    return {"uid": row[0], "timestamp": row[1]}
+
+
+def get_predictions_by_label_service(
+    label: str,
+    username: str,
+    db: Session,
+    limit: int | None = None,
+    cursor: str | None = None,
+):
+    _validate_label(label)
+
+    limit = clamp_page_size(limit)
+    rows = get_predictions_by_label(
+        db, label, username, limit=limit + 1, after=decode_cursor(cursor)
+    )
+    return build_page(
+        rows,
+        limit,
+        to_item=_label_item,
+        to_cursor=lambda row: encode_cursor(row[1], row[0]),
+    )
+
+
+def stream_predictions_by_label_service(label: str, username: str, bind=None):
+    _validate_label(label)
+    return ndjson_response(
+        lambda db: iter_predictions_by_label(db, label, username),
+        _label_item,
+        bind=bind,
+    )
 
 
 def get_recent_labels_service(username: str, db: Session):
-    one_week_ago = datetime.now() - timedelta(days=7)
+    one_week_ago = datetime.utcnow() - timedelta(days=7)
     labels = get_recent_labels(db, username, one_week_ago)
     return {"labels": labels}
@@ -0,0 +1,51 @@
+# services/pagination.py
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def clamp_page_size(limit: int | None) -> int:
+    """Server-side cap: clients may ask for less than MAX_PAGE_SIZE, never more."""
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(int(limit), MAX_PAGE_SIZE)
+
+
+def encode_cursor(timestamp, uid: str, *extra) -> str:
+    """Opaque keyset cursor for the (timestamp, uid[, ...]) position of a row."""
+    ts = timestamp.isoformat() if isinstance(timestamp, datetime) else str(timestamp)
+    raw = json.dumps([ts, uid, *extra], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None, size: int = 2) -> tuple | None:
+    """Inverse of encode_cursor; raises 400 on anything that isn't one of ours."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError("bad cursor shape")
+        return (datetime.fromisoformat(values[0]), *values[1:])
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def build_page(rows: list, limit: int, to_item, to_cursor) -> dict:
+    """
+    `rows` was fetched with limit + 1; the extra row only tells us whether a
+    next page exists and is not returned.
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": [to_item(row) for row in rows],
+        "next_cursor": to_cursor(rows[-1]) if has_more and rows else None,
+    }
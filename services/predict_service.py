@@ -2,10 +2,10 @@
 import os
 import uuid
 import time
-import tempfile
-import pathlib
 from typing import Optional
 
+import cv2
+import numpy as np
 from PIL import Image
 from ultralytics import YOLO
 import secrets
@@ -15,13 +15,19 @@ from services.validators import (
     sniff_image_or_415,
     sanitize_filename,
 )
-from infra import enforce_db_quota
+from db import mark_write
+from infra import enforce_db_quota, prediction_cache, quota_counters
 from queries import (
+    add_pending_upload,
     get_user,
     create_user,
-    save_prediction_session,
-    save_detection_object,
+    reference_blob,
+    save_prediction,
 )
+from services.blob_store import blob_key, store_original
+from services.prediction_uid_service import prediction_payload
+from services.s3_uploader import uploader
+from services.storage import is_s3_ref, shard_path
 
 # ========= Back-compat constants so tests can monkeypatch =========
 UPLOAD_DIR = "uploads/original"
@@ -36,19 +42,45 @@ MAX_BYTES = 10 * 1024 * 1024  # 10 MB
 CHUNK = 1 * 1024 * 1024  # 1 MB
 
 
-def _read_upload_to_bytes_with_cap(upload_file) -> bytes:
-    """Stream a FastAPI UploadFile to memory with a hard cap, then return bytes."""
+def _readinto(fh, target: memoryview) -> int:
+    """fh.readinto(target); SpooledTemporaryFile has no readinto before 3.11."""
+    readinto = getattr(fh, "readinto", None)
+    if readinto is not None:
+        return readinto(target) or 0
+    chunk = fh.read(len(target))
+    target[: len(chunk)] = chunk
+    return len(chunk)
+
+
+def _read_upload_with_cap(upload_file) -> memoryview:
+    """
+    Stream a FastAPI UploadFile into one buffer, enforcing MAX_BYTES while
+    reading. The buffer is sized from the upload's length when known, so it
+    is allocated once and never joined or grown; the memoryview returned is
+    what the sniffer, decoder, hasher and blob writer all read from.
+    """
+    size = getattr(upload_file, "size", None)
+    if size is not None and size > MAX_BYTES:
+        raise _http_413()
+    # one spare byte: filling it means the stream is longer than expected
+    capacity = (MAX_BYTES if size is None else size) + 1
+    buf = bytearray(capacity)
+    view = memoryview(buf)
     total = 0
-    chunks = []
     while True:
-        chunk = upload_file.file.read(CHUNK)
-        if not chunk:
+        if total == capacity:
+            if capacity > MAX_BYTES:
+                raise _http_413()
+            # declared size was short: move to a buffer for the full cap
+            grown = bytearray(MAX_BYTES + 1)
+            grown[:total] = view
+            buf, capacity = grown, MAX_BYTES + 1
+            view = memoryview(buf)
+        n = _readinto(upload_file.file, view[total : min(total + CHUNK, capacity)])
+        if not n:
             break
-        total += len(chunk)
-        if total > MAX_BYTES:
-            raise _http_413()
-        chunks.append(chunk)
-    return b"".join(chunks)
+        total += n
+    return view[:total]
 
 
 def _http_413():
@@ -69,41 +101,63 @@ def _http_404(msg: str):
     return HTTPException(status_code=404, detail=msg)
 
 
-# ---------------- S3 helpers are lazy-imported (keeps tests & coverage happy) ----------------
-def _s3_prepare_from_upload(
-    chat_id: str, safe_name: str, data: bytes
-):  # pragma: no cover
-    from services.s3_utils import save_original_from_bytes
-
-    original_key = save_original_from_bytes(
-        chat_id=chat_id,
-        filename=safe_name,
-        data=data,
-        content_type=None,  # s3_utils will guess if None
-    )
-    return original_key
-
+def _decode_image(data: bytes) -> np.ndarray:
+    """
+    Decode in memory to the BGR array YOLO would load from a file path
+    (ultralytics' imread is cv2.imdecode over the file's bytes).
+    """
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        from fastapi import HTTPException
 
-def _s3_prepare_from_key(
-    chat_id: str, img: str, local_dst: pathlib.Path
-):  # pragma: no cover
-    from services.s3_utils import build_original_key, download_to_path, exists
+        raise HTTPException(status_code=415, detail="Invalid or corrupted image")
+    return image
 
-    key = img if "/" in img else build_original_key(chat_id, img)
-    if not exists(key):
-        raise _http_404(f"S3 object not found: {key}")
-    download_to_path(key, str(local_dst))
-    return key
 
+# ---------------- S3 helpers are lazy-imported (keeps tests & coverage happy) ----------------
+def _s3_fetch_from_key(chat_id: str, img: str) -> tuple[str, bytes]:
+    """
+    (key, bytes) for ?img=: one capped GET into memory, no HEAD, no temp
+    file; repeat fetches of a key are served by the local S3ObjectCache.
+    """
+    from botocore.exceptions import ClientError
 
-def _s3_upload_predicted(
-    chat_id: str, output_path: pathlib.Path, preferred_name: str
-):  # pragma: no cover
-    from services.s3_utils import save_predicted_from_file
+    from services.s3_utils import build_original_key, object_cache
 
-    return save_predicted_from_file(
-        chat_id=chat_id, local_path=str(output_path), preferred_name=preferred_name
-    )
+    key = img if "/" in img else build_original_key(chat_id, img)
+    try:
+        data, size = object_cache.read(key, MAX_BYTES)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            raise _http_404(f"S3 object not found: {key}")
+        raise
+    if size > MAX_BYTES:
+        raise _http_413()
+    return key, data
+
+
+def _stage_s3_uploads(db, chat_id: str, uid: str, original_ref: str, predicted_ref):
+    """
+    Queue the locally staged images for write-behind upload (same
+    transaction as the session). Returns (queue row ids, response "s3" block
+    with the keys the images will live under).
+    """
+    from services.s3_utils import build_prediction_key
+
+    pending = []
+    original_key = original_ref
+    if not is_s3_ref(original_ref):
+        # a new blob, or one whose upload is still queued (then None here)
+        original_key = blob_key(original_ref)
+        pending.append(add_pending_upload(db, original_ref, original_key))
+    predicted_key = build_prediction_key(chat_id, uid)
+    pending.append(add_pending_upload(db, predicted_ref, predicted_key, uid=uid))
+    s3_block = {
+        "original_key": original_key,
+        "predicted_key": predicted_key,
+        "upload": "pending",
+    }
+    return pending, s3_block
 
 
 def process_prediction(
@@ -138,92 +192,82 @@ def process_prediction(
     os.makedirs(UPLOAD_DIR, exist_ok=True)
     os.makedirs(PREDICTED_DIR, exist_ok=True)
 
-    # We'll always run YOLO on a local temp file path.
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = pathlib.Path(tmpdir)
-        input_path = tmpdir / "in_image"
-        output_path = tmpdir / "out.png"  # YOLO annotated output (we'll write PNG)
-
-        # ----- Mode A: client uploaded a file -----
-        if file is not None:
-            validate_mime_and_ext(file)
-            safe_name = sanitize_filename(file.filename or "upload.jpg")
-
-            # Stream to memory with 10MB cap and sniff
-            data = _read_upload_to_bytes_with_cap(file)
-            sniff_image_or_415(data[: 64 * 1024])
-
-            # LOCAL MODE (default in CI): write to UPLOAD_DIR and infer input suffix
-            if not USE_S3:
-                _, ext = os.path.splitext(safe_name)
-                original_path = os.path.join(UPLOAD_DIR, uid + (ext.lower() or ".jpg"))
-                with open(original_path, "wb") as out:
-                    out.write(data)
-                input_path = input_path.with_suffix(ext or ".jpg")
-                input_path.write_bytes(data)
-                original_ref = original_path  # what we save to DB
-                preferred_pred_name = pathlib.Path(safe_name).name
-            else:
-                # S3 MODE
-                original_key = _s3_prepare_from_upload(
-                    chat_id, safe_name, data
-                )  # pragma: no cover
-                input_path = input_path.with_suffix(
-                    pathlib.Path(safe_name).suffix or ".jpg"
-                )
-                input_path.write_bytes(data)
-                original_ref = original_key  # what we save to DB
-                preferred_pred_name = pathlib.Path(safe_name).name
-
-        # ----- Mode B: user pointed at an S3 key (or bare filename) -----
-        else:
-            if not USE_S3:
-                # In local mode we don't support download-by-key; keep behavior simple for tests
-                raise _http_400("img key download requires S3 to be enabled")
-            key = _s3_prepare_from_key(
-                chat_id, img, input_path.with_suffix(pathlib.Path(img).suffix or ".jpg")
-            )  # pragma: no cover
-            # sanity sniff
-            sniff_image_or_415(pathlib.Path(str(input_path)).read_bytes()[: 64 * 1024])
-            original_ref = key
-            preferred_pred_name = pathlib.Path(key).name
-
-        # ----- Run YOLO on local file -----
-        results = model(str(input_path), device="cpu")
-        annotated_frame = results[0].plot()
-        Image.fromarray(annotated_frame).save(output_path)
-
-        # ----- Store predicted -----
-        if not USE_S3:
-            predicted_path = os.path.join(PREDICTED_DIR, uid + ".png")
-            Image.fromarray(annotated_frame).save(predicted_path)
-            predicted_ref = predicted_path
-            s3_block = None
-        else:
-            predicted_key = _s3_upload_predicted(
-                chat_id, output_path, preferred_pred_name
-            )  # pragma: no cover
-            predicted_ref = predicted_key
-            s3_block = {"original_key": original_ref, "predicted_key": predicted_key}
-
-    # ----- Persist session + detections -----
-    save_prediction_session(
-        db,
-        uid,
-        original_ref,
-        predicted_ref,
-        username,
-    )
+    # ----- Mode A: client uploaded a file -----
+    if file is not None:
+        validate_mime_and_ext(file)
+        safe_name = sanitize_filename(file.filename or "upload.jpg")
 
+        # one capped buffer; every later step reads this memoryview
+        data = _read_upload_with_cap(file)
+        sniff_image_or_415(data[: 64 * 1024])
+        source = _decode_image(data)
+
+        # the original is stored content-addressed (services.blob_store)
+        # just before the session is saved, in both local and S3 mode
+        _, ext = os.path.splitext(safe_name)
+        original_ext = ext.lower() or ".jpg"
+        original_ref = None
+
+    # ----- Mode B: user pointed at an S3 key (or bare filename) -----
+    else:
+        if not USE_S3:
+            # In local mode we don't support download-by-key; keep behavior simple for tests
+            raise _http_400("img key download requires S3 to be enabled")
+        original_ref, data = _s3_fetch_from_key(chat_id, img)
+        sniff_image_or_415(data[: 64 * 1024])
+        # decoded from memory: the object never touches local disk
+        source = _decode_image(data)
+
+    # ----- Run YOLO on the decoded array (nothing is staged on disk) -----
+    results = model(source, device="cpu")
+    annotated_frame = results[0].plot()
+
+    # ----- Store predicted (S3 mode: staged here, uploaded write-behind) -----
+    predicted_ref = shard_path(PREDICTED_DIR, uid + ".png")
+    os.makedirs(os.path.dirname(predicted_ref), exist_ok=True)
+    Image.fromarray(annotated_frame).save(predicted_ref)
+
+    # ----- Persist session + detections (+ rollups) in one transaction -----
+    detections = []
     labels = []
     for box in results[0].boxes:
         label_idx = int(box.cls[0].item())
         label = model.names[label_idx]
         score = float(box.conf[0])
         bbox = str(box.xyxy[0].tolist())
-        save_detection_object(db, uid, label, score, bbox)
+        detections.append((label, score, bbox))
         labels.append(label)
 
+    # same transaction as the session row: the blob reference and the
+    # session commit (or roll back) together
+    if original_ref is None:
+        original_ref = store_original(db, data, original_ext, UPLOAD_DIR)
+        owns_original = True
+    else:
+        # ?img= naming a stored blob: this session holds a reference too, so
+        # deleting it never frees the blob under the sessions that share it;
+        # any other key is the caller's object and is never deleted here
+        owns_original = reference_blob(db, original_ref)
+    pending, s3_block = [], None
+    if USE_S3:
+        pending, s3_block = _stage_s3_uploads(
+            db, chat_id, uid, original_ref, predicted_ref
+        )
+
+    created_at = save_prediction(
+        db, uid, original_ref, predicted_ref, username, detections, owns_original
+    )
+    uploader.submit(*pending)
+    mark_write(username)
+    if username:
+        quota_counters.record(username, created_at, uid)
+    # warm GET /prediction/{uid}: the caller usually fetches it right away
+    prediction_cache.set(
+        uid,
+        prediction_payload(uid, created_at, original_ref, predicted_ref, detections),
+        owner=username,
+    )
+
     resp = {
         "prediction_uid": uid,
         "detection_count": len(results[0].boxes),
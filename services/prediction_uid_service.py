@@ -1,9 +1,86 @@
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
-from queries import query_prediction_by_uid
+from db import is_primary
+from infra import prediction_cache
+from queries import (
+    get_detection_objects,
+    has_pending_uploads,
+    query_prediction_by_uid,
+)
+from services import storage
+from services.http_cache import strong_etag
+
+# bump when the payload shape changes so clients drop their cached copies
+PAYLOAD_VERSION = "2"
+
+
+def prediction_etag(uid: str, original_image, predicted_image) -> str:
+    # the refs are part of the representation: write-behind S3 uploads
+    # switch them from local paths to keys after the first response
+    return strong_etag(
+        "prediction",
+        PAYLOAD_VERSION,
+        uid,
+        original_image or "",
+        predicted_image or "",
+    )
+
+
+def refs_final(db: Session, original_image, predicted_image) -> bool:
+    """False while an S3 upload will still rewrite one of the refs."""
+    if not storage.S3_ENABLED:
+        return True
+    refs = [
+        r for r in (original_image, predicted_image) if r and not storage.is_s3_ref(r)
+    ]
+    return not has_pending_uploads(db, *refs)
+
+
+def prediction_payload(
+    uid: str, timestamp, original_image, predicted_image, detections
+) -> dict:
+    """GET /prediction/{uid} body; also what /predict puts in the cache."""
+    return {
+        "uid": uid,
+        "timestamp": timestamp,
+        "original_image": original_image,
+        "predicted_image": predicted_image,
+        "detection_objects": [
+            {"label": label, "score": score, "box": box}
+            for label, score, box in detections
+        ],
+    }
+
+
+def prediction_refs(uid: str, username: str, db: Session) -> tuple:
+    """
+    (original_image, predicted_image), after the same 404/403 checks as
+    get_prediction_by_uid_service; cache first.
+    """
+    cached = prediction_cache.get_entry(uid)
+    if cached is not None:
+        owner, payload = cached
+        refs = payload["original_image"], payload["predicted_image"]
+    else:
+        prediction = query_prediction_by_uid(db, uid)
+        if not prediction:
+            raise HTTPException(status_code=404, detail="Prediction not found")
+        owner = prediction.username
+        refs = prediction.original_image, prediction.predicted_image
+    if owner != username:
+        raise HTTPException(status_code=403, detail="Access denied")
+    return refs
 
 
 def get_prediction_by_uid_service(uid: str, username: str, db: Session):
+    cached = prediction_cache.get_entry(uid)
+    if cached is not None:
+        owner, payload = cached
+        if owner != username:
+            raise HTTPException(status_code=403, detail="Access denied")
+        return payload
+
+    token = prediction_cache.token()
     prediction = query_prediction_by_uid(db, uid)
 
     if not prediction:
@@ -12,9 +89,14 @@ def get_prediction_by_uid_service(uid: str, username: str, db: Session):
     if prediction.username != username:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    return {
-        "uid": prediction.uid,
-        "timestamp": prediction.timestamp,
-        "original_image": prediction.original_image,
-        "predicted_image": prediction.predicted_image,
-    }
+    payload = prediction_payload(
+        prediction.uid,
+        prediction.timestamp,
+        prediction.original_image,
+        prediction.predicted_image,
+        get_detection_objects(db, uid),
+    )
+    # the invalidation token can't see replica lag: only primary reads fill
+    if is_primary(db):
+        prediction_cache.fill(uid, payload, prediction.username, token)
+    return payload
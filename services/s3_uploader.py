@@ -0,0 +1,173 @@
+# services/s3_uploader.py
+"""
+Write-behind uploads for S3 mode. /predict stages the original and the
+annotated image on local disk, commits the session with local refs plus a
+models.PendingUpload row per file, and returns; the upload happens here, on
+a bounded thread pool:
+
+- success: the refs switch to the S3 key in one transaction
+  (queries.confirm_upload), then the staged file is removed;
+- failure: the row is rescheduled with exponential backoff;
+- the file is gone (session deleted before upload): the row is dropped.
+
+Each attempt first claims its row (queries.claim_pending_upload) for
+S3_UPLOAD_LEASE_SECONDS, so two sweepers never upload the same file; if a
+lease runs out mid-upload, only the first confirm wins and the other
+attempt leaves the object alone.
+
+The queue lives in the database, so rows survive a crash: sweep() runs at
+startup and then periodically (app.lifespan), resubmitting every row that
+is due. Files being uploaded are still served from local disk meanwhile.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from db import SessionLocal
+from infra import metrics, prediction_cache
+from models import PendingUpload
+from queries import claim_pending_upload, confirm_upload, due_pending_uploads
+
+S3_UPLOAD_WORKERS = int(os.getenv("S3_UPLOAD_WORKERS", "4"))
+# uploads queued in memory beyond the running ones; the rest wait for sweep()
+S3_UPLOAD_QUEUE = int(os.getenv("S3_UPLOAD_QUEUE", "256"))
+S3_UPLOAD_SWEEP_SECONDS = float(os.getenv("S3_UPLOAD_SWEEP_SECONDS", "30"))
+S3_UPLOAD_RETRY_BASE_SECONDS = float(os.getenv("S3_UPLOAD_RETRY_BASE_SECONDS", "5"))
+S3_UPLOAD_RETRY_MAX_SECONDS = float(os.getenv("S3_UPLOAD_RETRY_MAX_SECONDS", "3600"))
+# how long one attempt owns its queue row before another worker may retry it
+S3_UPLOAD_LEASE_SECONDS = float(os.getenv("S3_UPLOAD_LEASE_SECONDS", "600"))
+
+
+def _put_file(local_path: str, key: str):
+    from services.s3_utils import guess_content_type, upload_file
+
+    upload_file(local_path, key, content_type=guess_content_type(local_path))
+
+
+def _delete_object(key: str):
+    from services.s3_utils import delete_object
+
+    delete_object(key)
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds before retry number `attempts` (1-based), capped."""
+    delay = S3_UPLOAD_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+    return min(delay, S3_UPLOAD_RETRY_MAX_SECONDS)
+
+
+class S3Uploader:
+    def __init__(self, workers=None, queue=None):
+        self.workers = workers or S3_UPLOAD_WORKERS
+        self.queue = S3_UPLOAD_QUEUE if queue is None else queue
+        self._pool = None
+        self._inflight: set[int] = set()
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="s3-upload"
+                )
+            return self._pool
+
+    def submit(self, *upload_ids) -> list:
+        """
+        Start uploads for the given queue rows. Rows already in flight, or
+        beyond the in-memory bound, are left to the next sweep(). Returns
+        the futures started.
+        """
+        futures = []
+        for upload_id in upload_ids:
+            if upload_id is None:
+                continue
+            with self._lock:
+                if upload_id in self._inflight or len(self._inflight) >= (
+                    self.workers + self.queue
+                ):
+                    continue
+                self._inflight.add(upload_id)
+            futures.append(self._executor().submit(self._run, upload_id))
+        return futures
+
+    def sweep(self) -> list:
+        """Resubmit queue rows that are due (startup recovery and retries)."""
+        with SessionLocal() as db:
+            due = due_pending_uploads(
+                db, datetime.utcnow(), limit=self.workers + self.queue
+            )
+        return self.submit(*due)
+
+    def _run(self, upload_id: int):
+        try:
+            return self.upload_one(upload_id)
+        finally:
+            with self._lock:
+                self._inflight.discard(upload_id)
+
+    def upload_one(self, upload_id: int) -> str:
+        """
+        Upload one queued file; returns "done", "retry", "dropped" or "gone"
+        (the row is gone, or another worker holds or finished it).
+        """
+        with SessionLocal() as db:
+            upload = claim_pending_upload(
+                db, upload_id, datetime.utcnow(), S3_UPLOAD_LEASE_SECONDS
+            )
+            if upload is None:
+                return "gone"
+            db.expunge(upload)
+            db.commit()
+
+        try:
+            _put_file(upload.local_path, upload.key)
+        except FileNotFoundError:
+            # its session was deleted before we got here
+            with SessionLocal() as db:
+                db.query(PendingUpload).filter_by(id=upload_id).delete()
+                db.commit()
+            metrics.incr("s3.upload.dropped")
+            return "dropped"
+        except Exception as e:
+            attempts = upload.attempts + 1
+            with SessionLocal() as db:
+                db.query(PendingUpload).filter_by(id=upload_id).update(
+                    {
+                        "attempts": attempts,
+                        "next_attempt_at": datetime.utcnow()
+                        + timedelta(seconds=retry_delay(attempts)),
+                        "last_error": str(e)[:500],
+                    }
+                )
+                db.commit()
+            print(f"Warning: S3 upload of {upload.key} failed (try {attempts}) — {e}")
+            metrics.incr("s3.upload.failures")
+            return "retry"
+
+        with SessionLocal() as db:
+            confirmed = confirm_upload(db, upload)
+            if confirmed is None:
+                # our lease ran out and another worker finished the row
+                # first: its outcome stands, the object is not ours to delete
+                db.rollback()
+                return "gone"
+            db.commit()
+        uids, referenced = confirmed
+        if not referenced:
+            # deleted while uploading: nothing will ever point at the object
+            _delete_object(upload.key)
+            metrics.incr("s3.upload.orphans_removed")
+        else:
+            prediction_cache.invalidate(*uids)
+        try:
+            os.remove(upload.local_path)
+        except FileNotFoundError:
+            pass
+        metrics.incr("s3.upload.completed")
+        return "done"
+
+
+uploader = S3Uploader()
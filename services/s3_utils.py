@@ -3,12 +3,20 @@ from __future__ import annotations
 
 import io
 import os
+import time
+import sqlite3
+import hashlib
 import uuid
 import pathlib
 import mimetypes
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
 from typing import Optional, List
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 # ---- Configuration from environment ----
@@ -18,23 +26,99 @@ AWS_S3_BUCKET = os.getenv("AWS_S3_BUCKET")
 AWS_S3_SSE = os.getenv("AWS_S3_SSE")  # "AES256" or "aws:kms"
 AWS_S3_SSE_KMS_KEY_ID = os.getenv("AWS_S3_SSE_KMS_KEY_ID")
 
+# presigned GET URLs handed out by the image endpoints (see PresignedUrlCache)
+S3_PRESIGN_EXPIRES = int(os.getenv("S3_PRESIGN_EXPIRES", "3600"))
+S3_PRESIGN_MIN_REMAINING = int(os.getenv("S3_PRESIGN_MIN_REMAINING", "300"))
+S3_PRESIGN_CACHE_MAX_ENTRIES = int(os.getenv("S3_PRESIGN_CACHE_MAX_ENTRIES", "10000"))
+
+# Client and transfer tuning. Every thread (request handlers, the upload
+# pool, the transfer manager's own workers) shares one client, so its
+# connection pool must cover them all: botocore's default of 10 makes the
+# rest wait for a socket (and logs "Connection pool is full").
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "10"))
+S3_MAX_POOL_CONNECTIONS = int(
+    os.getenv("S3_MAX_POOL_CONNECTIONS", str(max(50, 2 * S3_MAX_CONCURRENCY)))
+)
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", str(16 * 1024**2)))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE", str(8 * 1024**2)))
+S3_RETRY_MODE = os.getenv("S3_RETRY_MODE", "standard")  # legacy/standard/adaptive
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", "5"))  # including the first try
+# local read-through cache of fetched objects (see S3ObjectCache); 0 disables
+S3_CACHE_DIR = os.getenv("S3_CACHE_DIR", "uploads/.s3cache")
+S3_CACHE_MAX_BYTES = int(os.getenv("S3_CACHE_MAX_BYTES", str(1024**3)))
+S3_CACHE_REVALIDATE_SECONDS = float(os.getenv("S3_CACHE_REVALIDATE_SECONDS", "60"))
+S3_CONNECT_TIMEOUT = float(os.getenv("S3_CONNECT_TIMEOUT", "5"))
+S3_READ_TIMEOUT = float(os.getenv("S3_READ_TIMEOUT", "30"))
+
 
 # Lazily create a single S3 client. With an EC2 instance role, boto3
 # auto-discovers temporary creds via IMDS — no access keys needed.
 _s3_client = None
+_transfer_manager = None
+_client_lock = threading.Lock()
+
+
+def client_config() -> Config:
+    return Config(
+        # SigV4: presigned URLs for SSE-KMS objects (and newer regions) need it
+        signature_version="s3v4",
+        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+        retries={"mode": S3_RETRY_MODE, "total_max_attempts": S3_MAX_ATTEMPTS},
+        connect_timeout=S3_CONNECT_TIMEOUT,
+        read_timeout=S3_READ_TIMEOUT,
+        tcp_keepalive=True,
+    )
+
+
+def transfer_config() -> TransferConfig:
+    return TransferConfig(
+        multipart_threshold=S3_MULTIPART_THRESHOLD,
+        multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+        max_concurrency=S3_MAX_CONCURRENCY,
+    )
 
 
 def s3():
     global _s3_client
     if _s3_client is None:
-        _s3_client = (
-            boto3.client("s3", region_name=AWS_REGION)
-            if AWS_REGION
-            else boto3.client("s3")
-        )
+        # boto3.client() itself is not thread-safe; the client it returns is
+        with _client_lock:
+            if _s3_client is None:
+                session = boto3.session.Session()
+                _s3_client = session.client(
+                    "s3", region_name=AWS_REGION or None, config=client_config()
+                )
     return _s3_client
 
 
+def transfer_manager():
+    """
+    Shared s3transfer TransferManager for uploads and downloads.
+    client.upload_file()/download_file() build (and tear down) a manager
+    with its own thread pool on every call; this one is built once, is
+    thread-safe, and bounds multipart parts in flight process-wide to
+    S3_MAX_CONCURRENCY.
+    """
+    global _transfer_manager
+    if _transfer_manager is None:
+        from s3transfer.manager import TransferManager
+
+        client = s3()
+        with _client_lock:
+            if _transfer_manager is None:
+                _transfer_manager = TransferManager(client, transfer_config())
+    return _transfer_manager
+
+
+def reset_clients():
+    """Drop the shared client and transfer manager (settings changed, tests)."""
+    global _s3_client, _transfer_manager
+    with _client_lock:
+        manager, _transfer_manager, _s3_client = _transfer_manager, None, None
+    if manager is not None:
+        manager.shutdown()
+
+
 def _require_bucket():
     if not AWS_S3_BUCKET:
         raise RuntimeError(
@@ -56,6 +140,11 @@ def build_original_key(chat_id: str, filename: str) -> str:
     )
 
 
+def build_prediction_key(chat_id: str, uid: str, ext: str = ".png") -> str:
+    """<chat_id>/predicted/<uid>.ext (same file name as in local mode)"""
+    return f"{chat_id.strip().strip('/')}/predicted/{uid}{_ensure_dot(ext)}"
+
+
 def build_predicted_key(
     chat_id: str, suggested_name: Optional[str] = None, ext: str = ".png"
 ) -> str:
@@ -97,13 +186,12 @@ def upload_bytes(
 ) -> None:
     """Upload in-memory bytes (great for FastAPI UploadFile.read())."""
     _require_bucket()
-    fileobj = io.BytesIO(data)
-    s3().upload_fileobj(
-        Fileobj=fileobj,
-        Bucket=AWS_S3_BUCKET,
-        Key=key,
-        ExtraArgs=_extra_args(content_type, metadata),
-    )
+    transfer_manager().upload(
+        io.BytesIO(data),
+        AWS_S3_BUCKET,
+        key,
+        extra_args=_extra_args(content_type, metadata),
+    ).result()
 
 
 def upload_file(
@@ -117,12 +205,9 @@ def upload_file(
     Prefer this after your YOLO code writes an annotated image to disk.
     """
     _require_bucket()
-    s3().upload_file(
-        Filename=path,
-        Bucket=AWS_S3_BUCKET,
-        Key=key,
-        ExtraArgs=_extra_args(content_type, metadata),
-    )
+    transfer_manager().upload(
+        path, AWS_S3_BUCKET, key, extra_args=_extra_args(content_type, metadata)
+    ).result()
 
 
 # -------------------- Download helpers --------------------
@@ -131,7 +216,7 @@ def upload_file(
 def download_to_path(key: str, dest_path: str) -> None:
     _require_bucket()
     pathlib.Path(dest_path).parent.mkdir(parents=True, exist_ok=True)
-    s3().download_file(AWS_S3_BUCKET, key, dest_path)
+    transfer_manager().download(AWS_S3_BUCKET, key, dest_path).result()
 
 
 def download_bytes(key: str) -> bytes:
@@ -140,6 +225,51 @@ def download_bytes(key: str) -> bytes:
     return resp["Body"].read()
 
 
+def _get_object(
+    key: str, max_bytes: Optional[int] = None, if_none_match: Optional[str] = None
+) -> tuple[bytes, int, Optional[str]]:
+    """
+    (data, object size, ETag) from one GetObject. With max_bytes only the
+    first max_bytes + 1 bytes are asked for, and an object over max_bytes
+    comes back with empty data, unread. NoSuchKey, and 304 when
+    if_none_match still matches, raise ClientError.
+    """
+    params = {"Bucket": AWS_S3_BUCKET, "Key": key}
+    if max_bytes is not None:
+        params["Range"] = f"bytes=0-{max_bytes}"
+    if if_none_match:
+        params["IfNoneMatch"] = if_none_match
+    try:
+        resp = s3().get_object(**params)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "InvalidRange":
+            return b"", 0, None  # zero-byte object: no range is satisfiable
+        raise
+    # "bytes 0-N/TOTAL" on a 206; a 200 (no or ignored range) has the full length
+    content_range = resp.get("ContentRange")
+    size = (
+        int(content_range.rsplit("/", 1)[1]) if content_range else resp["ContentLength"]
+    )
+    body = resp["Body"]
+    try:
+        too_large = max_bytes is not None and size > max_bytes
+        return (b"" if too_large else body.read()), size, resp.get("ETag")
+    finally:
+        body.close()
+
+
+def download_bytes_capped(key: str, max_bytes: int) -> tuple[bytes, int]:
+    """
+    One GET straight into memory, asking only for the first max_bytes + 1
+    bytes. Returns (data, object size); an object over max_bytes comes back
+    with empty data and is not read. A missing key raises ClientError
+    (code "NoSuchKey"), so no HEAD is needed first.
+    """
+    _require_bucket()
+    data, size, _etag = _get_object(key, max_bytes)
+    return data, size
+
+
 # -------------------- Utility ops --------------------
 
 
@@ -158,14 +288,32 @@ def delete_object(key: str) -> None:
     s3().delete_object(Bucket=AWS_S3_BUCKET, Key=key)
 
 
+def delete_objects(keys: List[str]) -> dict:
+    """
+    Batch delete via DeleteObjects (S3 caps each call at 1000 keys).
+    Returns {key: error_code} for keys S3 refused; missing keys count as deleted.
+    """
+    _require_bucket()
+    errors = {}
+    for i in range(0, len(keys), 1000):
+        chunk = keys[i : i + 1000]
+        resp = s3().delete_objects(
+            Bucket=AWS_S3_BUCKET,
+            Delete={"Objects": [{"Key": k} for k in chunk], "Quiet": True},
+        )
+        for err in resp.get("Errors", []):
+            errors[err["Key"]] = err.get("Code", "Error")
+    return errors
+
+
 def copy_object(src_key: str, dest_key: str) -> None:
     _require_bucket()
-    s3().copy(
-        CopySource={"Bucket": AWS_S3_BUCKET, "Key": src_key},
-        Bucket=AWS_S3_BUCKET,
-        Key=dest_key,
-        ExtraArgs=_extra_args(None, None),
-    )
+    transfer_manager().copy(
+        {"Bucket": AWS_S3_BUCKET, "Key": src_key},
+        AWS_S3_BUCKET,
+        dest_key,
+        extra_args=_extra_args(None, None),
+    ).result()
 
 
 def list_prefix(prefix: str, max_keys: int = 1000) -> List[str]:
@@ -192,6 +340,323 @@ def presigned_get_url(key: str, expires_in: int = 3600) -> str:
     )
 
 
+def _incr(name: str, value: int = 1):
+    from infra import metrics
+
+    metrics.incr(name, value)
+
+
+def _credentials_expire_at() -> float | None:
+    """
+    Epoch seconds when the client's signing credentials expire (instance
+    role / STS), or None for long-lived keys. A presigned URL stops working
+    at that point whatever its X-Amz-Expires says.
+    """
+    signer = getattr(s3(), "_request_signer", None)
+    expiry = getattr(getattr(signer, "_credentials", None), "_expiry_time", None)
+    if not isinstance(expiry, datetime):
+        return None
+    if expiry.tzinfo is None:
+        expiry = expiry.replace(tzinfo=timezone.utc)
+    return expiry.timestamp()
+
+
+class PresignedUrlCache:
+    """
+    key -> (presigned GET URL, expires_at). A URL is reused while it has at
+    least min_remaining seconds left, so a redirect never hands out a link
+    that dies mid-download; its lifetime is also capped at the signing
+    credentials' expiry. LRU-bounded to max_entries.
+    """
+
+    def __init__(self, expires_in=None, min_remaining=None, max_entries=None):
+        self.expires_in = expires_in or S3_PRESIGN_EXPIRES
+        self.min_remaining = (
+            S3_PRESIGN_MIN_REMAINING if min_remaining is None else min_remaining
+        )
+        self.max_entries = max_entries or S3_PRESIGN_CACHE_MAX_ENTRIES
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> tuple[str, float]:
+        """(url, expires_at epoch seconds) for `key`, signing a new URL if needed."""
+        from infra import metrics
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] - now >= self.min_remaining:
+                self._entries.move_to_end(key)
+                metrics.incr("s3.presign.hits")
+                return entry
+        metrics.incr("s3.presign.misses")
+        expires_at = now + self.expires_in
+        creds_expire_at = _credentials_expire_at()
+        if creds_expire_at is not None:
+            expires_at = min(expires_at, creds_expire_at)
+        url = presigned_get_url(key, expires_in=max(1, int(expires_at - now)))
+        with self._lock:
+            self._entries[key] = (url, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return url, expires_at
+
+    def invalidate(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+presigned_urls = PresignedUrlCache()
+
+
+class S3ObjectCache:
+    """
+    Read-through disk cache of S3 objects, shared by every worker process
+    on the host (S3_CACHE_DIR, S3_CACHE_MAX_BYTES).
+
+    - Files are named by a hash of bucket/key/ETag and appear via
+      os.replace, so a reader never sees a partial or mixed-version file.
+    - The index (bucket, key -> ETag, size, last access) is a SQLite file
+      in WAL mode next to them: lookups from all processes see the same
+      entries, and the byte budget is enforced in one BEGIN IMMEDIATE
+      transaction that evicts least recently used entries.
+    - An entry is trusted for S3_CACHE_REVALIDATE_SECONDS after it was last
+      checked, then revalidated with If-None-Match: a 304 costs a round
+      trip but no egress, a changed object is fetched and replaces it.
+    - Concurrent misses on one key in a process queue on a per-key lock,
+      so only one of them goes to S3.
+
+    Counters: s3.cache.hits / misses / revalidated / bytes_saved /
+    bytes_fetched / evictions (hit ratio on GET /metrics).
+    """
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS objects ("
+        " bucket TEXT NOT NULL, key TEXT NOT NULL, etag TEXT NOT NULL,"
+        " name TEXT NOT NULL, size INTEGER NOT NULL,"
+        " last_access REAL NOT NULL, validated_at REAL NOT NULL,"
+        " PRIMARY KEY (bucket, key))",
+        "CREATE INDEX IF NOT EXISTS ix_objects_last_access ON objects (last_access)",
+    )
+
+    def __init__(self, root=None, max_bytes=None, revalidate_after=None):
+        self.root = root or S3_CACHE_DIR
+        self.max_bytes = S3_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.revalidate_after = (
+            S3_CACHE_REVALIDATE_SECONDS
+            if revalidate_after is None
+            else revalidate_after
+        )
+        self._local = threading.local()  # one index connection per thread
+        self._lock = threading.Lock()
+        self._key_locks = {}  # (bucket, key) -> [lock, waiters]
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    # ---------- index ----------
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.root, exist_ok=True)
+            conn = sqlite3.connect(
+                os.path.join(self.root, "index.db"), timeout=30, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in self._SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+        return conn
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _touch(self, bucket: str, key: str, validated: bool = False):
+        now = time.time()
+        if validated:
+            self._db().execute(
+                "UPDATE objects SET last_access = ?, validated_at = ?"
+                " WHERE bucket = ? AND key = ?",
+                (now, now, bucket, key),
+            )
+        else:
+            self._db().execute(
+                "UPDATE objects SET last_access = ? WHERE bucket = ? AND key = ?",
+                (now, bucket, key),
+            )
+
+    def _store(self, bucket: str, key: str, etag: str, data: bytes) -> str:
+        digest = hashlib.sha256("\0".join((bucket, key, etag)).encode()).hexdigest()
+        path = self._path(digest)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            with open(tmp, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        db = self._db()
+        stale, evicted_bytes = [], 0
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")  # serializes writers across processes
+        try:
+            old = db.execute(
+                "SELECT name FROM objects WHERE bucket = ? AND key = ?", (bucket, key)
+            ).fetchone()
+            if old is not None and old[0] != digest:
+                stale.append(old[0])  # the previous version of this key
+            db.execute(
+                "INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (bucket, key) DO UPDATE SET etag = excluded.etag,"
+                " name = excluded.name, size = excluded.size,"
+                " last_access = excluded.last_access,"
+                " validated_at = excluded.validated_at",
+                (bucket, key, etag, digest, len(data), now, now),
+            )
+            (total,) = db.execute("SELECT SUM(size) FROM objects").fetchone()
+            while total > self.max_bytes:
+                victims = db.execute(
+                    "SELECT bucket, key, name, size FROM objects"
+                    " WHERE NOT (bucket = ? AND key = ?)"
+                    " ORDER BY last_access LIMIT 32",
+                    (bucket, key),
+                ).fetchall()
+                if not victims:
+                    break
+                for v_bucket, v_key, v_name, v_size in victims:
+                    if total <= self.max_bytes:
+                        break
+                    db.execute(
+                        "DELETE FROM objects WHERE bucket = ? AND key = ?",
+                        (v_bucket, v_key),
+                    )
+                    stale.append(v_name)
+                    total -= v_size
+                    evicted_bytes += v_size
+                    _incr("s3.cache.evictions")
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        # after commit: a reader that already opened one keeps its handle;
+        # one that finds it gone treats the lookup as a miss
+        for name in stale:
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+        if evicted_bytes:
+            _incr("s3.cache.bytes_evicted", evicted_bytes)
+        return path
+
+    # ---------- per-key stampede lock ----------
+    def _acquire_key(self, ident):
+        with self._lock:
+            slot = self._key_locks.setdefault(ident, [threading.Lock(), 0])
+            slot[1] += 1
+        slot[0].acquire()
+        return slot
+
+    def _release_key(self, ident, slot):
+        slot[0].release()
+        with self._lock:
+            slot[1] -= 1
+            if slot[1] == 0:
+                self._key_locks.pop(ident, None)
+
+    # ---------- lookup ----------
+    def _hit(self, bucket, key, path, size, max_bytes, validated=False):
+        self._touch(bucket, key, validated)
+        _incr("s3.cache.hits")
+        if max_bytes is not None and size > max_bytes:
+            return None, size, b""
+        _incr("s3.cache.bytes_saved", size)
+        return path, size, None
+
+    def _get(self, key: str, max_bytes: Optional[int] = None):
+        """(cached path or None, object size, data if just fetched else None)"""
+        bucket = AWS_S3_BUCKET
+        slot = self._acquire_key((bucket, key))
+        try:
+            row = (
+                self._db()
+                .execute(
+                    "SELECT etag, name, size, validated_at FROM objects"
+                    " WHERE bucket = ? AND key = ?",
+                    (bucket, key),
+                )
+                .fetchone()
+            )
+            etag = None
+            if row is not None and os.path.exists(self._path(row[1])):
+                etag, name, size, validated_at = row
+                if time.time() - validated_at < self.revalidate_after:
+                    return self._hit(bucket, key, self._path(name), size, max_bytes)
+            try:
+                data, size, new_etag = _get_object(key, max_bytes, if_none_match=etag)
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                if etag and code in ("304", "NotModified"):
+                    _incr("s3.cache.revalidated")
+                    return self._hit(
+                        bucket, key, self._path(name), row[2], max_bytes, True
+                    )
+                raise
+            _incr("s3.cache.misses")
+            _incr("s3.cache.bytes_fetched", len(data))
+            path = None
+            if new_etag and data and len(data) == size <= self.max_bytes:
+                path = self._store(bucket, key, new_etag, data)
+            return path, size, data
+        finally:
+            self._release_key((bucket, key), slot)
+
+    # ---------- API ----------
+    def read(self, key: str, max_bytes: int) -> tuple[bytes, int]:
+        """Cached download_bytes_capped(): same (data, size) and errors."""
+        _require_bucket()
+        if not self.enabled:
+            return download_bytes_capped(key, max_bytes)
+        path, size, data = self._get(key, max_bytes)
+        if data is None:
+            try:
+                with open(path, "rb") as fh:
+                    data = fh.read()
+            except FileNotFoundError:  # evicted by another process just now
+                return download_bytes_capped(key, max_bytes)
+        return data, size
+
+    def path(self, key: str) -> Optional[str]:
+        """Local path of the cached object, fetching it on a miss; None if it can't be cached."""
+        _require_bucket()
+        if not self.enabled:
+            return None
+        return self._get(key)[0]
+
+    def clear(self):
+        db = self._db()
+        names = [name for (name,) in db.execute("SELECT name FROM objects")]
+        db.execute("DELETE FROM objects")
+        for name in names:
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+
+
+object_cache = S3ObjectCache()
+
+
 # -------------------- High-level convenience --------------------
 
 
@@ -207,13 +672,21 @@ def save_original_from_bytes(
 
 
 def save_predicted_from_file(
-    chat_id: str, local_path: str, preferred_name: Optional[str] = None
+    chat_id: str,
+    local_path: str,
+    preferred_name: Optional[str] = None,
+    uid: Optional[str] = None,
 ) -> str:
     """
-    Stores the YOLO-annotated 'predicted' image under <chat_id>/predicted/<stem>-<uuid>.ext and returns the S3 key.
+    Stores the YOLO-annotated 'predicted' image and returns the S3 key:
+    <chat_id>/predicted/<uid>.ext when the session uid is given (so
+    /image/predicted/<uid>.ext finds it), else <chat_id>/predicted/<stem>-<uuid>.ext.
     """
     ext = pathlib.Path(local_path).suffix or ".png"
-    key = build_predicted_key(chat_id, suggested_name=preferred_name, ext=ext)
+    if uid:
+        key = build_prediction_key(chat_id, uid, ext)
+    else:
+        key = build_predicted_key(chat_id, suggested_name=preferred_name, ext=ext)
     upload_file(
         local_path,
         key,
@@ -1,14 +1,50 @@
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
-from queries import get_predictions_by_score
+from queries import get_predictions_by_score, iter_predictions_by_score
+from services.pagination import (
+    build_page,
+    clamp_page_size,
+    decode_cursor,
+    encode_cursor,
+)
+from services.streaming import ndjson_response
 
 
-def get_predictions_by_score_service(min_score: float, username: str, db: Session):
+def _validate_score(min_score: float):
     if not (0 <= min_score <= 1):
         raise HTTPException(status_code=400, detail="Score must be between 0 and 1")
 
-    rows = get_predictions_by_score(db, min_score, username)
-    return [
-        {"uid": uid, "timestamp": timestamp, "score": score}
-        for uid, timestamp, score in rows
-    ]
+
+def _score_item(row) -> dict:
+    return {"uid": row[0], "timestamp": row[1], "score": row[2]}
+
+
+def get_predictions_by_score_service(
+    min_score: float,
+    username: str,
+    db: Session,
+    limit: int | None = None,
+    cursor: str | None = None,
+):
+    _validate_score(min_score)
+
+    limit = clamp_page_size(limit)
+    rows = get_predictions_by_score(
+        db, min_score, username, limit=limit + 1, after=decode_cursor(cursor)
+    )
+    # rows are (uid, timestamp, max_score): one per session
+    return build_page(
+        rows,
+        limit,
+        to_item=_score_item,
+        to_cursor=lambda row: encode_cursor(row[1], row[0]),
+    )
+
+
+def stream_predictions_by_score_service(min_score: float, username: str, bind=None):
+    _validate_score(min_score)
+    return ndjson_response(
+        lambda db: iter_predictions_by_score(db, min_score, username),
+        _score_item,
+        bind=bind,
+    )
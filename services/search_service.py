@@ -0,0 +1,204 @@
+# services/search_service.py
+"""
+Boolean label search: q=person AND (dog OR cat) AND NOT car
+
+Grammar (AND binds tighter than OR, keywords are case-insensitive):
+    expr   := term (OR term)*
+    term   := factor (AND factor)*
+    factor := NOT factor | "(" expr ")" | label
+Multi-word labels can be quoted ("traffic light") or written bare
+(traffic light AND person). The parsed tree is a nest of tuples:
+("label", name) / ("not", node) / ("and", [nodes]) / ("or", [nodes]).
+"""
+
+import re
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from queries import (
+    decode_label_set,
+    iter_search_predictions,
+    search_predictions,
+    tree_labels,
+)
+from services.label_service import model
+from services.pagination import (
+    build_page,
+    clamp_page_size,
+    decode_cursor,
+    encode_cursor,
+)
+from services.streaming import ndjson_response
+from services.validators import as_naive_utc
+
+MAX_TERMS = 32
+_TOKEN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|([^\s()"]+))')
+_KEYWORDS = {"AND", "OR", "NOT"}
+
+
+def _bad(msg: str):
+    return HTTPException(status_code=400, detail=f"Invalid query: {msg}")
+
+
+def _tokenize(q: str) -> list[tuple[str, str]]:
+    tokens, pos, q = [], 0, q.strip()
+    while pos < len(q):
+        m = _TOKEN.match(q, pos)
+        if not m or m.end() == pos:
+            raise _bad(f"unexpected character at {pos}")
+        pos = m.end()
+        lparen, rparen, quoted, word = m.groups()
+        if lparen or rparen:
+            tokens.append(("op", lparen or rparen))
+        elif quoted is not None:
+            tokens.append(("label", quoted))
+        elif word.upper() in _KEYWORDS:
+            tokens.append(("op", word.upper()))
+        elif tokens and tokens[-1][0] == "word":
+            # bare multi-word label: "traffic light"
+            tokens[-1] = ("word", f"{tokens[-1][1]} {word}")
+        else:
+            tokens.append(("word", word))
+    return [("label", v) if kind == "word" else (kind, v) for kind, v in tokens]
+
+
+def parse_query(q: str):
+    tokens = _tokenize(q)
+    if not tokens:
+        raise _bad("empty expression")
+    if sum(kind == "label" for kind, _ in tokens) > MAX_TERMS:
+        raise _bad(f"more than {MAX_TERMS} labels")
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else (None, None)
+
+    def take(value=None):
+        nonlocal pos
+        kind, v = peek()
+        if kind is None or (value is not None and v != value):
+            raise _bad(f"expected {value or 'a label'}")
+        pos += 1
+        return kind, v
+
+    def expr():
+        nodes = [term()]
+        while peek() == ("op", "OR"):
+            take("OR")
+            nodes.append(term())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def term():
+        nodes = [factor()]
+        while peek() == ("op", "AND"):
+            take("AND")
+            nodes.append(factor())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def factor():
+        kind, v = peek()
+        if (kind, v) == ("op", "NOT"):
+            take("NOT")
+            return ("not", factor())
+        if (kind, v) == ("op", "("):
+            take("(")
+            node = expr()
+            take(")")
+            return node
+        if kind == "label":
+            take()
+            return ("label", v)
+        raise _bad(f"unexpected {v!r}" if v else "unexpected end of expression")
+
+    tree = expr()
+    if pos != len(tokens):
+        raise _bad(f"unexpected {tokens[pos][1]!r}")
+    return tree
+
+
+def _parse_thresholds(values: list[str] | None, cast, name: str) -> dict:
+    """["person:0.5", "dog:2"] -> {"person": 0.5, ...}; a bare value applies to all ("*")."""
+    out = {}
+    for raw in values or []:
+        label, sep, value = raw.rpartition(":")
+        try:
+            out[label.strip() if sep else "*"] = cast(value)
+        except ValueError:
+            raise _bad(f"{name} must look like label:value, got {raw!r}")
+    return out
+
+
+def _prepare(
+    q: str,
+    min_score: list[str] | None,
+    min_count: list[str] | None,
+):
+    tree = parse_query(q)
+    unknown = sorted(tree_labels(tree) - set(model.names.values()))
+    if unknown:
+        raise HTTPException(
+            status_code=404, detail=f"Label not supported: {', '.join(unknown)}"
+        )
+    scores = _parse_thresholds(min_score, float, "min_score")
+    if any(not (0 <= s <= 1) for s in scores.values()):
+        raise HTTPException(status_code=400, detail="Score must be between 0 and 1")
+    counts = _parse_thresholds(min_count, int, "min_count")
+    return tree, scores, counts
+
+
+def _search_item(row) -> dict:
+    return {"uid": row[0], "timestamp": row[1], "labels": decode_label_set(row[2])}
+
+
+def search_predictions_service(
+    username: str,
+    db: Session,
+    q: str,
+    min_score: list[str] | None = None,
+    min_count: list[str] | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+):
+    tree, scores, counts = _prepare(q, min_score, min_count)
+    limit = clamp_page_size(limit)
+    rows = search_predictions(
+        db,
+        username,
+        tree,
+        min_scores=scores,
+        min_counts=counts,
+        since=as_naive_utc(since),
+        until=as_naive_utc(until),
+        limit=limit + 1,
+        after=decode_cursor(cursor),
+    )
+    return build_page(
+        rows,
+        limit,
+        to_item=_search_item,
+        to_cursor=lambda row: encode_cursor(row[1], row[0]),
+    )
+
+
+def stream_search_predictions_service(
+    username: str,
+    q: str,
+    min_score: list[str] | None = None,
+    min_count: list[str] | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    bind=None,
+):
+    tree, scores, counts = _prepare(q, min_score, min_count)
+    since, until = as_naive_utc(since), as_naive_utc(until)
+    return ndjson_response(
+        lambda db: iter_search_predictions(
+            db, username, tree, scores, counts, since=since, until=until
+        ),
+        _search_item,
+        bind=bind,
+    )
@@ -1,28 +1,26 @@
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from queries import (
-    count_recent_predictions,
-    get_detection_objects_for_recent_predictions,
-)
-from collections import Counter
+from queries import count_recent_predictions, get_label_rollups
 
 
 def get_stats_service(username: str, db: Session):
-    one_week_ago = datetime.now() - timedelta(days=7)
+    one_week_ago = datetime.utcnow() - timedelta(days=7)
 
     total_predictions = count_recent_predictions(db, username, one_week_ago)
-    detections = get_detection_objects_for_recent_predictions(
-        db, username, one_week_ago
-    )
+    # one row per label: (label, detection_count, score_sum) over the window
+    rollups = get_label_rollups(db, username, one_week_ago)
 
-    scores = [row.score for row in detections]
-    labels = [row.label for row in detections]
+    detection_count = sum(row.detection_count for row in rollups)
+    score_sum = sum(row.score_sum for row in rollups)
 
-    avg_confidence = round(sum(scores) / len(scores), 4) if scores else 0.0
-    label_counts = Counter(labels)
+    avg_confidence = round(score_sum / detection_count, 4) if detection_count else 0.0
+    label_counts = {
+        row.label: row.detection_count
+        for row in sorted(rollups, key=lambda r: r.detection_count, reverse=True)
+    }
 
     return {
         "total_predictions": total_predictions,
         "average_confidence_score": avg_confidence,
-        "most_common_labels": dict(label_counts),
+        "most_common_labels": label_counts,
     }
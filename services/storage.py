@@ -0,0 +1,118 @@
+# services/storage.py
+"""
+Image refs stored on PredictionSession are either local paths under
+uploads/ or, when AWS_S3_BUCKET is set, S3 object keys. Helpers here tell
+them apart and remove them in bulk.
+
+Local files with generated names (uuid / sha256, both leading with random
+hex) are sharded two levels deep, uploads/<type>/ab/cd/<name>, so no
+directory grows past a few thousand entries. Refs written before that stay
+flat until `python migrations.py shard-uploads` moves them; layouts() gives
+both spellings so lookups work either way.
+"""
+
+import os
+import string
+from concurrent.futures import ThreadPoolExecutor
+
+LOCAL_ROOT = "uploads"
+S3_ENABLED = bool(os.getenv("AWS_S3_BUCKET"))
+REMOVE_WORKERS = int(os.getenv("STORAGE_REMOVE_WORKERS", "8"))
+
+SHARD_LEVELS = 2  # uploads/<type>/ab/cd/<name>
+_HEX = frozenset(string.hexdigits)
+
+_pool = None
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(
+            max_workers=REMOVE_WORKERS, thread_name_prefix="storage"
+        )
+    return _pool
+
+
+def is_s3_ref(ref: str | None) -> bool:
+    if not ref or not S3_ENABLED:
+        return False
+    return not (os.path.isabs(ref) or ref.startswith(LOCAL_ROOT + "/"))
+
+
+def _shards(name: str) -> list[str]:
+    """Shard directories for a file name; [] for names we don't shard."""
+    stem = os.path.splitext(name)[0].lower()
+    prefix = stem[: 2 * SHARD_LEVELS]
+    if len(prefix) < 2 * SHARD_LEVELS or not _HEX.issuperset(prefix):
+        return []
+    return [prefix[i : i + 2] for i in range(0, len(prefix), 2)]
+
+
+def shard_path(base_dir: str, name: str) -> str:
+    """Where a new file called `name` goes under `base_dir`."""
+    return os.path.join(base_dir, *_shards(name), name)
+
+
+def layouts(path: str) -> tuple[str, str]:
+    """(sharded, flat) spellings of a local path given in either layout."""
+    head, name = os.path.split(path)
+    shards = _shards(name)
+    base = head
+    for part in reversed(shards):
+        base, tail = os.path.split(base)
+        if tail != part:
+            return os.path.join(head, *shards, name), path
+    return path, os.path.join(base, name)
+
+
+def owned_refs(session) -> tuple[str | None, str | None]:
+    """
+    (original, predicted) refs of a session that this service wrote and may
+    remove. A caller's own ?img= object is left out: other sessions or users
+    may still use it.
+    """
+    original = session.original_image if session.owns_original else None
+    return original, session.predicted_image
+
+
+def _remove_local(path: str) -> str | None:
+    """Returns None on success (or if already gone), else the error text."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Warning: Failed to delete {path} — {e}")
+        return str(e)
+    return None
+
+
+def _delete_s3(keys: list[str]) -> dict:  # pragma: no cover
+    from services.s3_utils import delete_objects
+
+    return delete_objects(keys)
+
+
+def remove_refs(refs) -> dict:
+    """
+    Remove many stored images: local files concurrently, S3 keys through
+    batched DeleteObjects. Returns {ref: error} for refs that could not be
+    removed; an empty dict means everything is gone.
+    """
+    refs = [r for r in dict.fromkeys(refs) if r]
+    s3_keys = [r for r in refs if is_s3_ref(r)]
+    local = [r for r in refs if not is_s3_ref(r)]
+
+    errors = {}
+    if len(local) == 1:
+        results = [_remove_local(local[0])]
+    else:
+        results = list(_executor().map(_remove_local, local))
+    errors.update({path: err for path, err in zip(local, results) if err})
+    if s3_keys:
+        try:
+            errors.update(_delete_s3(s3_keys))
+        except Exception as e:  # pragma: no cover
+            errors.update({key: str(e) for key in s3_keys})
+    return errors
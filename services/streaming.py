@@ -0,0 +1,47 @@
+# services/streaming.py
+import json
+from datetime import date, datetime
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+NDJSON = "application/x-ndjson"
+FLUSH_BYTES = 64 * 1024  # coalesce lines into ~64 KB socket writes
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON in request.headers.get("accept", "")
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def ndjson_response(fetch, to_item, bind=None) -> StreamingResponse:
+    """
+    Stream `fetch(db)` as one JSON object per line.
+
+    The generator opens its own session: the rows are pulled from a server-side
+    cursor while the body is being written, i.e. after the endpoint (and its
+    request-scoped session) has returned. Pass the request session's bind to
+    keep the stream on the same (primary or replica) database.
+    """
+    from db import SessionLocal
+
+    def _lines():
+        buf = []
+        size = 0
+        with SessionLocal(**({"bind": bind} if bind is not None else {})) as db:
+            for row in fetch(db):
+                line = json.dumps(to_item(row), default=_json_default) + "\n"
+                buf.append(line)
+                size += len(line)
+                if size >= FLUSH_BYTES:
+                    yield "".join(buf)
+                    buf, size = [], 0
+        if buf:
+            yield "".join(buf)
+
+    return StreamingResponse(_lines(), media_type=NDJSON)
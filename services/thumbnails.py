@@ -0,0 +1,209 @@
+# services/thumbnails.py
+"""
+Resized / re-encoded derivatives of stored images, generated on first request
+and kept in a size-capped disk cache (THUMBNAIL_CACHE_DIR).
+
+- Keys hash the source version and the requested parameters, so a changed
+  source never serves an old derivative. The version is the path plus
+  mtime/size, except for content-addressed files (blobs, S3 cache entries),
+  whose SHA-256 name already pins their bytes: blob_store bumps their mtime
+  on every re-upload, which must not orphan their derivatives.
+- LRU order lives in memory and is persisted as file mtimes (touched on hit),
+  so a restart rebuilds it from a directory scan.
+- Concurrent requests for the same missing derivative queue on a per-key
+  lock: one renders, the rest wait and then serve its file. Files appear via
+  os.replace, so readers in other processes never see partial output.
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from PIL import ExifTags, Image, ImageOps
+
+from infra import metrics
+
+THUMBNAIL_CACHE_DIR = os.getenv("THUMBNAIL_CACHE_DIR", "uploads/.derived")
+THUMBNAIL_CACHE_MAX_BYTES = int(
+    os.getenv("THUMBNAIL_CACHE_MAX_BYTES", str(256 * 1024 * 1024))
+)
+MAX_DIMENSION = 4096
+DEFAULT_QUALITY = 85
+
+# format -> (PIL format, media type, file extension)
+FORMATS = {
+    "png": ("PNG", "image/png", ".png"),
+    "jpeg": ("JPEG", "image/jpeg", ".jpg"),
+    "webp": ("WEBP", "image/webp", ".webp"),
+}
+_EXT_FORMATS = {".png": "png", ".jpg": "jpeg", ".jpeg": "jpeg", ".webp": "webp"}
+FORMAT_PATTERN = "^(png|jpeg|webp)$"
+_DIGEST_NAME = re.compile(r"[0-9a-f]{64}")
+
+
+def _source_version(source: str, st: os.stat_result) -> str:
+    """Cache key part identifying the bytes of `source` (see module notes)."""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    if _DIGEST_NAME.fullmatch(stem):
+        return f"sha256:{stem}"
+    return "\0".join(map(str, (source, st.st_mtime_ns, st.st_size)))
+
+
+def wants_derivative(w=None, h=None, fmt=None, quality=None) -> bool:
+    return any(v is not None for v in (w, h, fmt, quality))
+
+
+def source_format(path: str) -> str:
+    return _EXT_FORMATS.get(os.path.splitext(path)[1].lower(), "png")
+
+
+def media_type(fmt: str) -> str:
+    return FORMATS[fmt][1]
+
+
+# EXIF orientations that rotate by 90/270 degrees: stored width is shown height
+_TRANSPOSING_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def draft_box(size: tuple[int, int], w, h, orientation: int = 1) -> tuple[int, int]:
+    """
+    The size `size` (as stored) will be thumbnailed to for a w x h request
+    on the upright image, in stored orientation. draft() only shrinks while
+    both sides stay at or above its box, so the box must be the real output
+    size, not one padded with MAX_DIMENSION.
+    """
+    transposed = orientation in _TRANSPOSING_ORIENTATIONS
+    width, height = (size[1], size[0]) if transposed else size
+    scale = min(w / width if w else 1, h / height if h else 1, 1)
+    box = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return (box[1], box[0]) if transposed else box
+
+
+def render(source: str, target: str, w, h, fmt: str, quality: int):
+    """Fit `source` inside w x h (never upscaling) and save it as `fmt`."""
+    with Image.open(source) as im:
+        if w or h:
+            orientation = im.getexif().get(ExifTags.Base.Orientation, 1)
+            # JPEG can decode at 1/2, 1/4, 1/8 scale: far less work for thumbs
+            im.draft("RGB", draft_box(im.size, w, h, orientation))
+            box = (w or MAX_DIMENSION, h or MAX_DIMENSION)
+        im = ImageOps.exif_transpose(im)
+        if w or h:
+            im.thumbnail(box, Image.Resampling.LANCZOS)
+        pil_format = FORMATS[fmt][0]
+        options = {"optimize": True}
+        if pil_format in ("JPEG", "WEBP"):
+            options["quality"] = quality
+            if im.mode not in ("RGB", "L"):
+                im = im.convert("RGB")
+        im.save(target, format=pil_format, **options)
+
+
+class DerivativeCache:
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or THUMBNAIL_CACHE_DIR
+        self.max_bytes = THUMBNAIL_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        self._index = None  # name -> size, least recently used first
+        self._total = 0
+        self._key_locks = {}  # name -> [lock, waiters]
+
+    # ---------- index ----------
+    def _load(self):
+        if self._index is not None:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.is_file() and ".tmp-" not in entry.name:
+                st = entry.stat()
+                entries.append((st.st_mtime, entry.name, st.st_size))
+        self._index = OrderedDict(
+            (name, size) for _mtime, name, size in sorted(entries)
+        )
+        self._total = sum(self._index.values())
+
+    def _hit(self, name: str) -> bool:
+        path = os.path.join(self.root, name)
+        with self._lock:
+            self._load()
+            if name not in self._index:
+                return False
+            if not os.path.exists(path):  # removed behind our back
+                self._total -= self._index.pop(name)
+                return False
+            self._index.move_to_end(name)
+        try:
+            os.utime(path)  # persist recency for the next process / restart
+        except OSError:
+            pass
+        return True
+
+    def _add(self, name: str, size: int):
+        with self._lock:
+            self._load()
+            self._total -= self._index.pop(name, 0)
+            self._index[name] = size
+            self._total += size
+            while self._total > self.max_bytes and len(self._index) > 1:
+                victim, victim_size = self._index.popitem(last=False)
+                self._total -= victim_size
+                try:
+                    os.remove(os.path.join(self.root, victim))
+                except OSError:
+                    pass
+                metrics.incr("thumbnails.evictions")
+                metrics.incr("thumbnails.bytes_evicted", victim_size)
+
+    # ---------- per-key stampede lock ----------
+    def _acquire_key(self, name: str):
+        with self._lock:
+            slot = self._key_locks.setdefault(name, [threading.Lock(), 0])
+            slot[1] += 1
+        slot[0].acquire()
+        return slot
+
+    def _release_key(self, name: str, slot):
+        slot[0].release()
+        with self._lock:
+            slot[1] -= 1
+            if slot[1] == 0:
+                self._key_locks.pop(name, None)
+
+    # ---------- API ----------
+    def get_or_create(self, source: str, w=None, h=None, fmt=None, quality=None):
+        """Path of the derivative of `source`, rendering it on first use."""
+        fmt = fmt or source_format(source)
+        quality = quality or DEFAULT_QUALITY
+        version = _source_version(source, os.stat(source))
+        key = "\0".join(map(str, (version, w, h, fmt, quality)))
+        name = hashlib.sha256(key.encode()).hexdigest() + FORMATS[fmt][2]
+        path = os.path.join(self.root, name)
+
+        if self._hit(name):
+            metrics.incr("thumbnails.hits")
+            return path
+        slot = self._acquire_key(name)
+        try:
+            if self._hit(name):
+                # someone else rendered it while we waited
+                metrics.incr("thumbnails.hits")
+                metrics.incr("thumbnails.coalesced")
+                return path
+            metrics.incr("thumbnails.misses")
+            tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+            try:
+                render(source, tmp, w, h, fmt, quality)
+                os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            self._add(name, os.path.getsize(path))
+            return path
+        finally:
+            self._release_key(name, slot)
+
+
+derivative_cache = DerivativeCache()
@@ -1,5 +1,6 @@
 # services/validators.py
 import os
+from datetime import datetime, timezone
 from fastapi import HTTPException, UploadFile
 from PIL import Image
 import io
@@ -15,6 +16,16 @@ EXT_TO_MIME = {
 }
 
 
+def as_naive_utc(value: datetime | None) -> datetime | None:
+    """
+    Timestamps are stored as naive UTC; a client datetime with an offset is
+    converted to that, a naive one is taken to be UTC already.
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
 def sanitize_filename(name: str) -> str:
     name = (name or "").replace("\\", "/")
     return os.path.basename(name)
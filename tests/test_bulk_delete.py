@@ -0,0 +1,129 @@
+# tests/test_bulk_delete.py
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from db import SessionLocal
+from models import DetectionObject, PredictionSession, User
+from queries import session_summary
+from services import storage
+
+client = TestClient(app)
+AUTH = ("bulk", "bulkpw")
+
+
+@pytest.fixture(autouse=True)
+def _seed(tmp_path):
+    now = datetime.utcnow()
+    files = {}
+    with SessionLocal() as db:
+        if not db.query(User).filter_by(username="bulk").first():
+            db.add(User(username="bulk", password="bulkpw"))
+        for i, (age_days, label) in enumerate([(1, "dog"), (10, "cat"), (20, "dog")]):
+            uid = f"bulk-{i}"
+            orig, pred = tmp_path / f"{uid}.jpg", tmp_path / f"{uid}.png"
+            orig.write_bytes(b"o")
+            pred.write_bytes(b"p")
+            files[uid] = (orig, pred)
+            db.add(
+                PredictionSession(
+                    uid=uid,
+                    timestamp=now - timedelta(days=age_days),
+                    original_image=str(orig),
+                    predicted_image=str(pred),
+                    username="bulk",
+                    **session_summary([(label, 0.5)]),
+                )
+            )
+            db.add(DetectionObject(prediction_uid=uid, label=label, score=0.5))
+        db.commit()
+    yield files
+    with SessionLocal() as db:
+        db.query(DetectionObject).filter(
+            DetectionObject.prediction_uid.like("bulk-%")
+        ).delete(synchronize_session=False)
+        db.query(PredictionSession).filter_by(username="bulk").delete()
+        db.commit()
+
+
+def _remaining():
+    with SessionLocal() as db:
+        return sorted(
+            uid for (uid,) in db.query(PredictionSession.uid).filter_by(username="bulk")
+        )
+
+
+def test_delete_by_uids_reports_per_uid_outcome(_seed):
+    r = client.post(
+        "/predictions/bulk-delete",
+        json={"uids": ["bulk-0", "bulk-2", "nope"]},
+        auth=AUTH,
+    )
+    assert r.status_code == 200
+    body = r.json()
+    assert body["deleted"] == 2
+    assert {d["uid"]: d["status"] for d in body["results"]} == {
+        "bulk-0": "deleted",
+        "bulk-2": "deleted",
+        "nope": "not_found",
+    }
+    assert _remaining() == ["bulk-1"]
+    assert not any(p.exists() for p in _seed["bulk-0"] + _seed["bulk-2"])
+    assert all(p.exists() for p in _seed["bulk-1"])
+
+
+def test_delete_by_filters(_seed):
+    older = (datetime.utcnow() - timedelta(days=5)).isoformat()
+    r = client.post(
+        "/predictions/bulk-delete",
+        json={"older_than": older, "label": "dog"},
+        auth=AUTH,
+    )
+    assert r.json()["deleted"] == 1
+    assert _remaining() == ["bulk-0", "bulk-1"]
+
+
+def test_other_users_sessions_are_not_found():
+    r = client.post(
+        "/predictions/bulk-delete", json={"uids": ["bulk-0"]}, auth=("alice", "pass123")
+    )
+    assert r.json()["results"] == [{"uid": "bulk-0", "status": "not_found"}]
+    assert "bulk-0" in _remaining()
+
+
+def test_requires_uids_or_filter():
+    r = client.post("/predictions/bulk-delete", json={}, auth=AUTH)
+    assert r.status_code == 400
+
+
+def test_s3_refs_go_through_one_batched_call(monkeypatch):
+    monkeypatch.setattr(storage, "S3_ENABLED", True)
+    calls = []
+    monkeypatch.setattr(
+        storage,
+        "_delete_s3",
+        lambda keys: calls.append(keys) or {"c/k2": "AccessDenied"},
+    )
+    errors = storage.remove_refs(["c/original/k1", "c/k2", "uploads/original/x.jpg"])
+    assert calls == [["c/original/k1", "c/k2"]]
+    assert errors == {"c/k2": "AccessDenied"}
+
+
+def test_delete_objects_chunks_at_1000_keys(monkeypatch):
+    from services import s3_utils
+
+    class _FakeS3:
+        def __init__(self):
+            self.batches = []
+
+        def delete_objects(self, Bucket, Delete):
+            self.batches.append(len(Delete["Objects"]))
+            return {}
+
+    fake = _FakeS3()
+    monkeypatch.setattr(s3_utils, "AWS_S3_BUCKET", "bucket")
+    monkeypatch.setattr(s3_utils, "s3", lambda: fake)
+    assert s3_utils.delete_objects([f"k{i}" for i in range(2500)]) == {}
+    assert fake.batches == [1000, 1000, 500]
@@ -0,0 +1,141 @@
+# tests/test_conditional_get.py
+import os
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+import queries
+from app import app
+from db import SessionLocal
+from infra import prediction_cache
+from models import User
+from services.http_cache import IMMUTABLE_CACHE_CONTROL
+
+client = TestClient(app)
+AUTH = ("etagger", "etagpw")
+OTHER = ("etag-other", "otherpw")
+UID = "etag-1"
+ORIGINAL = os.path.join("uploads", "original", f"{UID}.png")
+PREDICTED = os.path.join("uploads", "predicted", f"{UID}.png")
+
+
+@pytest.fixture(autouse=True)
+def _seed():
+    with SessionLocal() as db:
+        for name, pw in (AUTH, OTHER):
+            if not db.query(User).filter_by(username=name).first():
+                db.add(User(username=name, password=pw))
+        db.commit()
+        queries.delete_sessions(db, [UID])
+        db.commit()
+        queries.save_prediction(
+            db, UID, ORIGINAL, PREDICTED, "etagger", [("dog", 0.5, "[]")]
+        )
+    for path in (ORIGINAL, PREDICTED):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as fh:
+            fh.write(b"\x89PNG\r\n\x1a\n" + b"\x00" * 64)
+    yield
+    with SessionLocal() as db:
+        queries.delete_sessions(db, [UID])
+        db.commit()
+    for path in (ORIGINAL, PREDICTED):
+        os.remove(path)
+
+
+def _no_db():
+    return patch(
+        "services.prediction_uid_service.query_prediction_by_uid",
+        side_effect=AssertionError("DB should not be read"),
+    )
+
+
+def _no_file_access(module):
+    return patch(
+        f"{module}.os.path.exists",
+        side_effect=AssertionError("file should not be touched"),
+    )
+
+
+def test_prediction_json_etag_and_304():
+    first = client.get(f"/prediction/{UID}", auth=AUTH)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+    # entry is hot after the first GET: revalidation needs no DB read
+    with _no_db():
+        again = client.get(
+            f"/prediction/{UID}", headers={"If-None-Match": etag}, auth=AUTH
+        )
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["etag"] == etag
+
+    listed = client.get(
+        f"/prediction/{UID}",
+        headers={"If-None-Match": f'"nope", W/{etag}'},
+        auth=AUTH,
+    )
+    assert listed.status_code == 304
+    stale = client.get(
+        f"/prediction/{UID}", headers={"If-None-Match": '"x"'}, auth=AUTH
+    )
+    assert stale.status_code == 200
+
+
+def test_304_still_checks_ownership():
+    etag = client.get(f"/prediction/{UID}", auth=AUTH).headers["etag"]
+    other = client.get(
+        f"/prediction/{UID}", headers={"If-None-Match": etag}, auth=OTHER
+    )
+    assert other.status_code == 403
+    prediction_cache.clear()  # cold path goes to the DB and agrees
+    other = client.get(
+        f"/prediction/{UID}", headers={"If-None-Match": etag}, auth=OTHER
+    )
+    assert other.status_code == 403
+    missing = client.get(
+        "/prediction/etag-missing", headers={"If-None-Match": "*"}, auth=AUTH
+    )
+    assert missing.status_code == 404
+
+
+def test_prediction_image_304_skips_file():
+    png = client.get(
+        f"/prediction/{UID}/image", headers={"Accept": "image/png"}, auth=AUTH
+    )
+    assert png.status_code == 200
+    assert png.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert png.headers["vary"] == "Accept"
+    jpeg = client.get(
+        f"/prediction/{UID}/image", headers={"Accept": "image/jpeg"}, auth=AUTH
+    )
+    assert jpeg.headers["etag"] != png.headers["etag"]
+
+    with _no_file_access("services.image_service"):
+        again = client.get(
+            f"/prediction/{UID}/image",
+            headers={"Accept": "image/png", "If-None-Match": png.headers["etag"]},
+            auth=AUTH,
+        )
+    assert again.status_code == 304
+
+
+def test_image_by_filename_304_skips_file_and_checks_owner():
+    url = f"/image/predicted/{UID}.png"
+    first = client.get(url, auth=AUTH)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+    client.get(f"/prediction/{UID}", auth=AUTH)  # warm the metadata cache
+    with _no_file_access("services.image_service"), patch(
+        "services.image_service.user_owns_image",
+        side_effect=AssertionError("DB should not be read"),
+    ):
+        again = client.get(url, headers={"If-None-Match": etag}, auth=AUTH)
+        assert again.status_code == 304
+        other = client.get(url, headers={"If-None-Match": etag}, auth=OTHER)
+        assert other.status_code == 404
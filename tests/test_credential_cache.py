@@ -0,0 +1,73 @@
+# tests/test_credential_cache.py
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+import infra
+import queries
+from app import app
+from db import SessionLocal
+from models import User
+
+
+class TestCredentialCache(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+        infra.credential_cache.clear()
+        infra.metrics.reset()
+
+    def test_second_request_skips_user_lookup(self):
+        self.client.get("/predictions/count", auth=("alice", "pass123"))
+        # any ORM query from here on (i.e. the User lookup) fails the request
+        with (
+            patch("sqlalchemy.orm.Session.query", side_effect=AssertionError),
+            patch(
+                "services.count_service.count_predictions_in_last_week",
+                return_value=0,
+            ),
+        ):
+            r = self.client.get("/predictions/count", auth=("alice", "pass123"))
+        self.assertEqual(r.status_code, 200)
+
+        # /metrics itself authenticates: a second cache hit
+        r = self.client.get("/metrics", auth=("alice", "pass123"))
+        self.assertEqual(r.json()["auth_cache.hits"], 2)
+        self.assertEqual(r.json()["auth_cache.misses"], 1)
+
+    def test_metrics_require_credentials(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        r = self.client.get("/metrics", auth=("alice", "wrong"))
+        self.assertEqual(r.status_code, 401)
+
+    def test_wrong_password_is_never_cached(self):
+        for _ in range(2):
+            r = self.client.get("/predictions/count", auth=("alice", "wrong"))
+            self.assertEqual(r.status_code, 401)
+        self.assertNotIn("auth_cache.hits", infra.metrics.snapshot())
+
+    def test_no_plaintext_kept(self):
+        infra.credential_cache.add("alice", "pass123")
+        for key, (username, _) in infra.credential_cache._data.items():
+            self.assertNotIn(b"pass123", key)
+            self.assertEqual(username, "alice")
+
+    def test_ttl_and_size_bound(self):
+        cache = infra.CredentialCache(ttl=1, max_entries=2)
+        with patch.object(infra.time, "time", return_value=100.0):
+            for name in ("a", "b", "c"):
+                cache.add(name, "pw")
+            self.assertFalse(cache.check("a", "pw"))  # evicted (LRU)
+            self.assertTrue(cache.check("c", "pw"))
+        with patch.object(infra.time, "time", return_value=102.0):
+            self.assertFalse(cache.check("c", "pw"))  # expired
+
+    def test_create_user_invalidates(self):
+        infra.credential_cache.add("cacheuser", "old")
+        with SessionLocal() as db:
+            db.query(User).filter_by(username="cacheuser").delete()
+            db.commit()
+            queries.create_user(db, "cacheuser", "new")
+            db.query(User).filter_by(username="cacheuser").delete()
+            db.commit()
+        self.assertFalse(infra.credential_cache.check("cacheuser", "old"))
@@ -13,6 +13,7 @@ class FakePrediction:
         self.predicted_image = predicted_image
         self.username = username
         self.timestamp = "2023-01-01T00:00:00"
+        self.owns_original = True
 
 
 class TestDeletePredictionByUID(unittest.TestCase):
@@ -27,8 +28,8 @@ class TestDeletePredictionByUID(unittest.TestCase):
     @patch("services.delete_service.get_prediction_by_uid_and_user")
     @patch("services.delete_service.delete_detection_objects_by_uid")
     @patch("services.delete_service.delete_prediction_session")
-    @patch("services.delete_service.os.remove")
-    @patch("services.delete_service.os.path.exists", return_value=True)
+    @patch("services.storage.os.remove")
+    @patch("services.storage.os.path.exists", return_value=True)
     def test_delete_existing_prediction(
         self,
         mock_exists,
@@ -66,8 +67,8 @@ class TestDeletePredictionByUID(unittest.TestCase):
     @patch("services.delete_service.get_prediction_by_uid_and_user")
     @patch("services.delete_service.delete_detection_objects_by_uid")
     @patch("services.delete_service.delete_prediction_session")
-    @patch("services.delete_service.os.remove")
-    @patch("services.delete_service.os.path.exists", return_value=True)
+    @patch("services.storage.os.remove")
+    @patch("services.storage.os.path.exists", return_value=True)
     def test_delete_when_file_remove_raises_exception(
         self,
         mock_exists,
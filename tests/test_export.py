@@ -0,0 +1,110 @@
+# tests/test_export.py
+import csv
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+
+import queries
+from app import app
+from db import SessionLocal
+from models import User
+from services import columnar, export_service
+
+client = TestClient(app)
+AUTH = ("exporter", "exportpw")
+SESSIONS = {
+    "exp-a": [("person", 0.9, "[1]"), ("dog", 0.4, "[2]")],
+    "exp-b": [("dog", 0.8, "[3]")],
+    "exp-c": [],
+}
+
+
+@pytest.fixture(autouse=True)
+def _seed(monkeypatch):
+    class _FakeModel:
+        names = {0: "person", 1: "dog"}
+
+    monkeypatch.setattr(export_service, "model", _FakeModel())
+    with SessionLocal() as db:
+        if not db.query(User).filter_by(username="exporter").first():
+            db.add(User(username="exporter", password="exportpw"))
+        queries.delete_sessions(db, list(SESSIONS))
+        db.commit()
+        for uid, detections in SESSIONS.items():
+            queries.save_prediction(db, uid, "o", "p", "exporter", detections)
+    yield
+    with SessionLocal() as db:
+        queries.delete_sessions(db, list(SESSIONS))
+        db.commit()
+
+
+def _csv_rows(params=None):
+    response = client.get(
+        "/predictions/export", params={"format": "csv", **(params or {})}, auth=AUTH
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    return list(csv.DictReader(io.StringIO(response.text)))
+
+
+def test_csv_has_one_row_per_detection_in_small_batches(monkeypatch):
+    monkeypatch.setattr(export_service, "EXPORT_BATCH_ROWS", 1)
+    rows = _csv_rows()
+    assert [r["uid"] for r in rows] == ["exp-a", "exp-a", "exp-b", "exp-c"]
+    assert {r["label"] for r in rows if r["uid"] == "exp-a"} == {"person", "dog"}
+    assert rows[-1]["label"] == ""  # session without detections keeps a row
+    assert rows[0]["timestamp"]
+
+
+def test_label_and_time_filters():
+    assert [(r["uid"], r["label"]) for r in _csv_rows({"label": "dog"})] == [
+        ("exp-a", "dog"),
+        ("exp-b", "dog"),
+    ]
+    assert _csv_rows({"since": "2999-01-01T00:00:00"}) == []
+    response = client.get("/predictions/export", params={"label": "unicorn"}, auth=AUTH)
+    assert response.status_code == 404
+
+
+def test_unknown_format_is_400():
+    response = client.get("/predictions/export", params={"format": "xls"}, auth=AUTH)
+    assert response.status_code == 400
+
+
+def test_falls_back_to_csv_without_pyarrow(monkeypatch):
+    monkeypatch.setattr(columnar, "have_pyarrow", lambda: False)
+    response = client.get(
+        "/predictions/export", params={"format": "parquet"}, auth=AUTH
+    )
+    assert response.status_code == 200
+    assert response.headers["x-export-format"] == "csv"
+    assert response.text.startswith("uid,timestamp,")
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_columnar_formats(fmt, monkeypatch):
+    pa = pytest.importorskip("pyarrow")
+    monkeypatch.setattr(export_service, "EXPORT_BATCH_ROWS", 2)
+    response = client.get("/predictions/export", params={"format": fmt}, auth=AUTH)
+    assert response.status_code == 200
+    assert response.headers["x-export-format"] == fmt
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(pa.BufferReader(response.content))
+        assert pq.ParquetFile(pa.BufferReader(response.content)).num_row_groups == 2
+    else:
+        table = pa.ipc.open_stream(response.content).read_all()
+    assert table.num_rows == 4
+    assert pa.types.is_timestamp(table.schema.field("timestamp").type)
+    assert table.column("uid").to_pylist() == ["exp-a", "exp-a", "exp-b", "exp-c"]
+
+
+def test_content_disposition_survives_any_username():
+    response = export_service.export_predictions_service('a"b;\r\nc/ü', fmt="csv")
+    header = response.headers["content-disposition"]
+    assert header == (
+        'attachment; filename="predictions-a_b___c__.csv"; '
+        "filename*=UTF-8''predictions-a%22b%3B%0D%0Ac%2F%C3%BC.csv"
+    )
@@ -0,0 +1,202 @@
+# tests/test_image_blobs.py
+import io
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import infra
+import queries
+import services.predict_service as ps
+from app import app
+from db import SessionLocal
+from models import ImageBlob, PredictionSession, User
+from services.blob_store import content_hash
+
+client = TestClient(app)
+AUTH = ("blobber", "blobpw")
+
+
+@pytest.fixture(autouse=True)
+def _dirs(monkeypatch, tmp_path):
+    with SessionLocal() as db:
+        if not db.query(User).filter_by(username="blobber").first():
+            db.add(User(username="blobber", password="blobpw"))
+            db.commit()
+    monkeypatch.setattr(ps, "UPLOAD_DIR", str(tmp_path / "original"))
+    monkeypatch.setattr(ps, "PREDICTED_DIR", str(tmp_path / "predicted"))
+    infra.metrics.reset()
+    yield
+
+
+def _image() -> bytes:
+    # unique pixels per test so blobs never collide with other tests' uploads
+    buf = io.BytesIO()
+    color = tuple(uuid.uuid4().bytes[:3])
+    Image.new("RGB", (8, 8), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _predict(data: bytes, name="x.png") -> str:
+    response = client.post(
+        "/predict", files={"file": (name, data, "image/png")}, auth=AUTH
+    )
+    assert response.status_code == 200
+    return response.json()["prediction_uid"]
+
+
+def _original(uid):
+    with SessionLocal() as db:
+        return db.query(PredictionSession.original_image).filter_by(uid=uid).scalar()
+
+
+def _refcount(ref):
+    with SessionLocal() as db:
+        return db.query(ImageBlob.refcount).filter_by(ref=ref).scalar()
+
+
+def test_identical_uploads_share_one_blob_until_last_delete():
+    data = _image()
+    first, second = _predict(data, "a.png"), _predict(data, "b.PNG")
+
+    ref = _original(first)
+    assert ref == _original(second)
+    assert os.path.basename(ref).startswith(content_hash(data))
+    assert open(ref, "rb").read() == data
+    assert _refcount(ref) == 2
+    assert len(os.listdir(ps.UPLOAD_DIR)) == 1
+    snap = infra.metrics.snapshot()
+    assert snap["blobs.stored"] == 1 and snap["blobs.deduplicated"] == 1
+
+    assert client.delete(f"/prediction/{first}", auth=AUTH).status_code == 200
+    assert os.path.exists(ref) and _refcount(ref) == 1
+
+    assert client.delete(f"/prediction/{second}", auth=AUTH).status_code == 200
+    assert not os.path.exists(ref) and _refcount(ref) is None
+
+
+def test_bulk_delete_releases_each_reference():
+    data = _image()
+    uids = [_predict(data) for _ in range(3)]
+    ref = _original(uids[0])
+
+    response = client.post(
+        "/predictions/bulk-delete", json={"uids": uids[:2]}, auth=AUTH
+    )
+    assert response.status_code == 200
+    assert os.path.exists(ref) and _refcount(ref) == 1
+
+    response = client.post(
+        "/predictions/bulk-delete", json={"uids": uids[2:]}, auth=AUTH
+    )
+    assert response.json()["results"] == [{"uid": uids[2], "status": "deleted"}]
+    assert not os.path.exists(ref) and _refcount(ref) is None
+
+
+def test_purge_keeps_blob_still_used_by_a_live_session(tmp_path):
+    data = _image()
+    old, live = _predict(data), _predict(data)
+    ref = _original(old)
+    with SessionLocal() as db:
+        db.query(PredictionSession).filter_by(uid=old).update(
+            {"timestamp": datetime.utcnow() - timedelta(days=91)}
+        )
+        db.commit()
+
+    infra.purge_old_uploads_db(upload_root=str(tmp_path), max_age_days=90)
+    assert os.path.exists(ref) and _refcount(ref) == 1
+    assert _original(live) == ref
+
+    with SessionLocal() as db:
+        db.query(PredictionSession).filter_by(uid=live).update(
+            {"timestamp": datetime.utcnow() - timedelta(days=91)}
+        )
+        db.commit()
+    infra.purge_old_uploads_db(upload_root=str(tmp_path), max_age_days=90)
+    assert not os.path.exists(ref) and _refcount(ref) is None
+
+
+def test_release_ignores_refs_that_are_not_blobs():
+    with SessionLocal() as db:
+        freed, blobs = queries.release_blobs(db, ["uploads/original/legacy.jpg", None])
+        db.rollback()
+    assert freed == [] and blobs == set()
+
+
+def test_purge_deletes_s3_objects_of_expired_sessions(s3_bucket, tmp_path):
+    from services import s3_utils
+
+    digest = uuid.uuid4().hex
+    blob = f"originals/{digest}.png"
+    uids = [uuid.uuid4().hex for _ in range(2)]
+    predicted = [s3_utils.build_prediction_key("blobber", uid) for uid in uids]
+    for key in (blob, *predicted):
+        s3_utils.upload_bytes(b"png", key)
+    with SessionLocal() as db:
+        for uid, key in zip(uids, predicted):
+            queries.acquire_blob(db, digest, blob, 3)
+            queries.save_prediction(db, uid, blob, key, "blobber", [])
+
+    def _expire(uid):
+        with SessionLocal() as db:
+            db.query(PredictionSession).filter_by(uid=uid).update(
+                {"timestamp": datetime.utcnow() - timedelta(days=91)}
+            )
+            db.commit()
+
+    def _exists(key):
+        return key in s3_utils.list_prefix(key)
+
+    _expire(uids[0])
+    infra.purge_old_uploads_db(upload_root=str(tmp_path), max_age_days=90)
+    assert not _exists(predicted[0])
+    assert _exists(blob) and _exists(predicted[1]) and _refcount(blob) == 1
+
+    _expire(uids[1])
+    infra.purge_old_uploads_db(upload_root=str(tmp_path), max_age_days=90)
+    assert not _exists(predicted[1]) and not _exists(blob)
+    assert _refcount(blob) is None
+
+
+def test_freed_s3_blobs_are_removed_after_commit(s3_bucket, monkeypatch):
+    from models import PendingUpload
+    from services import s3_utils, storage
+
+    blobs, uids = [], []
+    for _ in range(2):
+        digest, uid = uuid.uuid4().hex, uuid.uuid4().hex
+        blobs.append(f"originals/{digest}.png")
+        uids.append(uid)
+        s3_utils.upload_bytes(b"png", blobs[-1])
+        with SessionLocal() as db:
+            queries.acquire_blob(db, digest, blobs[-1], 3)
+            queries.save_prediction(db, uid, blobs[-1], "", "blobber", [])
+
+    real_delete = storage._delete_s3
+    visible = []
+
+    def _delete_s3(keys):
+        # another connection already sees the release: it was committed first
+        with SessionLocal() as db:
+            visible.extend(db.query(ImageBlob.ref).filter(ImageBlob.ref.in_(keys)))
+        return real_delete(keys)
+
+    monkeypatch.setattr(storage, "_delete_s3", _delete_s3)
+    assert client.delete(f"/prediction/{uids[0]}", auth=AUTH).status_code == 200
+    assert visible == [] and blobs[0] not in s3_utils.list_prefix(blobs[0])
+
+    # the same bytes were uploaded again meanwhile and queued for that key
+    with SessionLocal() as db:
+        queries.add_pending_upload(db, "uploads/original/requeued.png", blobs[1])
+        db.commit()
+    try:
+        assert client.delete(f"/prediction/{uids[1]}", auth=AUTH).status_code == 200
+        assert _refcount(blobs[1]) is None
+        assert blobs[1] in s3_utils.list_prefix(blobs[1])
+    finally:
+        with SessionLocal() as db:
+            db.query(PendingUpload).filter_by(key=blobs[1]).delete()
+            db.commit()
@@ -0,0 +1,99 @@
+# tests/test_image_serving.py
+import os
+import uuid
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+import queries
+from app import app
+from db import SessionLocal
+from models import User
+from services.storage import shard_path
+
+client = TestClient(app)
+AUTH = ("ranger", "rangepw")
+OTHER = ("range-other", "otherpw")
+BODY = bytes(range(256)) * 16  # 4 KiB
+
+
+@pytest.fixture
+def uid():
+    with SessionLocal() as db:
+        for name, pw in (AUTH, OTHER):
+            if not db.query(User).filter_by(username=name).first():
+                db.add(User(username=name, password=pw))
+        db.commit()
+    uid = uuid.uuid4().hex
+    original = shard_path(os.path.join("uploads", "original"), f"{uid}.png")
+    predicted = shard_path(os.path.join("uploads", "predicted"), f"{uid}.png")
+    for path in (original, predicted):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as fh:
+            fh.write(BODY)
+    with SessionLocal() as db:
+        queries.save_prediction(db, uid, original, predicted, "ranger", [])
+    yield uid
+    with SessionLocal() as db:
+        queries.delete_sessions(db, [uid])
+        db.commit()
+    for path in (original, predicted):
+        os.remove(path)
+
+
+def test_range_request_returns_only_requested_bytes(uid):
+    url = f"/image/predicted/{uid}.png"
+    full = client.get(url, auth=AUTH)
+    assert full.headers["accept-ranges"] == "bytes"
+    assert full.headers["content-length"] == str(len(BODY))
+
+    part = client.get(url, headers={"Range": "bytes=100-199"}, auth=AUTH)
+    assert part.status_code == 206
+    assert part.content == BODY[100:200]
+    assert part.headers["content-range"] == f"bytes 100-199/{len(BODY)}"
+
+    # resuming against the same ETag gets the tail; a stale one the whole file
+    etag = full.headers["etag"]
+    resumed = client.get(
+        url, headers={"Range": "bytes=4000-", "If-Range": etag}, auth=AUTH
+    )
+    assert resumed.status_code == 206 and resumed.content == BODY[4000:]
+    stale = client.get(
+        url, headers={"Range": "bytes=4000-", "If-Range": '"old"'}, auth=AUTH
+    )
+    assert stale.status_code == 200 and stale.content == BODY
+
+    beyond = client.get(url, headers={"Range": "bytes=9999-"}, auth=AUTH)
+    assert beyond.status_code == 416
+
+
+def test_head_sends_headers_without_body(uid):
+    head = client.head(f"/image/original/{uid}.png", auth=AUTH)
+    assert head.status_code == 200
+    assert head.content == b""
+    assert head.headers["content-length"] == str(len(BODY))
+    assert head.headers["etag"]
+
+    head = client.head(
+        f"/prediction/{uid}/image", headers={"Accept": "image/png"}, auth=AUTH
+    )
+    assert head.status_code == 200 and head.content == b""
+    part = client.get(
+        f"/prediction/{uid}/image",
+        headers={"Accept": "image/png", "Range": "bytes=0-9"},
+        auth=AUTH,
+    )
+    assert part.status_code == 206 and part.content == BODY[:10]
+
+
+def test_ownership_is_checked_before_the_file(uid):
+    with patch(
+        "services.image_service.os.stat",
+        side_effect=AssertionError("file should not be touched"),
+    ):
+        denied = client.get(f"/image/predicted/{uid}.png", auth=OTHER)
+        missing = client.get("/image/predicted/nope.png", auth=OTHER)
+    # same answer whether or not the file exists
+    assert denied.status_code == missing.status_code == 404
+    assert denied.json() == missing.json() == {"detail": "Access denied"}
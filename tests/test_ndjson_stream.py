@@ -0,0 +1,92 @@
+# tests/test_ndjson_stream.py
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from db import SessionLocal
+from models import DetectionObject, PredictionSession, User
+from queries import session_summary
+from services import streaming
+
+client = TestClient(app)
+AUTH = ("streamer", "streampw")
+NDJSON = {"Accept": "application/x-ndjson"}
+N = 300
+
+
+@pytest.fixture(autouse=True)
+def _seed(monkeypatch):
+    import services.label_service as ls
+
+    class _FakeModel:
+        names = {0: "person", 1: "dog"}
+
+    monkeypatch.setattr(ls, "model", _FakeModel())
+    base = datetime(2025, 2, 1)
+    with SessionLocal() as db:
+        if not db.query(User).filter_by(username="streamer").first():
+            db.add(User(username="streamer", password="streampw"))
+        for i in range(N):
+            uid = f"stream-{i:04d}"
+            db.add(
+                PredictionSession(
+                    uid=uid,
+                    timestamp=base + timedelta(seconds=i),
+                    original_image="",
+                    predicted_image="",
+                    username="streamer",
+                    **session_summary([("dog", 0.8)]),
+                )
+            )
+            db.add(
+                DetectionObject(prediction_uid=uid, label="dog", score=0.8, box="[]")
+            )
+        db.commit()
+    yield
+    with SessionLocal() as db:
+        db.query(DetectionObject).filter(
+            DetectionObject.prediction_uid.like("stream-%")
+        ).delete(synchronize_session=False)
+        db.query(PredictionSession).filter_by(username="streamer").delete()
+        db.commit()
+
+
+def _lines(resp):
+    return [json.loads(line) for line in resp.text.splitlines() if line]
+
+
+def test_label_stream_returns_every_row_unpaged(monkeypatch):
+    # small flush size so the body really goes out in several chunks
+    monkeypatch.setattr(streaming, "FLUSH_BYTES", 512)
+    r = client.get("/predictions/label/dog", headers=NDJSON, auth=AUTH)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    assert "X-Next-Cursor" not in r.headers
+    rows = _lines(r)
+    assert len(rows) == N
+    assert rows[0] == {"uid": "stream-0000", "timestamp": "2025-02-01T00:00:00"}
+
+
+def test_score_stream_returns_every_row():
+    r = client.get("/predictions/score/0.5", headers=NDJSON, auth=AUTH)
+    assert r.status_code == 200
+    rows = _lines(r)
+    assert len(rows) == N
+    assert all(row["score"] == 0.8 for row in rows)
+
+
+def test_stream_still_validates_before_streaming():
+    r = client.get("/predictions/label/unicorn", headers=NDJSON, auth=AUTH)
+    assert r.status_code == 404
+    r = client.get("/predictions/score/1.5", headers=NDJSON, auth=AUTH)
+    assert r.status_code == 400
+
+
+def test_default_accept_keeps_paged_json():
+    r = client.get("/predictions/label/dog", auth=AUTH)
+    assert r.status_code == 200
+    assert len(r.json()) == 50
+    assert r.headers["X-Next-Cursor"]
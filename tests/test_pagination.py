@@ -0,0 +1,109 @@
+# tests/test_pagination.py
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from db import SessionLocal
+from models import DetectionObject, PredictionSession, User
+from queries import session_summary
+from services import pagination
+
+client = TestClient(app)
+AUTH = ("pager", "pagerpw")
+
+
+@pytest.fixture(autouse=True)
+def _seed(monkeypatch):
+    import services.label_service as ls
+
+    class _FakeModel:
+        names = {0: "person", 1: "dog"}
+
+    monkeypatch.setattr(ls, "model", _FakeModel())
+    base = datetime(2025, 1, 1, 12, 0, 0)
+    with SessionLocal() as db:
+        if not db.query(User).filter_by(username="pager").first():
+            db.add(User(username="pager", password="pagerpw"))
+        for i in range(5):
+            uid = f"page-{i}"
+            # two sessions share a timestamp so uid has to break the tie
+            ts = base + timedelta(minutes=i if i != 3 else 2)
+            detections = [("person", 0.9, "[]"), ("person", 0.95, "[]")]
+            db.add(
+                PredictionSession(
+                    uid=uid,
+                    timestamp=ts,
+                    original_image="",
+                    predicted_image="",
+                    username="pager",
+                    **session_summary(detections),
+                )
+            )
+            for label, score, box in detections:
+                db.add(
+                    DetectionObject(
+                        prediction_uid=uid, label=label, score=score, box=box
+                    )
+                )
+        db.commit()
+    yield
+    with SessionLocal() as db:
+        db.query(DetectionObject).filter(
+            DetectionObject.prediction_uid.like("page-%")
+        ).delete(synchronize_session=False)
+        db.query(PredictionSession).filter_by(username="pager").delete()
+        db.commit()
+
+
+def _walk(url):
+    items, cursor = [], None
+    for _ in range(20):
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get(url, params=params, auth=AUTH)
+        assert r.status_code == 200
+        assert len(r.json()) <= 2
+        items.extend(r.json())
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            return items
+    raise AssertionError("pagination did not terminate")
+
+
+def test_label_pages_cover_every_session_once_in_keyset_order():
+    items = _walk("/predictions/label/person")
+    assert [d["uid"] for d in items] == [
+        "page-0",
+        "page-1",
+        "page-2",
+        "page-3",
+        "page-4",
+    ]
+
+
+def test_score_pages_return_each_session_once_with_its_best_score():
+    items = _walk("/predictions/score/0.5")
+    assert [d["uid"] for d in items] == [f"page-{i}" for i in range(5)]
+    assert all(d["score"] == 0.95 for d in items)
+
+
+def test_invalid_cursor_returns_400():
+    r = client.get(
+        "/predictions/label/person", params={"cursor": "not-a-cursor"}, auth=AUTH
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid cursor"
+
+
+def test_page_size_is_capped():
+    assert pagination.clamp_page_size(10_000) == pagination.MAX_PAGE_SIZE
+    assert pagination.clamp_page_size(None) == pagination.DEFAULT_PAGE_SIZE
+
+
+def test_cursor_roundtrip():
+    ts = datetime(2025, 1, 1, 12, 0, 0)
+    cursor = pagination.encode_cursor(ts, "uid-1", 7)
+    assert pagination.decode_cursor(cursor, size=3) == (ts, "uid-1", 7)
@@ -0,0 +1,110 @@
+# tests/test_prediction_cache.py
+import io
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import infra
+import queries
+from app import app
+from db import SessionLocal
+from models import User
+
+client = TestClient(app)
+AUTH = ("cacher", "cachepw")
+
+
+@pytest.fixture(autouse=True)
+def _user():
+    with SessionLocal() as db:
+        if not db.query(User).filter_by(username="cacher").first():
+            db.add(User(username="cacher", password="cachepw"))
+        if not db.query(User).filter_by(username="intruder").first():
+            db.add(User(username="intruder", password="intrudepw"))
+        db.commit()
+    infra.metrics.reset()
+    yield
+    with SessionLocal() as db:
+        queries.delete_sessions(db, ["cache-1", "cache-2"])
+        db.commit()
+
+
+def _seed(uid):
+    with SessionLocal() as db:
+        queries.save_prediction(
+            db, uid, "o.png", "p.png", "cacher", [("dog", 0.75, "[1, 2, 3, 4]")]
+        )
+
+
+def _no_db():
+    return patch(
+        "services.prediction_uid_service.query_prediction_by_uid",
+        side_effect=AssertionError("DB should not be read"),
+    )
+
+
+def test_lru_bound_and_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(infra.time, "time", lambda: now[0])
+    cache = infra.PredictionCache(ttl=10, max_entries=2)
+    cache.set("a", {"n": 1}, owner="u")
+    cache.set("b", {"n": 2}, owner="u")
+    assert cache.get("a") == {"n": 1}  # a is now most recent
+    cache.set("c", {"n": 3}, owner="u")
+    assert cache.get("b") is None  # least recently used was evicted
+    assert cache.get_entry("c") == ("u", {"n": 3})
+    now[0] += 11
+    assert cache.get("a") is None and cache.get("c") is None
+    assert infra.metrics.snapshot()["prediction_cache.evictions"] == 1
+
+
+def test_fill_is_dropped_after_concurrent_invalidation():
+    cache = infra.PredictionCache()
+    token = cache.token()
+    cache.invalidate("x")  # e.g. a delete committed while we were reading
+    cache.fill("x", {"stale": True}, "u", token)
+    assert cache.get("x") is None
+    cache.fill("x", {"fresh": True}, "u", cache.token())
+    assert cache.get("x") == {"fresh": True}
+
+
+def test_get_serves_hot_entry_without_db_and_checks_owner():
+    _seed("cache-1")
+    first = client.get("/prediction/cache-1", auth=AUTH)
+    assert first.status_code == 200
+    assert first.json()["detection_objects"] == [
+        {"label": "dog", "score": 0.75, "box": "[1, 2, 3, 4]"}
+    ]
+
+    with _no_db():
+        hot = client.get("/prediction/cache-1", auth=AUTH)
+        assert hot.status_code == 200
+        assert hot.json() == first.json()
+        other = client.get("/prediction/cache-1", auth=("intruder", "intrudepw"))
+        assert other.status_code == 403
+    assert infra.metrics.snapshot()["prediction_cache.hits"] == 2
+
+
+def test_delete_invalidates_entry():
+    _seed("cache-2")
+    assert client.get("/prediction/cache-2", auth=AUTH).status_code == 200
+    assert client.delete("/prediction/cache-2", auth=AUTH).status_code == 200
+    assert infra.prediction_cache.get("cache-2") is None
+    assert client.get("/prediction/cache-2", auth=AUTH).status_code == 404
+
+
+def test_predict_warms_cache():
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buf, format="PNG")
+    response = client.post(
+        "/predict", files={"file": ("x.png", buf.getvalue(), "image/png")}, auth=AUTH
+    )
+    assert response.status_code == 200
+    uid = response.json()["prediction_uid"]
+    with _no_db():
+        hot = client.get(f"/prediction/{uid}", auth=AUTH)
+    assert hot.status_code == 200
+    assert hot.json()["uid"] == uid
+    client.delete(f"/prediction/{uid}", auth=AUTH)
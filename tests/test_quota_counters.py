@@ -0,0 +1,171 @@
+# tests/test_quota_counters.py
+import threading
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+import pytest
+
+import infra
+from db import SessionLocal
+from models import PredictionSession
+
+
+@pytest.fixture(autouse=True)
+def _clean():
+    def wipe():
+        with SessionLocal() as db:
+            db.query(PredictionSession).filter_by(username="quota").delete()
+            db.commit()
+
+    wipe()
+    yield
+    wipe()
+
+
+def _add(uid, ts):
+    with SessionLocal() as db:
+        db.add(
+            PredictionSession(
+                uid=uid,
+                timestamp=ts,
+                original_image="",
+                predicted_image="",
+                username="quota",
+            )
+        )
+        db.commit()
+
+
+def test_seeded_from_db_then_served_from_memory():
+    now = datetime.utcnow()
+    stamps = [now - timedelta(hours=1), now - timedelta(hours=30)]
+    for i, ts in enumerate(stamps):
+        _add(f"q{i}", ts)
+    counters = infra.QuotaCounters()
+
+    with SessionLocal() as db:
+        monthly, daily = counters.counts(db, "quota", now)
+    assert daily == 1
+    assert monthly == sum(ts >= infra._month_start(now) for ts in stamps)
+
+    # once seeded, no DB access is needed
+    mock_db = MagicMock()
+    assert counters.counts(mock_db, "quota", now) == (monthly, daily)
+    mock_db.query.assert_not_called()
+
+
+def test_record_and_forget_track_writes():
+    now = datetime.utcnow()
+    counters = infra.QuotaCounters()
+    with SessionLocal() as db:
+        assert counters.counts(db, "quota", now) == (0, 0)
+        counters.record("quota", now, "q1")
+        counters.record("quota", now, "q2")
+        assert counters.counts(db, "quota", now) == (2, 2)
+        counters.record("quota", now, "q2")  # same session: counted once
+        counters.forget("quota", now, "q1")
+        counters.forget("quota", now, "q1")
+        assert counters.counts(db, "quota", now) == (1, 1)
+
+
+def test_24h_window_slides():
+    now = datetime.utcnow()
+    counters = infra.QuotaCounters()
+    with SessionLocal() as db:
+        counters.counts(db, "quota", now)
+        counters.record("quota", now, "q1")
+        later = now + timedelta(hours=25)
+        if later.month == now.month:
+            assert counters.counts(db, "quota", later) == (1, 0)
+
+
+def test_resync_picks_up_rows_written_elsewhere(monkeypatch):
+    now = datetime.utcnow()
+    t = [1000.0]
+    monkeypatch.setattr(infra.time, "time", lambda: t[0])
+    counters = infra.QuotaCounters(resync_every=60)
+    with SessionLocal() as db:
+        assert counters.counts(db, "quota", now) == (0, 0)
+        _add("q-other-worker", now)
+        assert counters.counts(db, "quota", now) == (0, 0)  # still cached
+        t[0] += 61
+        assert counters.counts(db, "quota", now) == (1, 1)
+
+
+def test_enforce_db_quota_keeps_429_messages():
+    now = datetime.utcnow()
+    _add("q1", now)
+    with SessionLocal() as db:
+        with pytest.raises(infra.HTTPException) as ex:
+            infra.enforce_db_quota(db, "quota", last_24h_limit=1)
+        assert ex.value.status_code == 429
+        assert ex.value.detail == "24h prediction quota exceeded"
+        # under the limit: no exception
+        infra.enforce_db_quota(db, "quota", monthly_limit=2, last_24h_limit=2)
+
+
+def test_resync_and_record_agree_on_counted_rows(monkeypatch):
+    now = datetime.utcnow()
+    counters = infra.QuotaCounters()
+    real_seed = counters._seed
+    during_seed = []
+
+    def _seed(db, username, at):
+        entry = real_seed(db, username, at)
+        for step in during_seed:
+            step()
+        return entry
+
+    monkeypatch.setattr(counters, "_seed", _seed)
+    with SessionLocal() as db:
+        # committed before the seed's query, record() lands during the seed
+        _add("q-before", now)
+        during_seed.append(lambda: counters.record("quota", now, "q-before"))
+        assert counters.counts(db, "quota", now) == (1, 1)
+
+        # committed after the query: the journaled record() counts it
+        counters.reset()
+        later = now + timedelta(seconds=1)
+        during_seed[:] = [
+            lambda: _add("q-after", later),
+            lambda: counters.record("quota", later, "q-after"),
+        ]
+        assert counters.counts(db, "quota", later) == (2, 2)
+
+        # committed before a reseed that has finished when record() runs
+        during_seed.clear()
+        counters.reset()
+        _add("q-seen", later)
+        assert counters.counts(db, "quota", later) == (3, 3)
+        counters.record("quota", later, "q-seen")
+        assert counters.counts(db, "quota", later) == (3, 3)
+
+
+def test_explicit_zero_resync_is_kept(monkeypatch):
+    monkeypatch.delenv("QUOTA_RESYNC_SECONDS", raising=False)
+    assert infra.QuotaCounters(resync_every=0).resync_every == 0
+    assert infra.QuotaCounters().resync_every == 300
+
+
+def test_seeding_one_user_does_not_block_others(monkeypatch):
+    counters = infra.QuotaCounters()
+    real_seed = counters._seed
+    entered, release = threading.Event(), threading.Event()
+
+    def _seed(db, username, now):
+        if username == "slow":
+            entered.set()
+            release.wait(5)
+        return real_seed(db, username, now)
+
+    monkeypatch.setattr(counters, "_seed", _seed)
+    with SessionLocal() as slow_db:
+        slow = threading.Thread(target=counters.counts, args=(slow_db, "slow"))
+        slow.start()
+        try:
+            assert entered.wait(5)
+            with SessionLocal() as db:
+                assert counters.counts(db, "quota") == (0, 0)
+        finally:
+            release.set()
+            slow.join()
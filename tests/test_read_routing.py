@@ -0,0 +1,133 @@
+# tests/test_read_routing.py
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import db
+from app import app
+from infra import metrics
+from migrations import run_migrations
+from models import User
+
+client = TestClient(app)
+AUTH = ("router", "routerpw")
+
+
+@pytest.fixture(autouse=True)
+def _reset():
+    metrics.reset()
+    db._last_write.clear()
+    with db.SessionLocal() as s:
+        if not s.query(User).filter_by(username="router").first():
+            s.add(User(username="router", password="routerpw"))
+            s.commit()
+    yield
+    db._last_write.clear()
+
+
+@pytest.fixture
+def replica(monkeypatch, tmp_path):
+    """An empty, separately migrated database standing in for a lagging replica."""
+    replica_engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    run_migrations(replica_engine)
+    monkeypatch.setattr(db, "read_engine", replica_engine)
+    monkeypatch.setattr(
+        db, "ReadSessionLocal", sessionmaker(bind=replica_engine, autoflush=False)
+    )
+    yield replica_engine
+    replica_engine.dispose()
+
+
+def test_without_replica_reads_use_primary():
+    assert db.read_session_factory("router") is db.SessionLocal
+    assert metrics.snapshot()["db.route.primary"] == 1
+
+
+def test_replica_unless_user_just_wrote(replica, monkeypatch):
+    assert db.read_session_factory("router") is db.ReadSessionLocal
+    db.mark_write("router")
+    assert db.read_session_factory("router") is db.SessionLocal
+    # other users are unaffected
+    assert db.read_session_factory("someone-else") is db.ReadSessionLocal
+    monkeypatch.setattr(db, "READ_YOUR_WRITES_SECONDS", 0)
+    assert db.read_session_factory("router") is db.ReadSessionLocal
+
+    counters = metrics.snapshot()
+    assert counters["db.route.replica"] == 3
+    assert counters["db.route.primary"] == 1
+    assert counters["db.route.read_your_writes"] == 1
+
+
+def test_endpoint_routes_to_replica(replica):
+    response = client.get("/predictions/count", auth=AUTH)
+    assert response.status_code == 200
+    assert metrics.snapshot()["db.route.replica"] == 1
+
+
+def test_delete_marks_write_so_next_read_hits_primary(replica):
+    response = client.delete("/prediction/does-not-exist", auth=AUTH)
+    assert response.status_code == 404  # nothing written, nothing marked
+    assert not db.wrote_recently("router")
+
+    response = client.post(
+        "/predictions/bulk-delete",
+        json={"older_than": "2000-01-01T00:00:00"},
+        auth=AUTH,
+    )
+    assert response.status_code == 200
+    assert db.wrote_recently("router")
+    client.get("/predictions/count", auth=AUTH)
+    assert metrics.snapshot()["db.route.read_your_writes"] == 1
+
+
+def test_stream_stays_on_routed_database(replica, monkeypatch):
+    import services.label_service as ls
+
+    class _FakeModel:
+        names = {0: "person"}
+
+    monkeypatch.setattr(ls, "model", _FakeModel())
+    binds = []
+    import services.streaming as streaming
+
+    real = streaming.ndjson_response
+
+    def spy(fetch, to_item, bind=None):
+        binds.append(bind)
+        return real(fetch, to_item, bind=bind)
+
+    monkeypatch.setattr(ls, "ndjson_response", spy)
+    response = client.get(
+        "/predictions/label/person",
+        headers={"Accept": "application/x-ndjson"},
+        auth=AUTH,
+    )
+    assert response.status_code == 200
+    assert binds == [replica]
+
+
+def test_replica_reads_do_not_fill_the_prediction_cache(replica):
+    from datetime import datetime
+
+    from sqlalchemy.orm import Session
+
+    from infra import prediction_cache
+    from models import PredictionSession
+
+    # on the lagging replica only, e.g. already deleted on the primary
+    with Session(replica) as s:
+        s.add(
+            PredictionSession(
+                uid="lagged",
+                timestamp=datetime.utcnow(),
+                original_image="",
+                predicted_image="",
+                username="router",
+            )
+        )
+        s.commit()
+    prediction_cache.clear()
+    assert client.get("/prediction/lagged", auth=AUTH).status_code == 200
+    assert prediction_cache.get_entry("lagged") is None
+    assert db.is_primary(db.SessionLocal()) and not db.is_primary(db.ReadSessionLocal())
@@ -0,0 +1,152 @@
+# tests/test_rollups.py
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from db import SessionLocal
+from models import (
+    DetectionObject,
+    LabelDailyRollup,
+    PredictionDailyRollup,
+    PredictionSession,
+    SessionLabel,
+    User,
+)
+import queries
+
+client = TestClient(app)
+AUTH = ("roller", "rollpw")
+
+
+def _wipe(db):
+    db.query(LabelDailyRollup).filter_by(username="roller").delete()
+    db.query(PredictionDailyRollup).filter_by(username="roller").delete()
+    db.query(SessionLabel).filter_by(username="roller").delete()
+    db.query(DetectionObject).filter(
+        DetectionObject.prediction_uid.like("roll-%")
+    ).delete(synchronize_session=False)
+    db.query(PredictionSession).filter_by(username="roller").delete()
+    db.commit()
+
+
+@pytest.fixture(autouse=True)
+def _clean():
+    with SessionLocal() as db:
+        if not db.query(User).filter_by(username="roller").first():
+            db.add(User(username="roller", password="rollpw"))
+        _wipe(db)
+    yield
+    with SessionLocal() as db:
+        _wipe(db)
+
+
+def _save(uid, detections):
+    with SessionLocal() as db:
+        queries.save_prediction(db, uid, "", "", "roller", detections)
+
+
+def _save_at(uid, timestamp, detections):
+    with SessionLocal() as db:
+        db.add(PredictionSession(uid=uid, timestamp=timestamp, username="roller"))
+        db.flush()
+        db.add_all(
+            DetectionObject(prediction_uid=uid, label=label, score=score, box=box)
+            for label, score, box in detections
+        )
+        queries._apply_rollups(db, "roller", timestamp, detections, sign=1)
+        db.commit()
+
+
+@pytest.fixture
+def far_east(monkeypatch):
+    """Local time 14h ahead of UTC, where naive local `now` skews the window."""
+    monkeypatch.setenv("TZ", "Etc/GMT-14")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def _rollup_snapshot(db):
+    labels = {
+        (r.day, r.label): (r.detection_count, round(r.score_sum, 6))
+        for r in db.query(LabelDailyRollup).filter_by(username="roller")
+        if r.detection_count
+    }
+    days = {
+        r.day: r.prediction_count
+        for r in db.query(PredictionDailyRollup).filter_by(username="roller")
+        if r.prediction_count
+    }
+    return labels, days
+
+
+def test_save_prediction_updates_rollups_and_endpoints_read_them():
+    _save("roll-1", [("person", 0.9, "[]"), ("person", 0.7, "[]"), ("dog", 0.5, "[]")])
+    _save("roll-2", [("dog", 0.9, "[]")])
+    _save("roll-3", [])
+
+    stats = client.get("/stats", auth=AUTH).json()
+    assert stats["total_predictions"] == 3
+    assert stats["most_common_labels"] == {"person": 2, "dog": 2}
+    assert stats["average_confidence_score"] == round((0.9 + 0.7 + 0.5 + 0.9) / 4, 4)
+
+    assert sorted(client.get("/labels", auth=AUTH).json()["labels"]) == [
+        "dog",
+        "person",
+    ]
+    assert client.get("/predictions/count", auth=AUTH).json()["count"] == 3
+
+
+def test_delete_subtracts_from_rollups():
+    _save("roll-1", [("person", 0.9, "[]")])
+    _save("roll-2", [("dog", 0.4, "[]")])
+
+    r = client.delete("/prediction/roll-1", auth=AUTH)
+    assert r.status_code == 200
+
+    assert client.get("/labels", auth=AUTH).json()["labels"] == ["dog"]
+    assert client.get("/predictions/count", auth=AUTH).json()["count"] == 1
+
+
+def test_old_days_fall_out_of_the_window():
+    with SessionLocal() as db:
+        queries._apply_rollups(
+            db,
+            "roller",
+            datetime.utcnow() - timedelta(days=30),
+            [("cat", 0.9, "[]")],
+            sign=1,
+        )
+        db.commit()
+    assert client.get("/labels", auth=AUTH).json()["labels"] == []
+
+
+def test_window_is_rolling_seven_days_in_utc(far_east):
+    week_ago = datetime.utcnow() - timedelta(days=7)
+    # same UTC day as the window start, on either side of it
+    _save_at("roll-out", week_ago - timedelta(minutes=5), [("cat", 0.5, "[]")])
+    _save_at("roll-in", week_ago + timedelta(minutes=5), [("dog", 0.9, "[]")])
+    _save_at("roll-new", datetime.utcnow(), [("dog", 0.7, "[]")])
+
+    stats = client.get("/stats", auth=AUTH).json()
+    assert stats["total_predictions"] == 2
+    assert stats["most_common_labels"] == {"dog": 2}
+    assert stats["average_confidence_score"] == 0.8
+    assert client.get("/labels", auth=AUTH).json()["labels"] == ["dog"]
+    assert client.get("/predictions/count", auth=AUTH).json()["count"] == 2
+
+
+def test_rebuild_matches_incremental_rollups():
+    _save("roll-1", [("person", 0.9, "[]"), ("dog", 0.5, "[]")])
+    _save("roll-2", [("person", 0.8, "[]")])
+    with SessionLocal() as db:
+        incremental = _rollup_snapshot(db)
+        # corrupt, then rebuild from the raw tables
+        db.query(LabelDailyRollup).filter_by(username="roller").delete()
+        db.commit()
+        queries.rebuild_rollups(db, username="roller")
+        assert _rollup_snapshot(db) == incremental
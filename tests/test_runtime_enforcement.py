@@ -10,7 +10,7 @@ from PIL import Image
 
 from app import app
 from db import SessionLocal
-from models import PredictionSession, DetectionObject
+from models import PredictionSession, DetectionObject, ImageBlob, SessionLabel
 from infra import purge_old_uploads_db
 import infra  # import module so we can monkeypatch internals
 
@@ -22,8 +22,10 @@ import infra  # import module so we can monkeypatch internals
 def _truncate_tables():
     # wipe rows so UIDs won't collide across runs
     with SessionLocal() as db:
+        db.query(SessionLabel).delete()
         db.query(DetectionObject).delete()
         db.query(PredictionSession).delete()
+        db.query(ImageBlob).delete()
         db.commit()
     yield
 
@@ -377,3 +379,125 @@ def test_purge_old_uploads_filesystem(tmp_path):
     removed = infra.purge_old_uploads(str(tmp_path), max_age_days=90)
     assert removed == 1
     assert not oldf.exists() and newf.exists()
+
+
+# ---------- retention engine --------------------------------------------------
+
+
+def _seed_expired(uploads, n, days_old=91):
+    (uploads / "original").mkdir(parents=True, exist_ok=True)
+    (uploads / "predicted").mkdir(parents=True, exist_ok=True)
+    ts = datetime.utcnow() - timedelta(days=days_old)
+    with SessionLocal() as db:
+        for i in range(n):
+            orig = uploads / "original" / f"exp{i}.png"
+            pred = uploads / "predicted" / f"exp{i}.png"
+            orig.write_bytes(b"o" * 10)
+            pred.write_bytes(b"p" * 5)
+            db.add(
+                PredictionSession(
+                    uid=f"exp-{i}",
+                    timestamp=ts + timedelta(seconds=i),
+                    original_image=str(orig),
+                    predicted_image=str(pred),
+                    username=None,
+                )
+            )
+            db.add(DetectionObject(prediction_uid=f"exp-{i}", label="cat", score=0.5))
+        db.commit()
+
+
+def test_purge_deletes_rows_in_batches_and_reports_metrics(tmp_path):
+    uploads = tmp_path / "uploads"
+    _seed_expired(uploads, 5)
+    infra.metrics.reset()
+
+    removed = purge_old_uploads_db(
+        upload_root=str(uploads), max_age_days=90, batch_size=2
+    )
+
+    assert removed == 10
+    with SessionLocal() as db:
+        assert (
+            db.query(PredictionSession)
+            .filter(PredictionSession.uid.like("exp-%"))
+            .count()
+            == 0
+        )
+        assert (
+            db.query(DetectionObject)
+            .filter(DetectionObject.prediction_uid.like("exp-%"))
+            .count()
+            == 0
+        )
+    snap = infra.metrics.snapshot()
+    assert snap["retention.rows_deleted"] == 5
+    assert snap["retention.files_removed"] == 10
+    assert snap["retention.bytes_reclaimed"] == 5 * (10 + 5)
+
+
+def test_purge_stops_when_time_budget_is_spent(tmp_path):
+    uploads = tmp_path / "uploads"
+    _seed_expired(uploads, 3)
+
+    assert purge_old_uploads_db(upload_root=str(uploads), time_budget_s=0) == 0
+    with SessionLocal() as db:
+        assert db.query(PredictionSession).count() == 3  # next pass resumes
+
+
+def test_purge_archives_batches_before_deleting(tmp_path):
+    import csv
+    import gzip
+
+    uploads = tmp_path / "uploads"
+    archive = tmp_path / "archive"
+    _seed_expired(uploads, 3)
+    infra.metrics.reset()
+
+    purge_old_uploads_db(
+        upload_root=str(uploads),
+        batch_size=2,
+        archive_dir=str(archive),
+    )
+
+    sessions = sorted(archive.rglob("prediction_sessions-*"))
+    detections = sorted(archive.rglob("detection_objects-*"))
+    assert sessions and detections
+    assert all(p.parent.parent == archive for p in sessions)  # <dir>/YYYY-MM/
+
+    def read(paths):
+        if paths[0].suffix == ".parquet":  # pragma: no cover (pyarrow installed)
+            import pyarrow.parquet as pq
+
+            return [r for p in paths for r in pq.read_table(p).to_pylist()]
+        rows = []
+        for p in paths:
+            with gzip.open(p, "rt", newline="") as fh:
+                rows += list(csv.DictReader(fh))
+        return rows
+
+    assert sorted(r["uid"] for r in read(sessions)) == ["exp-0", "exp-1", "exp-2"]
+    assert {r["label"] for r in read(detections)} == {"cat"}
+    snap = infra.metrics.snapshot()
+    assert snap["retention.rows_archived"] == 3
+    assert snap["retention.rows_deleted"] == 3
+
+
+def test_purge_keeps_rows_when_archive_fails(tmp_path, monkeypatch):
+    import services.columnar as columnar
+
+    def boom(*_args, **_kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(columnar, "write_rows", boom)
+    uploads = tmp_path / "uploads"
+    _seed_expired(uploads, 2)
+    infra.metrics.reset()
+
+    assert (
+        purge_old_uploads_db(upload_root=str(uploads), archive_dir=str(tmp_path / "a"))
+        == 0
+    )
+    with SessionLocal() as db:
+        assert db.query(PredictionSession).count() == 2
+    assert infra.metrics.snapshot()["retention.archive_errors"] == 1
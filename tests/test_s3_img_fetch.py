@@ -0,0 +1,115 @@
+# tests/test_s3_img_fetch.py
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import infra
+import services.predict_service as ps
+from app import app
+from db import SessionLocal
+from models import ImageBlob, PredictionSession
+from services import s3_uploader, s3_utils
+from tests.conftest import png_bytes, predict
+
+client = TestClient(app)
+AUTH = ("fetcher", "fetchpw")
+
+
+@pytest.fixture
+def s3_auth():
+    return AUTH
+
+
+def _predict(img):
+    return predict(client, AUTH, img=img)
+
+
+def test_img_key_is_fetched_with_one_get(s3_mode, s3_calls):
+    key = "fetcher/original/photo.png"
+    s3_utils.upload_bytes(png_bytes((32, 32)), key, "image/png")
+    s3_calls.clear()
+
+    response = _predict("photo.png")  # bare name -> <chat_id>/original/<name>
+    assert response.status_code == 200
+    assert s3_calls == ["GetObject"]
+    with SessionLocal() as db:
+        session = db.get(PredictionSession, response.json()["prediction_uid"])
+        assert session.original_image == key
+
+
+def test_missing_oversized_and_invalid_objects(s3_mode, s3_calls, monkeypatch):
+    s3_calls.clear()
+    missing = _predict("fetcher/original/nope.png")
+    assert missing.status_code == 404
+    assert missing.json()["detail"] == "S3 object not found: fetcher/original/nope.png"
+    assert s3_calls == ["GetObject"]
+
+    data = png_bytes((32, 32))
+    s3_utils.upload_bytes(data, "x/big.png", "image/png")
+    monkeypatch.setattr(ps, "MAX_BYTES", len(data) - 1)
+    assert _predict("x/big.png").status_code == 413
+
+    monkeypatch.setattr(ps, "MAX_BYTES", len(data))
+    assert _predict("x/big.png").status_code == 200
+
+    s3_utils.upload_bytes(b"not an image", "x/junk.png", "image/png")
+    assert _predict("x/junk.png").status_code == 415
+    s3_utils.upload_bytes(b"", "x/empty.png", "image/png")
+    assert _predict("x/empty.png").status_code == 415
+
+
+def test_img_naming_a_stored_blob_shares_its_reference(s3_mode):
+    first = predict(client, AUTH, png_bytes()).json()
+    uploader = s3_uploader.S3Uploader(workers=1)
+    assert [uploader.upload_one(i) for i in s3_mode.ids] == ["done", "done"]
+    key = first["s3"]["original_key"]
+    assert key.startswith("originals/")
+
+    second = _predict(key)
+    assert second.status_code == 200
+    uid = second.json()["prediction_uid"]
+    assert client.delete(f"/prediction/{uid}", auth=AUTH).status_code == 200
+    # the first session's original survives the second one's delete
+    with SessionLocal() as db:
+        assert db.query(ImageBlob.refcount).filter_by(ref=key).scalar() == 1
+    assert s3_utils.download_bytes(key)
+
+    uid = first["prediction_uid"]
+    assert client.delete(f"/prediction/{uid}", auth=AUTH).status_code == 200
+    with pytest.raises(Exception):
+        s3_utils.download_bytes(key)
+
+
+# its own user: the module's posts would otherwise pass the upload rate limit
+@pytest.mark.parametrize("s3_auth", [("keeper", "keeppw")])
+def test_deletes_never_remove_the_callers_own_object(s3_mode, s3_auth):
+    key = "fetcher/original/mine.png"
+    s3_utils.upload_bytes(png_bytes(), key, "image/png")
+    uids = [
+        predict(client, s3_auth, img=key).json()["prediction_uid"] for _ in range(3)
+    ]
+    with SessionLocal() as db:
+        assert not db.get(PredictionSession, uids[0]).owns_original
+
+    assert client.delete(f"/prediction/{uids[0]}", auth=s3_auth).status_code == 200
+    bulk = client.post(
+        "/predictions/bulk-delete", json={"uids": [uids[1]]}, auth=s3_auth
+    )
+    assert bulk.json()["deleted"] == 1
+    with SessionLocal() as db:
+        db.query(PredictionSession).filter_by(uid=uids[2]).update(
+            {"timestamp": datetime.utcnow() - timedelta(days=365)}
+        )
+        db.commit()
+    infra.purge_old_uploads_db(archive_dir="")
+    with SessionLocal() as db:
+        assert db.get(PredictionSession, uids[2]) is None
+    assert s3_utils.download_bytes(key)
+
+
+def test_capped_download_reports_full_size(s3_bucket):
+    s3_utils.upload_bytes(b"0123456789", "ten.bin")
+    assert s3_utils.download_bytes_capped("ten.bin", 10) == (b"0123456789", 10)
+    assert s3_utils.download_bytes_capped("ten.bin", 9) == (b"", 10)
+    assert s3_utils.download_bytes_capped("ten.bin", 100) == (b"0123456789", 10)
@@ -0,0 +1,112 @@
+# tests/test_s3_redirects.py
+import io
+import time
+import uuid
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import infra
+import queries
+from app import app
+from db import SessionLocal
+from models import User
+from services import s3_utils
+
+client = TestClient(app, follow_redirects=False)
+AUTH = ("s3user", "s3pw")
+OTHER = ("s3-other", "otherpw")
+
+
+def _png() -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (40, 20), (10, 120, 200)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+PNG = _png()
+
+
+@pytest.fixture
+def session(s3_bucket):
+    with SessionLocal() as db:
+        for name, pw in (AUTH, OTHER):
+            if not db.query(User).filter_by(username=name).first():
+                db.add(User(username=name, password=pw))
+        db.commit()
+    uid = uuid.uuid4().hex
+    original = f"originals/{uuid.uuid4().hex}.png"
+    predicted = s3_utils.build_prediction_key("chat", uid)
+    for key in (original, predicted):
+        s3_utils.upload_bytes(PNG, key, "image/png")
+    with SessionLocal() as db:
+        queries.save_prediction(db, uid, original, predicted, "s3user", [])
+    yield uid, original, predicted
+    with SessionLocal() as db:
+        queries.delete_sessions(db, [uid])
+        db.commit()
+
+
+def _key_of(url):
+    return urlparse(url).path.lstrip("/").removeprefix(f"{s3_utils.AWS_S3_BUCKET}/")
+
+
+def test_prediction_image_redirects_to_cached_presigned_url(session):
+    uid, _original, predicted = session
+    url = f"/prediction/{uid}/image"
+    first = client.get(url, headers={"Accept": "image/png"}, auth=AUTH)
+    assert first.status_code == 307
+    location = first.headers["location"]
+    assert _key_of(location) == predicted
+    assert "X-Amz-Signature" in parse_qs(urlparse(location).query)
+    max_age = int(first.headers["cache-control"].split("max-age=")[1])
+    assert (
+        0 < max_age <= s3_utils.S3_PRESIGN_EXPIRES - s3_utils.S3_PRESIGN_MIN_REMAINING
+    )
+
+    again = client.get(url, headers={"Accept": "image/png"}, auth=AUTH)
+    assert again.headers["location"] == location
+    snap = infra.metrics.snapshot()
+    assert snap["s3.presign.misses"] == 1 and snap["s3.presign.hits"] == 1
+
+    # the bytes come from S3, not from us
+    assert requests.get(location).content == PNG
+
+
+def test_image_by_filename_redirects_for_owner_only(session):
+    uid, original, predicted = session
+    for key, kind in ((original, "original"), (predicted, "predicted")):
+        name = key.rsplit("/", 1)[1]
+        response = client.get(f"/image/{kind}/{name}", auth=AUTH)
+        assert response.status_code == 307
+        assert _key_of(response.headers["location"]) == key
+        assert client.get(f"/image/{kind}/{name}", auth=OTHER).status_code == 404
+
+    # variants are rendered here from the local S3 object cache
+    resized = client.get(f"/image/predicted/{uid}.png?w=10", auth=AUTH)
+    assert resized.status_code == 200
+    assert Image.open(io.BytesIO(resized.content)).size == (10, 5)
+    again = client.get(f"/image/original/{original.rsplit('/', 1)[1]}?w=10", auth=AUTH)
+    assert again.status_code == 200
+    snap = infra.metrics.snapshot()
+    assert snap["s3.cache.misses"] == 2
+    assert client.get("/metrics", auth=AUTH).json()["s3.cache.hit_ratio"] == 0.0
+
+
+def test_presigned_url_lifetime_follows_credentials(s3_bucket, monkeypatch):
+    now = [time.time()]
+    monkeypatch.setattr(s3_utils.time, "time", lambda: now[0])
+    monkeypatch.setattr(s3_utils, "_credentials_expire_at", lambda: now[0] + 900)
+    cache = s3_utils.PresignedUrlCache(expires_in=3600, min_remaining=300)
+
+    url, expires_at = cache.get("k")
+    assert expires_at == now[0] + 900  # capped at the session token's expiry
+    assert parse_qs(urlparse(url).query)["X-Amz-Expires"] == ["900"]
+
+    now[0] += 500  # 400s left: still reused
+    assert cache.get("k")[0] == url
+    now[0] += 200  # 200s left: too close to expiry, signed again
+    assert cache.get("k")[1] == now[0] + 900
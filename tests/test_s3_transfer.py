@@ -0,0 +1,55 @@
+# tests/test_s3_transfer.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from services import s3_utils
+
+MiB = 1024**2
+
+
+def test_client_and_transfer_settings_come_from_config(s3_bucket, monkeypatch):
+    monkeypatch.setattr(s3_utils, "S3_MAX_POOL_CONNECTIONS", 64)
+    monkeypatch.setattr(s3_utils, "S3_RETRY_MODE", "adaptive")
+    monkeypatch.setattr(s3_utils, "S3_MAX_ATTEMPTS", 7)
+    monkeypatch.setattr(s3_utils, "S3_MAX_CONCURRENCY", 3)
+    s3_utils.reset_clients()
+
+    config = s3_utils.s3().meta.config
+    assert config.max_pool_connections == 64
+    assert config.retries["mode"] == "adaptive"
+    assert config.retries["total_max_attempts"] == 7
+    assert config.signature_version == "s3v4"
+    assert s3_utils.transfer_manager().config.max_request_concurrency == 3
+
+
+def test_client_and_manager_are_shared_across_threads(s3_bucket):
+    s3_utils.reset_clients()
+    with ThreadPoolExecutor(8) as pool:
+        clients = set(map(id, pool.map(lambda _: s3_utils.s3(), range(32))))
+        managers = set(
+            map(id, pool.map(lambda _: s3_utils.transfer_manager(), range(32)))
+        )
+    assert len(clients) == 1 and len(managers) == 1
+    assert s3_utils.transfer_manager().client is s3_utils.s3()
+
+
+def test_large_objects_go_multipart_and_round_trip(s3_bucket, monkeypatch, tmp_path):
+    monkeypatch.setattr(s3_utils, "S3_MULTIPART_THRESHOLD", 5 * MiB)
+    monkeypatch.setattr(s3_utils, "S3_MULTIPART_CHUNKSIZE", 5 * MiB)
+    s3_utils.reset_clients()
+    data = os.urandom(11 * MiB)
+    src = tmp_path / "big.bin"
+    src.write_bytes(data)
+
+    s3_utils.upload_file(str(src), "big.bin")
+    etag = s3_utils.s3().head_object(Bucket=s3_bucket, Key="big.bin")["ETag"]
+    assert etag.strip('"').endswith("-3")  # three 5 MiB parts
+
+    dest = tmp_path / "nested" / "copy.bin"
+    s3_utils.download_to_path("big.bin", str(dest))
+    assert dest.read_bytes() == data
+
+    # small payloads stay single-part
+    s3_utils.upload_bytes(b"tiny", "tiny.txt", "text/plain")
+    head = s3_utils.s3().head_object(Bucket=s3_bucket, Key="tiny.txt")
+    assert "-" not in head["ETag"] and head["ContentType"] == "text/plain"
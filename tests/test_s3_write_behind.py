@@ -0,0 +1,189 @@
+# tests/test_s3_write_behind.py
+import os
+from concurrent.futures import wait
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import queries
+from app import app
+from db import SessionLocal
+from models import ImageBlob, PendingUpload, PredictionSession
+from services import s3_uploader, s3_utils
+from tests.conftest import png_bytes, predict
+
+client = TestClient(app, follow_redirects=False)
+AUTH = ("writer", "writepw")
+
+
+@pytest.fixture
+def s3_auth():
+    return AUTH
+
+
+def _predict(data: bytes) -> dict:
+    response = predict(client, AUTH, data)
+    assert response.status_code == 200
+    return response.json()
+
+
+def _refs(uid):
+    with SessionLocal() as db:
+        return (
+            db.query(
+                PredictionSession.original_image, PredictionSession.predicted_image
+            )
+            .filter_by(uid=uid)
+            .one()
+        )
+
+
+def _object(key):
+    return s3_utils.download_bytes(key)
+
+
+def test_response_returns_before_upload_then_refs_switch(s3_mode):
+    data = png_bytes()
+    body = _predict(data)
+    uid = body["prediction_uid"]
+    assert body["s3"]["upload"] == "pending"
+    assert body["s3"]["predicted_key"] == f"writer/predicted/{uid}.png"
+    original, predicted = _refs(uid)
+    assert os.path.exists(original) and os.path.exists(predicted)
+    assert len(s3_mode.ids) == 2
+
+    uploader = s3_uploader.S3Uploader(workers=2)
+    assert [uploader.upload_one(i) for i in s3_mode.ids] == ["done", "done"]
+    assert _refs(uid) == (body["s3"]["original_key"], body["s3"]["predicted_key"])
+    assert _object(body["s3"]["original_key"]) == data
+    assert not os.path.exists(original) and not os.path.exists(predicted)
+    with SessionLocal() as db:
+        assert db.query(PendingUpload).count() == 0
+        blob = db.query(ImageBlob).filter_by(ref=body["s3"]["original_key"]).one()
+        assert blob.refcount == 1
+
+    image = client.get(
+        f"/prediction/{uid}/image", headers={"Accept": "image/png"}, auth=AUTH
+    )
+    assert image.status_code == 307
+
+    # same bytes again: the confirmed blob is reused, only the new
+    # annotated image is queued
+    again = _predict(data)
+    assert _refs(again["prediction_uid"])[0] == body["s3"]["original_key"]
+    assert len(s3_mode.ids) == 3
+
+    for u in (uid, again["prediction_uid"]):
+        assert client.delete(f"/prediction/{u}", auth=AUTH).status_code == 200
+    with pytest.raises(Exception):
+        _object(body["s3"]["original_key"])
+
+
+def test_failed_upload_is_retried_with_backoff(s3_mode, monkeypatch):
+    body = _predict(png_bytes())
+    real_put = s3_uploader._put_file
+
+    def _down(local_path, key):
+        raise ConnectionError("S3 unreachable")
+
+    monkeypatch.setattr(s3_uploader, "_put_file", _down)
+    uploader = s3_uploader.S3Uploader(workers=2)
+    assert [uploader.upload_one(i) for i in s3_mode.ids] == ["retry", "retry"]
+    with SessionLocal() as db:
+        rows = db.query(PendingUpload).all()
+        assert {r.attempts for r in rows} == {1}
+        assert all(r.next_attempt_at > datetime.utcnow() for r in rows)
+        assert "S3 unreachable" in rows[0].last_error
+    assert uploader.sweep() == []  # not due yet
+
+    # recovery, e.g. after a restart: due rows are picked up by the sweep
+    monkeypatch.setattr(s3_uploader, "_put_file", real_put)
+    with SessionLocal() as db:
+        db.query(PendingUpload).update(
+            {"next_attempt_at": datetime.utcnow() - timedelta(seconds=1)}
+        )
+        db.commit()
+    done, _ = wait(uploader.sweep())
+    assert sorted(f.result() for f in done) == ["done", "done"]
+    assert _refs(body["prediction_uid"])[1] == body["s3"]["predicted_key"]
+    client.delete(f"/prediction/{body['prediction_uid']}", auth=AUTH)
+
+
+def test_delete_before_or_during_upload_leaves_nothing_behind(s3_mode, monkeypatch):
+    # deleted before the upload ran: the staged files are gone, rows dropped
+    first = _predict(png_bytes())
+    client.delete(f"/prediction/{first['prediction_uid']}", auth=AUTH)
+    uploader = s3_uploader.S3Uploader(workers=2)
+    assert [uploader.upload_one(i) for i in s3_mode.ids] == ["dropped", "dropped"]
+
+    # deleted while uploading: the object written meanwhile is removed
+    s3_mode.ids.clear()
+    second = _predict(png_bytes())
+    real_put = s3_uploader._put_file
+
+    def _put_then_delete(local_path, key):
+        real_put(local_path, key)
+        client.delete(f"/prediction/{second['prediction_uid']}", auth=AUTH)
+
+    monkeypatch.setattr(s3_uploader, "_put_file", _put_then_delete)
+    predicted_id = s3_mode.ids[1]
+    assert uploader.upload_one(predicted_id) == "done"
+    with pytest.raises(Exception):
+        _object(second["s3"]["predicted_key"])
+
+
+def test_one_worker_owns_each_upload(s3_mode, monkeypatch):
+    body = _predict(png_bytes())
+    original_id, predicted_id = s3_mode.ids
+    other = s3_uploader.S3Uploader(workers=1)
+    with SessionLocal() as db:
+        assert queries.claim_pending_upload(db, original_id, datetime.utcnow(), 60)
+        db.commit()
+    # held by another worker: nothing is uploaded here
+    assert s3_uploader.S3Uploader(workers=1).upload_one(original_id) == "gone"
+    with pytest.raises(Exception):
+        _object(body["s3"]["original_key"])
+
+    # the lease ran out mid-upload and the other worker finished first
+    real_put = s3_uploader._put_file
+
+    def _slow_put(local_path, key):
+        real_put(local_path, key)
+        with SessionLocal() as db:
+            db.query(PendingUpload).filter_by(id=predicted_id).update(
+                {"next_attempt_at": datetime.utcnow() - timedelta(seconds=1)}
+            )
+            db.commit()
+        monkeypatch.setattr(s3_uploader, "_put_file", real_put)
+        assert other.upload_one(predicted_id) == "done"
+
+    monkeypatch.setattr(s3_uploader, "_put_file", _slow_put)
+    assert s3_uploader.S3Uploader(workers=1).upload_one(predicted_id) == "gone"
+    # the loser leaves the winner's object in place
+    assert _refs(body["prediction_uid"])[1] == body["s3"]["predicted_key"]
+    assert _object(body["s3"]["predicted_key"])
+    client.delete(f"/prediction/{body['prediction_uid']}", auth=AUTH)
+
+
+def test_prediction_is_not_immutable_until_its_refs_are_final(s3_mode):
+    body = _predict(png_bytes())
+    url = f"/prediction/{body['prediction_uid']}"
+    pending = client.get(url, auth=AUTH)
+    assert pending.headers["cache-control"] == "private, no-cache"
+    etag = pending.headers["etag"]
+    again = client.get(url, headers={"If-None-Match": etag}, auth=AUTH)
+    assert again.status_code == 304
+    assert again.headers["cache-control"] == "private, no-cache"
+
+    uploader = s3_uploader.S3Uploader(workers=2)
+    assert [uploader.upload_one(i) for i in s3_mode.ids] == ["done", "done"]
+    # the stale copy no longer validates: the client gets the S3 keys
+    done = client.get(url, headers={"If-None-Match": etag}, auth=AUTH)
+    assert done.status_code == 200
+    assert done.json()["predicted_image"] == body["s3"]["predicted_key"]
+    assert done.headers["etag"] != etag
+    assert "immutable" in done.headers["cache-control"]
+    final = client.get(url, headers={"If-None-Match": done.headers["etag"]}, auth=AUTH)
+    assert final.status_code == 304 and "immutable" in final.headers["cache-control"]
+    client.delete(url, auth=AUTH)
@@ -0,0 +1,185 @@
+# tests/test_search.py
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import queries
+from app import app
+from db import SessionLocal
+from models import (
+    DetectionObject,
+    LabelDailyRollup,
+    PredictionDailyRollup,
+    PredictionSession,
+    SessionLabel,
+    User,
+)
+from services.search_service import parse_query
+
+client = TestClient(app)
+AUTH = ("searcher", "searchpw")
+
+SESSIONS = {
+    "srch-1": [("person", 0.9, "[]"), ("dog", 0.4, "[]")],
+    "srch-2": [("person", 0.6, "[]"), ("dog", 0.8, "[]"), ("car", 0.7, "[]")],
+    "srch-3": [("person", 0.3, "[]"), ("person", 0.95, "[]"), ("person", 0.5, "[]")],
+    "srch-4": [("cat", 0.5, "[]"), ("traffic light", 0.6, "[]")],
+}
+
+
+def _wipe():
+    with SessionLocal() as db:
+        uids = list(SESSIONS)
+        db.query(SessionLabel).filter(SessionLabel.uid.in_(uids)).delete()
+        db.query(DetectionObject).filter(
+            DetectionObject.prediction_uid.in_(uids)
+        ).delete()
+        db.query(PredictionSession).filter(PredictionSession.uid.in_(uids)).delete()
+        db.query(LabelDailyRollup).filter_by(username="searcher").delete()
+        db.query(PredictionDailyRollup).filter_by(username="searcher").delete()
+        db.commit()
+
+
+@pytest.fixture(autouse=True)
+def _seed(monkeypatch):
+    import services.search_service as ss
+
+    class _FakeModel:
+        names = {0: "person", 1: "dog", 2: "car", 3: "cat", 4: "traffic light"}
+
+    monkeypatch.setattr(ss, "model", _FakeModel())
+    _wipe()
+    with SessionLocal() as db:
+        if not db.query(User).filter_by(username="searcher").first():
+            db.add(User(username="searcher", password="searchpw"))
+            db.commit()
+        for uid, detections in SESSIONS.items():
+            queries.save_prediction(db, uid, "", "", "searcher", detections)
+    yield
+    _wipe()
+
+
+def _search(**params):
+    response = client.get("/predictions/search", params=params, auth=AUTH)
+    assert response.status_code == 200, response.text
+    return sorted(item["uid"] for item in response.json())
+
+
+def test_parse_precedence_and_multiword_labels():
+    assert parse_query("a OR b AND NOT c") == (
+        "or",
+        [("label", "a"), ("and", [("label", "b"), ("not", ("label", "c"))])],
+    )
+    assert parse_query('(a OR "traffic light") and not b') == (
+        "and",
+        [("or", [("label", "a"), ("label", "traffic light")]), ("not", ("label", "b"))],
+    )
+    assert parse_query("traffic light AND cat") == (
+        "and",
+        [("label", "traffic light"), ("label", "cat")],
+    )
+
+
+@pytest.mark.parametrize("q", ["", "person AND", "(person", "person )", "NOT"])
+def test_parse_errors_are_400(q):
+    with pytest.raises(HTTPException) as err:
+        parse_query(q)
+    assert err.value.status_code == 400
+
+
+def test_boolean_expressions():
+    assert _search(q="person AND dog AND NOT car") == ["srch-1"]
+    assert _search(q="person AND dog") == ["srch-1", "srch-2"]
+    assert _search(q="car OR cat") == ["srch-2", "srch-4"]
+    assert _search(q="NOT person") == ["srch-4"]
+    assert _search(q="traffic light AND NOT (dog OR person)") == ["srch-4"]
+
+
+def test_per_label_min_score_and_count():
+    assert _search(q="person AND dog", min_score="dog:0.5") == ["srch-2"]
+    assert _search(q="person", min_count="person:2") == ["srch-3"]
+    # three persons but only two score >= 0.5
+    assert _search(q="person", min_count="person:3", min_score="person:0.5") == []
+    assert _search(q="person", min_count="person:2", min_score="person:0.5") == [
+        "srch-3"
+    ]
+    # a bare value applies to every label
+    assert _search(q="person OR cat", min_score="0.85") == ["srch-1", "srch-3"]
+
+
+def test_time_range():
+    now = datetime.utcnow()
+    assert _search(q="person", since=(now + timedelta(hours=1)).isoformat()) == []
+    assert _search(q="person", until=(now - timedelta(hours=1)).isoformat()) == []
+    assert len(_search(q="person", since=(now - timedelta(hours=1)).isoformat())) == 3
+
+
+def test_time_range_with_offset():
+    # read as local +05:00 the bound would be hours in the future
+    plus5 = timezone(timedelta(hours=5))
+    since = (datetime.now(timezone.utc) - timedelta(minutes=30)).astimezone(plus5)
+    assert len(_search(q="person", since=since.isoformat())) == 3
+
+
+def test_cursor_pages_through_all_matches():
+    seen, cursor = [], None
+    while True:
+        params = {"q": "person OR cat", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/predictions/search", params=params, auth=AUTH)
+        assert response.status_code == 200
+        seen += [item["uid"] for item in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert sorted(seen) == sorted(SESSIONS)
+    assert len(seen) == len(set(seen))
+
+
+def test_items_carry_labels():
+    response = client.get("/predictions/search", params={"q": "car"}, auth=AUTH).json()
+    assert response[0]["uid"] == "srch-2"
+    assert response[0]["labels"] == ["car", "dog", "person"]
+
+
+def test_unknown_label_and_bad_threshold():
+    response = client.get("/predictions/search", params={"q": "unicorn"}, auth=AUTH)
+    assert response.status_code == 404
+    response = client.get(
+        "/predictions/search",
+        params={"q": "person", "min_score": "person:2"},
+        auth=AUTH,
+    )
+    assert response.status_code == 400
+    response = client.get(
+        "/predictions/search",
+        params={"q": "person", "min_count": "person:x"},
+        auth=AUTH,
+    )
+    assert response.status_code == 400
+
+
+def test_delete_removes_postings():
+    with SessionLocal() as db:
+        queries.delete_sessions(db, ["srch-2"])
+        db.commit()
+        assert db.query(SessionLabel).filter_by(uid="srch-2").count() == 0
+    assert _search(q="person AND dog") == ["srch-1"]
+
+
+def test_rebuild_session_labels_matches_write_path():
+    with SessionLocal() as db:
+        before = {
+            (r.uid, r.label, r.detection_count, r.max_score)
+            for r in db.query(SessionLabel).filter(SessionLabel.uid.in_(SESSIONS))
+        }
+        queries.rebuild_session_labels(db, batch_size=3)
+        after = {
+            (r.uid, r.label, r.detection_count, r.max_score)
+            for r in db.query(SessionLabel).filter(SessionLabel.uid.in_(SESSIONS))
+        }
+    assert before == after
+    assert ("srch-3", "person", 3, 0.95) in after
@@ -0,0 +1,119 @@
+# tests/test_session_summary.py
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+import migrations
+import queries
+from db import SessionLocal
+from models import (
+    DetectionObject,
+    LabelDailyRollup,
+    PredictionDailyRollup,
+    PredictionSession,
+    SessionLabel,
+)
+
+
+@pytest.fixture(autouse=True)
+def _clean():
+    def wipe():
+        with SessionLocal() as db:
+            db.query(SessionLabel).filter(SessionLabel.uid.like("sum-%")).delete(
+                synchronize_session=False
+            )
+            db.query(DetectionObject).filter(
+                DetectionObject.prediction_uid.like("sum-%")
+            ).delete(synchronize_session=False)
+            db.query(PredictionSession).filter(
+                PredictionSession.uid.like("sum-%")
+            ).delete(synchronize_session=False)
+            db.query(LabelDailyRollup).filter_by(username="summary").delete()
+            db.query(PredictionDailyRollup).filter_by(username="summary").delete()
+            db.commit()
+
+    wipe()
+    yield
+    wipe()
+
+
+def test_save_prediction_writes_summary_columns():
+    with SessionLocal() as db:
+        queries.save_prediction(
+            db,
+            "sum-1",
+            "",
+            "",
+            None,
+            [("person", 0.4, "[]"), ("dog", 0.9, "[]"), ("person", 0.6, "[]")],
+        )
+        row = db.query(PredictionSession).filter_by(uid="sum-1").one()
+        assert row.detection_count == 3
+        assert row.max_score == 0.9
+        assert row.labels == ",dog,person,"
+
+
+def test_label_match_is_exact_not_substring():
+    assert queries.encode_label_set(["hot dog"]) == ",hot dog,"
+    with SessionLocal() as db:
+        queries.save_prediction(
+            db, "sum-2", "", "", "summary", [("hot dog", 0.5, "[]")]
+        )
+        assert queries.get_predictions_by_label(db, "dog", "summary") == []
+        assert [
+            r.uid for r in queries.get_predictions_by_label(db, "hot dog", "summary")
+        ] == ["sum-2"]
+
+
+def test_backfill_recomputes_from_detections():
+    with SessionLocal() as db:
+        db.add(PredictionSession(uid="sum-3", username=None))
+        db.add(DetectionObject(prediction_uid="sum-3", label="cat", score=0.7, box=""))
+        db.commit()
+        queries.backfill_session_summaries(db, batch_size=2)
+        row = db.query(PredictionSession).filter_by(uid="sum-3").one()
+        assert (row.detection_count, row.max_score, row.labels) == (1, 0.7, ",cat,")
+
+
+def test_migration_adds_columns_to_legacy_table(tmp_path):
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE prediction_sessions (uid VARCHAR PRIMARY KEY, "
+                "timestamp DATETIME, original_image VARCHAR, "
+                "predicted_image VARCHAR, username VARCHAR)"
+            )
+        )
+        conn.execute(text("INSERT INTO prediction_sessions (uid) VALUES ('old')"))
+    added = migrations.ensure_columns(legacy)
+    assert added["prediction_sessions"] == migrations.SUMMARY_COLUMNS | {
+        "owns_original"
+    }
+    columns = {c["name"] for c in inspect(legacy).get_columns("prediction_sessions")}
+    assert migrations.SUMMARY_COLUMNS <= columns
+    with legacy.connect() as conn:
+        # sessions from before the flag keep having their originals removed
+        owned = conn.execute(text("SELECT owns_original FROM prediction_sessions"))
+        assert owned.scalar_one() == 1
+    assert migrations.ensure_columns(legacy) == {}  # idempotent
+
+
+def test_migration_drops_superseded_indexes(tmp_path):
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE detection_objects (id INTEGER PRIMARY KEY, "
+                "prediction_uid VARCHAR, label VARCHAR, score FLOAT, box VARCHAR)"
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE INDEX ix_detection_objects_prediction_uid "
+                "ON detection_objects (prediction_uid)"
+            )
+        )
+    migrations.run_migrations(legacy)
+    names = {i["name"] for i in inspect(legacy).get_indexes("detection_objects")}
+    assert "ix_detection_objects_uid_label_score" in names
+    assert names.isdisjoint(migrations.SUPERSEDED_INDEXES)
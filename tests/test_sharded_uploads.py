@@ -0,0 +1,137 @@
+# tests/test_sharded_uploads.py
+import os
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import queries
+from app import app
+from db import SessionLocal
+from migrations import shard_uploads
+from models import ImageBlob, PredictionSession, User
+from services.storage import layouts, shard_path
+
+client = TestClient(app)
+AUTH = ("sharder", "shardpw")
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+
+
+@pytest.fixture(autouse=True)
+def _user():
+    with SessionLocal() as db:
+        if not db.query(User).filter_by(username="sharder").first():
+            db.add(User(username="sharder", password="shardpw"))
+            db.commit()
+
+
+@pytest.fixture
+def legacy():
+    """A session whose images sit at flat, pre-sharding paths."""
+    uid = uuid.uuid4().hex
+    original = os.path.join("uploads", "original", f"{uid}.png")
+    predicted = os.path.join("uploads", "predicted", f"{uid}.png")
+    for path in (original, predicted):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as fh:
+            fh.write(PNG)
+    with SessionLocal() as db:
+        queries.save_prediction(db, uid, original, predicted, "sharder", [])
+    yield uid, original, predicted
+    with SessionLocal() as db:
+        queries.delete_sessions(db, [uid])
+        db.commit()
+    for path in (original, predicted):
+        for spelling in layouts(path):
+            if os.path.exists(spelling):
+                os.remove(spelling)
+
+
+def _refs(uid):
+    with SessionLocal() as db:
+        return (
+            db.query(
+                PredictionSession.original_image, PredictionSession.predicted_image
+            )
+            .filter_by(uid=uid)
+            .one()
+        )
+
+
+def test_layout_helpers():
+    assert shard_path("uploads/original", "abcd1234.png") == os.path.join(
+        "uploads", "original", "ab", "cd", "abcd1234.png"
+    )
+    # names we didn't generate (not leading hex) stay flat
+    assert shard_path("uploads/original", "test_success.jpg") == os.path.join(
+        "uploads", "original", "test_success.jpg"
+    )
+    sharded = os.path.join("u", "ab", "cd", "abcd.png")
+    flat = os.path.join("u", "abcd.png")
+    assert layouts(flat) == (sharded, flat)
+    assert layouts(sharded) == (sharded, flat)
+
+
+def test_flat_refs_served_then_migrated(legacy):
+    uid, original, predicted = legacy
+    url = f"/image/predicted/{uid}.png"
+    before = client.get(url, auth=AUTH)
+    assert before.status_code == 200
+    image = client.get(
+        f"/prediction/{uid}/image", headers={"Accept": "image/png"}, auth=AUTH
+    )
+    assert image.status_code == 200
+
+    counts = shard_uploads()
+    assert counts["moved"] >= 2
+
+    new_original, new_predicted = _refs(uid)
+    assert new_original == layouts(original)[0]
+    assert new_predicted == layouts(predicted)[0]
+    assert os.path.exists(new_predicted) and not os.path.exists(predicted)
+    assert os.path.exists(new_original) and not os.path.exists(original)
+
+    after = client.get(url, auth=AUTH)
+    assert after.status_code == 200
+    assert after.content == PNG
+    # the tag is keyed on the URL, so clients keep their cached copy
+    assert after.headers["etag"] == before.headers["etag"]
+    assert client.get(f"/image/original/{uid}.png", auth=AUTH).status_code == 200
+    assert shard_uploads()["moved"] == 0
+
+
+def test_stale_flat_ref_falls_back_to_moved_file(legacy):
+    uid, _original, predicted = legacy
+    sharded = layouts(predicted)[0]
+    os.makedirs(os.path.dirname(sharded), exist_ok=True)
+    os.replace(predicted, sharded)  # moved on disk, DB not yet rewritten
+    response = client.get(
+        f"/prediction/{uid}/image", headers={"Accept": "image/png"}, auth=AUTH
+    )
+    assert response.status_code == 200
+
+
+def test_blob_refs_are_rewritten_with_all_their_sessions(tmp_path):
+    digest = uuid.uuid4().hex
+    flat = os.path.join("uploads", "original", f"{digest}.png")
+    with open(flat, "wb") as fh:
+        fh.write(PNG)
+    uids = [uuid.uuid4().hex for _ in range(2)]
+    with SessionLocal() as db:
+        for uid in uids:
+            queries.acquire_blob(db, digest, flat, len(PNG))
+            queries.save_prediction(db, uid, flat, "", "sharder", [])
+    try:
+        shard_uploads(batch_size=1)
+        sharded = layouts(flat)[0]
+        assert [_refs(uid)[0] for uid in uids] == [sharded, sharded]
+        with SessionLocal() as db:
+            assert db.get(ImageBlob, digest).ref == sharded
+        assert os.path.exists(sharded) and not os.path.exists(flat)
+    finally:
+        with SessionLocal() as db:
+            queries.delete_sessions(db, uids)
+            freed, _ = queries.release_blobs(db, [layouts(flat)[0]] * 2)
+            db.commit()
+        assert freed == [layouts(flat)[0]]
+        os.remove(freed[0])
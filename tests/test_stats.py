@@ -10,11 +10,11 @@ class TestStatsEndpoint(unittest.TestCase):
         self.username = "alice"
         self.password = "pass123"
 
-    @patch("services.stats_service.get_detection_objects_for_recent_predictions")
+    @patch("services.stats_service.get_label_rollups")
     @patch("services.stats_service.count_recent_predictions")
-    def test_stats_empty(self, mock_count, mock_objects):
+    def test_stats_empty(self, mock_count, mock_rollups):
         mock_count.return_value = 0
-        mock_objects.return_value = []
+        mock_rollups.return_value = []
 
         response = self.client.get("/stats", auth=(self.username, self.password))
         self.assertEqual(response.status_code, 200)
@@ -23,16 +23,15 @@ class TestStatsEndpoint(unittest.TestCase):
         self.assertEqual(stats["average_confidence_score"], 0.0)
         self.assertEqual(stats["most_common_labels"], {})
 
-    @patch("services.stats_service.get_detection_objects_for_recent_predictions")
+    @patch("services.stats_service.get_label_rollups")
     @patch("services.stats_service.count_recent_predictions")
-    def test_stats_with_recent_data(self, mock_count, mock_objects):
+    def test_stats_with_recent_data(self, mock_count, mock_rollups):
         mock_count.return_value = 1
 
-        # Simulate 3 detections: person (2), dog (1)
-        mock_objects.return_value = [
-            Mock(score=0.9, label="person"),
-            Mock(score=0.8, label="dog"),
-            Mock(score=1.0, label="person"),
+        # Simulate 3 detections rolled up per label: person (2), dog (1)
+        mock_rollups.return_value = [
+            Mock(label="person", detection_count=2, score_sum=0.9 + 1.0),
+            Mock(label="dog", detection_count=1, score_sum=0.8),
         ]
 
         response = self.client.get("/stats", auth=(self.username, self.password))
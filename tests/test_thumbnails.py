@@ -0,0 +1,198 @@
+# tests/test_thumbnails.py
+import io
+import os
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import queries
+from app import app
+from db import SessionLocal
+from models import User
+from services import image_service, thumbnails
+
+client = TestClient(app)
+AUTH = ("thumber", "thumbpw")
+UID = "thumb-1"
+ORIGINAL = os.path.join("uploads", "original", f"{UID}.png")
+PREDICTED = os.path.join("uploads", "predicted", f"{UID}.png")
+
+
+def _write_png(path, size=(400, 200)):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new("RGB", size, (200, 30, 30)).save(path, format="PNG")
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    c = thumbnails.DerivativeCache(root=str(tmp_path / "derived"), max_bytes=10**9)
+    monkeypatch.setattr(image_service, "derivative_cache", c)
+    return c
+
+
+@pytest.fixture
+def seeded(cache):
+    with SessionLocal() as db:
+        if not db.query(User).filter_by(username="thumber").first():
+            db.add(User(username="thumber", password="thumbpw"))
+        queries.delete_sessions(db, [UID])
+        db.commit()
+        queries.save_prediction(db, UID, ORIGINAL, PREDICTED, "thumber", [])
+    _write_png(ORIGINAL)
+    _write_png(PREDICTED)
+    yield
+    with SessionLocal() as db:
+        queries.delete_sessions(db, [UID])
+        db.commit()
+    for path in (ORIGINAL, PREDICTED):
+        os.remove(path)
+
+
+def test_render_once_then_hit(cache, tmp_path):
+    src = str(tmp_path / "src.png")
+    _write_png(src)
+    first = cache.get_or_create(src, w=100)
+    assert cache.get_or_create(src, w=100) == first
+    with Image.open(first) as im:
+        assert im.size == (100, 50)  # aspect ratio kept
+    assert cache.get_or_create(src, w=1000) != first
+    with Image.open(cache.get_or_create(src, w=1000)) as im:
+        assert im.size == (400, 200)  # never upscaled
+
+
+def test_content_addressed_sources_keep_derivatives_across_touches(cache, tmp_path):
+    blob = str(tmp_path / "ab" / "cd" / f"{'ab' * 32}.png")
+    plain = str(tmp_path / "plain.png")
+    for path in (blob, plain):
+        _write_png(path)
+    first = [cache.get_or_create(p, w=100) for p in (blob, plain)]
+    later = time.time() + 60
+    for path in (blob, plain):
+        os.utime(path, (later, later))  # e.g. blob_store on a dedup hit
+    assert cache.get_or_create(blob, w=100) == first[0]
+    assert cache.get_or_create(plain, w=100) != first[1]
+
+
+def test_lru_eviction_under_byte_cap(tmp_path):
+    src = str(tmp_path / "src.png")
+    _write_png(src)
+    probe = thumbnails.DerivativeCache(root=str(tmp_path / "probe"))
+    size = os.path.getsize(probe.get_or_create(src, w=64, fmt="jpeg", quality=50))
+
+    cache = thumbnails.DerivativeCache(
+        root=str(tmp_path / "d"), max_bytes=int(size * 2.5)
+    )
+    a = cache.get_or_create(src, w=64, fmt="jpeg", quality=50)
+    b = cache.get_or_create(src, w=65, fmt="jpeg", quality=50)
+    cache.get_or_create(src, w=64, fmt="jpeg", quality=50)  # a is now recent
+    c = cache.get_or_create(src, w=63, fmt="jpeg", quality=50)
+    assert os.path.exists(a) and os.path.exists(c)
+    assert not os.path.exists(b)
+
+    # a fresh instance rebuilds its index from the directory
+    reopened = thumbnails.DerivativeCache(root=str(tmp_path / "d"), max_bytes=10**9)
+    reopened._load()
+    assert set(reopened._index) == {os.path.basename(a), os.path.basename(c)}
+
+
+def test_concurrent_requests_render_once(cache, tmp_path, monkeypatch):
+    src = str(tmp_path / "src.png")
+    _write_png(src)
+    calls = []
+    real_render = thumbnails.render
+
+    def slow_render(*args):
+        calls.append(1)
+        time.sleep(0.2)
+        real_render(*args)
+
+    monkeypatch.setattr(thumbnails, "render", slow_render)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_create(src, w=50)))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert len(set(results)) == 1 and len(results) == 8
+    assert not [n for n in os.listdir(cache.root) if ".tmp-" in n]
+
+
+def test_image_endpoint_serves_derivative(seeded):
+    full = client.get(f"/image/original/{UID}.png", auth=AUTH)
+    thumb = client.get(
+        f"/image/original/{UID}.png", params={"w": 50, "format": "webp"}, auth=AUTH
+    )
+    assert thumb.status_code == 200
+    assert thumb.headers["content-type"] == "image/webp"
+    assert thumb.headers["etag"] != full.headers["etag"]
+    with Image.open(io.BytesIO(thumb.content)) as im:
+        assert im.format == "WEBP" and im.size == (50, 25)
+
+    again = client.get(
+        f"/image/original/{UID}.png",
+        params={"w": 50, "format": "webp"},
+        headers={"If-None-Match": thumb.headers["etag"]},
+        auth=AUTH,
+    )
+    assert again.status_code == 304
+
+
+def test_prediction_image_derivative_follows_accept(seeded):
+    response = client.get(
+        f"/prediction/{UID}/image",
+        params={"h": 40},
+        headers={"Accept": "image/jpeg"},
+        auth=AUTH,
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    with Image.open(io.BytesIO(response.content)) as im:
+        assert im.format == "JPEG" and im.size == (80, 40)
+
+
+@pytest.mark.parametrize(
+    "params", [{"w": 0}, {"h": 99999}, {"format": "gif"}, {"quality": 101}]
+)
+def test_invalid_parameters_are_rejected(seeded, params):
+    response = client.get(f"/image/original/{UID}.png", params=params, auth=AUTH)
+    assert response.status_code == 422
+
+
+def test_single_dimension_requests_use_jpeg_scaled_decode(tmp_path, monkeypatch):
+    assert thumbnails.draft_box((4000, 3000), 200, None) == (200, 150)
+    assert thumbnails.draft_box((4000, 3000), None, 300) == (400, 300)
+    assert thumbnails.draft_box((100, 50), 400, None) == (100, 50)  # no upscale
+    # rotated 90 degrees by EXIF: w applies to the stored height
+    assert thumbnails.draft_box((4000, 3000), 150, None, orientation=6) == (200, 150)
+
+    decoded = []
+    real_thumbnail = Image.Image.thumbnail
+
+    def _spy(self, *args, **kwargs):
+        decoded.append(self.size)
+        return real_thumbnail(self, *args, **kwargs)
+
+    monkeypatch.setattr(Image.Image, "thumbnail", _spy)
+    plain, rotated = tmp_path / "plain.jpg", tmp_path / "rotated.jpg"
+    Image.new("RGB", (4000, 3000), (20, 90, 160)).save(plain, format="JPEG")
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 CW to display
+    Image.new("RGB", (4000, 3000), (20, 90, 160)).save(
+        rotated, format="JPEG", exif=exif
+    )
+
+    out = str(tmp_path / "out.jpg")
+    thumbnails.render(str(plain), out, 200, None, "jpeg", 85)
+    assert decoded[-1] == (500, 375)  # decoded at 1/8 scale
+    assert Image.open(out).size == (200, 150)
+
+    thumbnails.render(str(rotated), out, 150, None, "jpeg", 85)
+    assert decoded[-1] == (375, 500)  # 1/8 scale, then turned upright
+    assert Image.open(out).size == (150, 200)
@@ -0,0 +1,122 @@
+# tests/test_upload_buffer.py
+import io
+import tempfile
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from PIL import Image
+from starlette.datastructures import UploadFile
+
+import services.predict_service as ps
+from app import app
+from db import SessionLocal
+from models import User
+
+client = TestClient(app)
+AUTH = ("buffered", "bufferpw")
+
+
+def _upload(data: bytes, size="exact") -> UploadFile:
+    return UploadFile(
+        io.BytesIO(data), size=len(data) if size == "exact" else size, filename="x"
+    )
+
+
+class _SpooledWithoutReadinto(tempfile.SpooledTemporaryFile):
+    """SpooledTemporaryFile as on Python 3.10 (the Docker image): no readinto."""
+
+    def __getattribute__(self, name):
+        if name == "readinto":
+            raise AttributeError(name)
+        return super().__getattribute__(name)
+
+
+def _spooled(data: bytes, cls=tempfile.SpooledTemporaryFile, max_size=64):
+    fh = cls(max_size=max_size)
+    fh.write(data)
+    fh.seek(0)
+    return UploadFile(fh, size=len(data), filename="x")
+
+
+class _ModelSpy:
+    """Records what /predict hands to YOLO, then runs the real model."""
+
+    def __init__(self, model):
+        self.model = model
+        self.names = model.names
+        self.sources = []
+
+    def __call__(self, source, **kwargs):
+        self.sources.append(source)
+        return self.model(source, **kwargs)
+
+
+@pytest.fixture
+def small_cap(monkeypatch):
+    monkeypatch.setattr(ps, "MAX_BYTES", 100)
+    monkeypatch.setattr(ps, "CHUNK", 7)  # several reads per upload
+
+
+def test_upload_is_read_into_one_exactly_sized_buffer(small_cap):
+    data = bytes(range(100))
+    view = ps._read_upload_with_cap(_upload(data))
+    assert isinstance(view, memoryview) and view == data
+    assert len(view.obj) == len(data) + 1  # allocated once, never grown
+
+    # length unknown or understated: still read in full, cap still holds
+    assert ps._read_upload_with_cap(_upload(data, size=None)) == data
+    assert ps._read_upload_with_cap(_upload(data, size=10)) == data
+    assert ps._read_upload_with_cap(_upload(b"")) == b""
+
+
+def test_spooled_uploads_in_memory_on_disk_and_without_readinto(small_cap):
+    data = bytes(range(90))
+    for cls in (tempfile.SpooledTemporaryFile, _SpooledWithoutReadinto):
+        # rolled over to a real temp file, and still in memory
+        for max_size in (10, 1000):
+            upload = _spooled(data, cls, max_size)
+            assert ps._read_upload_with_cap(upload) == data
+            upload.file.close()
+    # size unknown: the cap still holds on the read() fallback
+    oversized = UploadFile(_spooled(b"x" * 101, _SpooledWithoutReadinto).file)
+    with pytest.raises(HTTPException) as err:
+        ps._read_upload_with_cap(oversized)
+    assert err.value.status_code == 413
+
+
+def test_cap_is_enforced_while_streaming(small_cap):
+    data = b"x" * 101
+    upload = _upload(data)
+    with pytest.raises(HTTPException) as err:
+        ps._read_upload_with_cap(upload)
+    assert err.value.status_code == 413
+    assert upload.file.tell() == 0  # declared too large: nothing read
+
+    for size in (None, 50):
+        upload = _upload(data, size=size)
+        with pytest.raises(HTTPException) as err:
+            ps._read_upload_with_cap(upload)
+        assert err.value.status_code == 413
+        assert upload.file.tell() == 101  # stopped one byte past the cap
+
+
+def test_predict_stages_nothing_on_disk(monkeypatch, tmp_path):
+    with SessionLocal() as db:
+        if not db.query(User).filter_by(username="buffered").first():
+            db.add(User(username="buffered", password="bufferpw"))
+            db.commit()
+    monkeypatch.setattr(ps, "UPLOAD_DIR", str(tmp_path / "original"))
+    monkeypatch.setattr(ps, "PREDICTED_DIR", str(tmp_path / "predicted"))
+    spy = _ModelSpy(ps.model)
+    monkeypatch.setattr(ps, "model", spy)
+    buf = io.BytesIO()
+    Image.new("RGB", (16, 8), (0, 90, 180)).save(buf, format="PNG")
+
+    response = client.post(
+        "/predict", files={"file": ("x.png", buf.getvalue(), "image/png")}, auth=AUTH
+    )
+    assert response.status_code == 200
+    # decoded in memory: YOLO got a BGR array, not a temp file path
+    assert spy.sources[0].shape == (8, 16, 3)
+    assert tuple(spy.sources[0][0, 0]) == (180, 90, 0)
@@ -1,5 +1,7 @@
 # tests/test_validators.py
 import io
+from datetime import datetime, timedelta, timezone
+
 import pytest
 from fastapi import HTTPException
 from starlette.datastructures import UploadFile as StarletteUploadFile, Headers
@@ -9,6 +11,7 @@ from services.validators import (
     sanitize_filename,
     validate_mime_and_ext,
     sniff_image_or_415,
+    as_naive_utc,
 )
 
 
@@ -64,3 +67,11 @@ def test_sniff_image_or_415_invalid_bytes():
     with pytest.raises(HTTPException) as ex:
         sniff_image_or_415(b"not an image at all")
     assert ex.value.status_code == 415
+
+
+def test_as_naive_utc():
+    naive = datetime(2024, 1, 1, 12, 0)
+    assert as_naive_utc(None) is None
+    assert as_naive_utc(naive) is naive
+    shifted = datetime(2024, 1, 1, 17, 0, tzinfo=timezone(timedelta(hours=5)))
+    assert as_naive_utc(shifted) == naive